@@ -6,8 +6,9 @@
 import asyncio
 import json
 import os
+import time
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from telethon import TelegramClient
 from telethon.sessions import StringSession
 import qrcode
@@ -15,12 +16,25 @@ from io import BytesIO
 import base64
 
 from security import decrypt_session, encrypt_session, mask_phone
+from circuit_breaker import CircuitBreaker
+from pagination import paginate
+import metrics
 
 
 API_ID = int(os.getenv("TELEGRAM_API_ID", "2040"))
 API_HASH = os.getenv("TELEGRAM_API_HASH", "b18441a1ff607e10a989891a5462e627")
 ACCOUNTS_DIR = "./accounts"
 CONFIG_FILE = os.path.join(ACCOUNTS_DIR, "config.json")
+CONNECT_TIMEOUT = float(os.getenv("TELEGRAM_MCP_CONNECT_TIMEOUT", "15"))  # 单次连接超时（秒）
+# 依次尝试所有候选代理的总超时（秒），需小于健康检查和批量任务的单账号超时（30 秒）
+CONNECT_TOTAL_TIMEOUT = float(os.getenv("TELEGRAM_MCP_CONNECT_TOTAL_TIMEOUT", "25"))
+
+# 列表排序方式: {名称: (排序键, 是否倒序)}，排序键作用于 (account_id, 账号配置)，末尾带ID保证唯一
+ACCOUNT_SORTS = {
+    "account_id": (lambda pair: (pair[0],), False),
+    "use_count": (lambda pair: (pair[1].get("use_count", 0), pair[0]), True),
+    "last_online": (lambda pair: (pair[1].get("last_online") or "", pair[0]), True),
+}
 
 
 class AccountManager:
@@ -29,10 +43,42 @@ class AccountManager:
     def __init__(self):
         self.accounts: Dict[str, Dict] = {}
         self.clients: Dict[str, TelegramClient] = {}
+        self.client_proxies: Dict[str, str] = {}  # 账号当前连接使用的代理ID {account_id: proxy_id}
+        self.breakers: Dict[str, CircuitBreaker] = {}  # 每个账号的连接熔断器
+        self.version = 0  # 配置版本号，每次保存时递增（用于快照缓存）
+        self._breaker_listeners: List = []  # 熔断状态变化监听 callback(account_id, old_state, new_state)
         self.qr_sessions: Dict[str, Dict] = {}  # QR登录会话
         self.phone_sessions: Dict[str, Dict] = {}  # 手机号登录会话
         self._load_config()
         self._ensure_dir()
+        metrics.connected_clients.set_function(
+            lambda: sum(1 for account_id in self.clients if self._check_account_status(account_id))
+        )
+
+    def get_breaker(self, account_id: str) -> CircuitBreaker:
+        """获取账号的熔断器"""
+        breaker = self.breakers.get(account_id)
+        if breaker is None:
+            breaker = CircuitBreaker(account_id, on_state_change=self._notify_breaker_change)
+            self.breakers[account_id] = breaker
+        return breaker
+
+    def add_breaker_listener(self, callback):
+        """注册熔断状态变化监听"""
+        self._breaker_listeners.append(callback)
+
+    def _notify_breaker_change(self, account_id: str, old_state: str, new_state: str):
+        for callback in self._breaker_listeners:
+            try:
+                callback(account_id, old_state, new_state)
+            except Exception as e:
+                print(f"熔断状态回调错误: {e}")
+
+    def _reset_breaker(self, account_id: str):
+        """账号 Session 更新后重置熔断器"""
+        breaker = self.breakers.get(account_id)
+        if breaker:
+            breaker.record_success()
 
     def _ensure_dir(self):
         """确保目录存在"""
@@ -55,6 +101,7 @@ class AccountManager:
 
     def _save_config(self):
         """保存账号配置"""
+        self.version += 1
         self._ensure_dir()
         with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
             json.dump(self.accounts, f, ensure_ascii=False, indent=2)
@@ -73,24 +120,102 @@ class AccountManager:
             - last_online: 上次在线时间
             - use_count: 使用次数
         """
-        result = []
-        for account_id, account in self.accounts.items():
-            # 检查实时状态
-            is_online = self._check_account_status(account_id)
+        return [self._account_summary(account_id, account) for account_id, account in self.accounts.items()]
 
-            result.append({
-                "account_id": account_id,
-                "username": account.get("username", "N/A"),
-                "user_id": account.get("user_id", "N/A"),
-                "phone": mask_phone(account.get("phone", "N/A")),
-                "first_name": account.get("first_name", ""),
-                "last_name": account.get("last_name", ""),
-                "is_premium": account.get("is_premium", False),
-                "status": "online" if is_online else "offline",
-                "last_online": account.get("last_online", "N/A"),
-                "use_count": account.get("use_count", 0)
-            })
-        return result
+    def query_accounts(
+        self,
+        limit: int,
+        cursor: str = None,
+        status: str = None,
+        premium: bool = None,
+        keyword: str = None,
+        sort: str = "account_id"
+    ) -> Tuple[List[Dict], Optional[str], int]:
+        """
+        分页查询账号（只为本页账号生成列表信息）
+
+        Args:
+            limit: 每页条数
+            cursor: 上一页返回的游标
+            status: 筛选状态 (online/offline)
+            premium: 筛选是否会员
+            keyword: 账号ID、用户名或姓名包含的关键词
+            sort: 排序方式 (account_id, use_count, last_online)
+
+        Returns:
+            (本页账号, 下一页游标, 符合条件的总数)
+
+        Raises:
+            ValueError: 筛选条件、排序方式、游标或 limit 无效
+        """
+        if sort not in ACCOUNT_SORTS:
+            raise ValueError(f"不支持的排序方式: {sort}")
+        if status not in (None, "online", "offline"):
+            raise ValueError(f"不支持的状态: {status}")
+        sort_key, descending = ACCOUNT_SORTS[sort]
+
+        # 在线账号一定有客户端，按客户端表筛选，不用逐个检查全部账号
+        if status == "online":
+            account_ids = [account_id for account_id in self.clients if account_id in self.accounts and self.is_online(account_id)]
+        elif status == "offline":
+            online = {account_id for account_id in self.clients if self.is_online(account_id)}
+            account_ids = [account_id for account_id in self.accounts if account_id not in online]
+        else:
+            account_ids = list(self.accounts)
+
+        matched = [(account_id, self.accounts[account_id]) for account_id in account_ids]
+        if premium is not None:
+            matched = [(i, a) for i, a in matched if bool(a.get("is_premium", False)) == premium]
+        if keyword:
+            keyword_lower = keyword.lower()
+            matched = [
+                (i, a) for i, a in matched
+                if keyword_lower in i.lower() or any(
+                    keyword_lower in str(a.get(field) or "").lower()
+                    for field in ("username", "first_name", "last_name")
+                )
+            ]
+
+        page, next_cursor = paginate(matched, sort_key, limit, cursor, descending)
+        return [self._account_summary(account_id, account) for account_id, account in page], next_cursor, len(matched)
+
+    def get_account_summary(self, account_id: str) -> Optional[Dict]:
+        """获取单个账号的列表信息（字段同 list_accounts）"""
+        account = self.accounts.get(account_id)
+        if account is None:
+            return None
+        return self._account_summary(account_id, account)
+
+    def _account_summary(self, account_id: str, account: Dict) -> Dict:
+        # 检查实时状态
+        is_online = self._check_account_status(account_id)
+
+        return {
+            "account_id": account_id,
+            "username": account.get("username", "N/A"),
+            "user_id": account.get("user_id", "N/A"),
+            "phone": mask_phone(account.get("phone", "N/A")),
+            "first_name": account.get("first_name", ""),
+            "last_name": account.get("last_name", ""),
+            "is_premium": account.get("is_premium", False),
+            "status": "online" if is_online else "offline",
+            "last_online": account.get("last_online", "N/A"),
+            "use_count": account.get("use_count", 0)
+        }
+
+    def is_online(self, account_id: str) -> bool:
+        """账号是否在线（只看连接状态）"""
+        return self._check_account_status(account_id)
+
+    def get_state_version(self) -> tuple:
+        """
+        账号列表的状态版本：配置版本 + 当前在线的账号
+
+        客户端可能因网络断开而不经过 _save_config，所以在线集合也计入版本。
+        """
+        return (self.version, tuple(sorted(
+            account_id for account_id in self.clients if self._check_account_status(account_id)
+        )))
 
     def _check_account_status(self, account_id: str) -> bool:
         """
@@ -162,6 +287,7 @@ class AccountManager:
                 "last_online": datetime.now().isoformat(),
                 "use_count": 0
             }
+            self._reset_breaker(account_id)
             self._save_config()
             return True
         except Exception as e:
@@ -323,6 +449,7 @@ class AccountManager:
                 "last_online": datetime.now().isoformat(),
                 "use_count": 0
             }
+            self._reset_breaker(account_id)
             self._save_config()
             session["status"] = "success"
         except Exception as e:
@@ -451,6 +578,14 @@ class AccountManager:
                 pass
             del self.clients[account_id]
 
+        self.breakers.pop(account_id, None)
+
+        # 释放代理
+        from proxy_manager import proxy_manager
+        proxy_manager.release(self.client_proxies.pop(account_id, None))
+        for proxy_id in proxy_manager.get_account_proxies(account_id):
+            proxy_manager.unassign_proxy_from_account(account_id, proxy_id)
+
         # 删除账号
         del self.accounts[account_id]
         self._save_config()
@@ -466,6 +601,9 @@ class AccountManager:
 
         Returns:
             TelegramClient 实例
+
+        Raises:
+            CircuitOpenError: 账号连续连接失败已熔断
         """
         # 处理默认账号
         if account_id == "default":
@@ -487,32 +625,110 @@ class AccountManager:
                 self._update_use_count(account_id)
                 return client
 
-        # 如果没有指定代理，自动从 proxy_manager 获取
+        # 熔断中直接失败，不再等待连接超时
+        breaker = self.get_breaker(account_id)
+        breaker.before_call()
+        try:
+            client, proxy_id = await self._connect(account_id, proxy)
+        except asyncio.CancelledError:
+            # 调用方取消时不会走到 record_*，必须归还试探名额，否则熔断器一直卡在 half_open
+            breaker.release_probe()
+            raise
+        except Exception as e:
+            breaker.record_failure(str(e))
+            metrics.client_connects.inc(result="error")
+            metrics.record_error("connect", e)
+            raise
+        if client is None:
+            breaker.record_failure("未授权")
+            metrics.client_connects.inc(result="unauthorized")
+            return None
+        breaker.record_success()
+        metrics.client_connects.inc(result="success")
+
+        self.clients[account_id] = client
+        self._update_use_count(account_id)
+        self._update_online_status(account_id)
+
+        return client
+
+    async def _connect(self, account_id: str, proxy: Dict = None) -> Tuple[Optional[TelegramClient], Optional[str]]:
+        """
+        建立新连接（按候选代理依次尝试）
+
+        Returns:
+            (client, proxy_id)，Session 未授权时 client 为 None
+        """
+        from proxy_manager import AUTO_ASSIGN_PROXY, proxy_manager
+
+        # 连接已断开，释放原代理的在用计数
+        proxy_manager.release(self.client_proxies.pop(account_id, None))
+
+        # 如果没有指定代理，从 proxy_manager 获取候选代理，连接失败时依次故障转移
         if proxy is None:
-            from proxy_manager import proxy_manager
-            proxy = proxy_manager.get_proxy_for_account(account_id)
+            candidates = proxy_manager.get_proxy_candidates(account_id)
+        else:
+            candidates = [(None, proxy)]
 
         # 创建新连接
         account = self.accounts[account_id]
         session_string = decrypt_session(account["session_string"])
 
-        client = TelegramClient(
-            StringSession(session_string),
-            API_ID,
-            API_HASH,
-            proxy=proxy
-        )
-        await client.connect()
+        client = None
+        proxy_id = None
+        last_error = None
+        connected = False
+        deadline = time.monotonic() + CONNECT_TOTAL_TIMEOUT
+        for proxy_id, proxy_config in candidates:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                last_error = last_error or ConnectionError(f"连接超时 ({CONNECT_TOTAL_TIMEOUT:.0f}s)")
+                break
+            client = TelegramClient(
+                StringSession(session_string),
+                API_ID,
+                API_HASH,
+                proxy=proxy_config
+            )
+            start = time.perf_counter()
+            try:
+                timeout = min(CONNECT_TIMEOUT, remaining)
+                await asyncio.wait_for(client.connect(), timeout=timeout)
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    e = ConnectionError(f"连接超时 ({timeout:.0f}s)")
+                last_error = e
+                proxy_manager.record_result(proxy_id, False)
+                try:
+                    await client.disconnect()
+                except Exception:
+                    pass
+                continue
+            proxy_manager.record_result(proxy_id, True, (time.perf_counter() - start) * 1000)
+            connected = True
+            break
+        if not connected:
+            raise last_error
 
         if not await client.is_user_authorized():
             await client.disconnect()
-            return None
+            return None, proxy_id
 
-        self.clients[account_id] = client
-        self._update_use_count(account_id)
-        self._update_online_status(account_id)
+        # 故障转移不改动配置的分配，只在进程内记住连通的代理，下次连接优先尝试，原代理恢复后仍可用；
+        # 开启自动分配时，才把还没有分配代理的新账号绑定到实际连通的池代理
+        if proxy is None:
+            proxy_manager.set_preferred(account_id, proxy_id)
+            if (
+                AUTO_ASSIGN_PROXY and proxy_id and proxy_id != "global"
+                and not proxy_manager.get_account_proxies(account_id)
+            ):
+                proxy_manager.assign_proxy_to_account(account_id, proxy_id)
 
-        return client
+        proxy_manager.acquire(proxy_id)
+        if proxy_id:
+            self.client_proxies[account_id] = proxy_id
+
+        return client, proxy_id
 
     def _update_use_count(self, account_id: str):
         """更新使用次数"""
@@ -768,6 +984,7 @@ class AccountManager:
                 "last_online": datetime.now().isoformat(),
                 "use_count": 0
             }
+            self._reset_breaker(account_id)
             self._save_config()
             session["status"] = "success"
         except Exception as e:
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+备份存储模块
+按内容寻址的分块存储：消息记录切成分块，以未压缩内容的 SHA-256 命名并压缩保存（有 zstandard 时用 zstd，否则 gzip）。
+每次备份生成一个快照（分块哈希列表），内容没变的分块在快照之间共享，每天的备份只新增当天变化的部分。
+
+分块边界由消息ID决定（ID 的哈希满足条件处切分），与消息数量和位置无关：
+中间删除或修改一条消息只影响它所在的分块，后面的分块哈希不变。
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import tempfile
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+CHUNK_AVG_MESSAGES = 512  # 平均每个分块的消息数
+CHUNK_MAX_MESSAGES = 4096  # 单个分块最多消息数
+CODECS = ("zst", "gz")  # 分块文件扩展名，读取时按顺序查找
+NAME_PATTERN = re.compile(r"-?\w+")  # 快照名和快照ID只允许字母数字下划线（可带负号）
+
+
+def _compress(data: bytes) -> bytes:
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zst":
+        if zstandard is None:
+            raise ValueError("分块使用 zstd 压缩，需要安装 zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def _is_boundary(message_id: int) -> bool:
+    """分块边界：消息ID的哈希落在 1/CHUNK_AVG_MESSAGES 的区间内"""
+    return zlib.crc32(str(message_id).encode("ascii")) % CHUNK_AVG_MESSAGES == 0
+
+
+def _write_atomic(path: str, data: bytes):
+    # 临时文件名唯一：多个聊天在不同线程里可能同时写同一个分块
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class SnapshotWriter:
+    """
+    快照写入器
+
+    按消息ID升序逐条 add()，到达分块边界即写出分块；commit() 后快照才可见，
+    中途失败时已写出的分块会在下次写入相同内容时直接复用。
+    """
+
+    def __init__(self, store: "BackupStore", name: str, base: Optional[str] = None):
+        self.store = store
+        self.name = name
+        self.chunks: List[Dict[str, Any]] = []
+        self.count = 0
+        self.last_id = 0
+        self.new_chunks = 0
+        self.new_bytes = 0
+        self._pending: List[Dict[str, Any]] = []
+
+        if base:
+            snapshot = store.get_snapshot(name, base)
+            self.chunks = list(snapshot["chunks"])
+            # 最后一个分块没有到达边界时取出来，和新消息合并后重新切分；已经封口的分块保持不变
+            tail = self.chunks[-1] if self.chunks else None
+            if tail and not _is_boundary(tail["last_id"]) and tail["count"] < CHUNK_MAX_MESSAGES:
+                self.chunks.pop()
+                self._pending = list(store.read_chunk(tail["hash"]))
+            self.count = snapshot["count"] - len(self._pending)
+            self.last_id = snapshot["last_id"]
+
+    def add(self, record: Dict[str, Any]):
+        """
+        追加一条记录
+
+        Raises:
+            ValueError: 记录ID没有递增
+        """
+        if record["id"] <= self.last_id:
+            raise ValueError(f"记录ID必须递增: {record['id']} <= {self.last_id}")
+        self._pending.append(record)
+        self.last_id = record["id"]
+        if _is_boundary(record["id"]) or len(self._pending) >= CHUNK_MAX_MESSAGES:
+            self._flush()
+
+    def add_many(self, records: Iterable[Dict[str, Any]]):
+        """
+        追加多条记录（压缩、哈希和写盘都在这里完成，异步调用方应放到线程里执行）
+
+        Raises:
+            ValueError: 记录ID没有递增
+        """
+        for record in records:
+            self.add(record)
+
+    def _flush(self):
+        if not self._pending:
+            return
+        data = "".join(
+            json.dumps(record, ensure_ascii=False, sort_keys=True, separators=(",", ":")) + "\n"
+            for record in self._pending
+        ).encode("utf-8")
+        digest, stored = self.store.put_chunk(data)
+        if stored:
+            self.new_chunks += 1
+            self.new_bytes += stored
+        self.chunks.append({
+            "hash": digest,
+            "first_id": self._pending[0]["id"],
+            "last_id": self._pending[-1]["id"],
+            "count": len(self._pending)
+        })
+        self.count += len(self._pending)
+        self._pending = []
+
+    def commit(self, meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        写出剩余记录并保存快照
+
+        Args:
+            meta: 附加信息（如聊天标题），原样保存在快照中
+
+        Returns:
+            快照信息（不含分块列表），另附本次新写入的分块数和字节数
+        """
+        self._flush()
+        now = datetime.now()
+        snapshot = {
+            "id": now.strftime("%Y%m%dT%H%M%S%f"),
+            "name": self.name,
+            "created_at": now.isoformat(),
+            "count": self.count,
+            "last_id": self.last_id,
+            "meta": meta or {},
+            "chunks": self.chunks
+        }
+        path = self.store._snapshot_path(self.name, snapshot["id"])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_atomic(path, json.dumps(snapshot, ensure_ascii=False).encode("utf-8"))
+        return {
+            **self.store._summary(snapshot),
+            "new_chunks": self.new_chunks,
+            "new_bytes": self.new_bytes
+        }
+
+
+class BackupStore:
+    """内容寻址的备份存储"""
+
+    def __init__(self, root: str):
+        """
+        Args:
+            root: 存储目录（其下 chunks/ 保存分块，snapshots/<name>/ 保存快照）
+        """
+        self.root = root
+        self.chunk_dir = os.path.join(root, "chunks")
+        self.snapshot_dir = os.path.join(root, "snapshots")
+
+    def _chunk_path(self, digest: str, codec: str) -> str:
+        return os.path.join(self.chunk_dir, digest[:2], f"{digest}.{codec}")
+
+    def _snapshot_path(self, name: str, snapshot_id: str) -> str:
+        for part in (name, snapshot_id):
+            if not NAME_PATTERN.fullmatch(part):
+                raise ValueError(f"无效的快照名: {part}")
+        return os.path.join(self.snapshot_dir, name, f"{snapshot_id}.json")
+
+    @staticmethod
+    def _summary(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in snapshot.items() if key != "chunks"}
+
+    def has_chunk(self, digest: str) -> bool:
+        """分块是否已存在（任一压缩格式）"""
+        return any(os.path.exists(self._chunk_path(digest, codec)) for codec in CODECS)
+
+    def put_chunk(self, data: bytes) -> Tuple[str, int]:
+        """
+        保存分块（已存在则跳过）
+
+        Returns:
+            (SHA-256, 新写入的压缩后字节数，已存在时为 0)
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        if self.has_chunk(digest):
+            return digest, 0
+        compressed = _compress(data)
+        path = self._chunk_path(digest, "zst" if zstandard is not None else "gz")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_atomic(path, compressed)
+        return digest, len(compressed)
+
+    def get_chunk(self, digest: str) -> bytes:
+        """
+        读取分块原始内容并校验哈希
+
+        Raises:
+            ValueError: 分块不存在或内容损坏
+        """
+        for codec in CODECS:
+            path = self._chunk_path(digest, codec)
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    data = _decompress(f.read(), codec)
+                if hashlib.sha256(data).hexdigest() != digest:
+                    raise ValueError(f"分块已损坏: {digest}")
+                return data
+        raise ValueError(f"分块不存在: {digest}")
+
+    def read_chunk(self, digest: str) -> Iterator[Dict[str, Any]]:
+        """逐条读取分块中的记录"""
+        for line in self.get_chunk(digest).decode("utf-8").splitlines():
+            if line:
+                yield json.loads(line)
+
+    def open_snapshot(self, name: str, base: Optional[str] = None) -> SnapshotWriter:
+        """
+        开始写一个快照
+
+        Args:
+            name: 快照名（如聊天ID）
+            base: 在哪个快照的基础上追加（None 表示从头写）
+        """
+        return SnapshotWriter(self, name, base)
+
+    def list_snapshots(self, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        列出快照（按时间升序，不含分块列表）
+
+        Args:
+            name: 只列出该名称的快照，None 表示全部
+        """
+        if not os.path.isdir(self.snapshot_dir):
+            return []
+        names = [name] if name else sorted(os.listdir(self.snapshot_dir))
+        snapshots = []
+        for snapshot_name in names:
+            directory = os.path.dirname(self._snapshot_path(snapshot_name, "latest"))
+            if not os.path.isdir(directory):
+                continue
+            for filename in sorted(os.listdir(directory)):
+                if filename.endswith(".json"):
+                    snapshots.append(self._summary(self.get_snapshot(snapshot_name, filename[:-5])))
+        return snapshots
+
+    def get_snapshot(self, name: str, snapshot_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        读取快照（含分块列表）
+
+        Args:
+            name: 快照名
+            snapshot_id: 快照ID，None 表示最新的
+
+        Raises:
+            ValueError: 快照不存在
+        """
+        if snapshot_id is None:
+            directory = os.path.dirname(self._snapshot_path(name, "latest"))
+            ids = sorted(f[:-5] for f in os.listdir(directory) if f.endswith(".json")) if os.path.isdir(directory) else []
+            if not ids:
+                raise ValueError(f"没有 {name} 的快照")
+            snapshot_id = ids[-1]
+        path = self._snapshot_path(name, snapshot_id)
+        if not os.path.exists(path):
+            raise ValueError(f"快照不存在: {name}/{snapshot_id}")
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def read_snapshot(self, name: str, snapshot_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """按ID升序逐条读取快照中的记录"""
+        for chunk in self.get_snapshot(name, snapshot_id)["chunks"]:
+            yield from self.read_chunk(chunk["hash"])
+
+    def restore(self, name: str, output: str, snapshot_id: Optional[str] = None) -> int:
+        """
+        把快照还原为 JSONL 文件
+
+        Returns:
+            写入的记录数
+        """
+        written = 0
+        with open(output, "w", encoding="utf-8") as f:
+            for record in self.read_snapshot(name, snapshot_id):
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                written += 1
+        return written
@@ -4,7 +4,7 @@
 支持批量发送消息、批量操作账号等
 """
 import asyncio
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional
 from datetime import datetime
 
 # 导入管理模块
@@ -13,26 +13,131 @@ from template_manager import template_manager
 from log_manager import log_manager
 from health_monitor import health_monitor
 from stats_tracker import stats_tracker
+from concurrency import gather_bounded
+import metrics
 
 
 class BatchOperations:
     """批量操作器"""
 
-    def __init__(self, default_delay: float = 2.0):
+    def __init__(
+        self,
+        default_delay: float = 2.0,
+        concurrency: int = 10,
+        account_timeout: float = 30.0,
+        jitter: float = 0.5
+    ):
         """
         初始化批量操作器
 
         Args:
             default_delay: 默认操作间隔（秒），防止频繁操作被封号
+            concurrency: 并发批量操作（健康检查、获取对话、模板分发）的并发数
+            account_timeout: 单个账号的超时时间（秒）
+            jitter: 并发任务的启动抖动（秒）
         """
         self.default_delay = default_delay
+        self.concurrency = concurrency
+        self.account_timeout = account_timeout
+        self.jitter = jitter
+
+    @staticmethod
+    def _report_progress(progress_callback: Optional[Callable], done: int, total: int, item: Dict = None):
+        """上报进度（后台任务使用）"""
+        if progress_callback:
+            progress_callback(done, total, item)
+
+    async def _send_one(self, account_id: str, chat_id: str, message: str) -> Dict:
+        """
+        使用单个账号发送消息（记录日志、统计和健康数据）
+
+        Returns:
+            {"account": 账号ID, "success": True/False, "error": 错误信息}
+        """
+        try:
+            # 获取客户端
+            client = await account_manager.get_client(account_id)
+            if not client:
+                log_manager.add_log("批量发送", account_id, f"发送失败: 客户端不可用", "error")
+                return {
+                    "account": account_id,
+                    "success": False,
+                    "error": "客户端不可用"
+                }
+
+            # 发送消息
+            entity = await client.get_entity(chat_id)
+            await client.send_message(entity, message)
+
+            log_manager.add_log("批量发送", account_id, f"发送到 {chat_id}", "success")
+            stats_tracker.record_message_sent(account_id)
+            metrics.messages_sent.inc(source="batch")
+            return {
+                "account": account_id,
+                "success": True
+            }
+
+        except Exception as e:
+            log_manager.add_log("批量发送", account_id, f"发送失败: {str(e)}", "error")
+            health_monitor.record_message_failure(account_id, str(e))
+            metrics.message_failures.inc(source="batch")
+            metrics.record_error("batch_send_message", e)
+            return {
+                "account": account_id,
+                "success": False,
+                "error": str(e)
+            }
+
+    async def _dispatch_messages(
+        self,
+        chat_id: str,
+        messages: Dict[str, str],
+        delay: float = None,
+        progress_callback: Callable = None
+    ) -> List[Dict]:
+        """
+        并发分发消息（每个账号发送各自的内容）
+
+        不同账号之间互不影响，因此用有界并发代替逐个发送 + sleep；
+        delay 作为启动抖动上限，把发送请求分散开。
+
+        Args:
+            chat_id: 目标聊天ID
+            messages: {account_id: 消息内容}
+            delay: 启动抖动上限（秒）
+            progress_callback: 进度回调 (done, total, item)
+
+        Returns:
+            与 messages 顺序一致的结果列表
+        """
+        account_ids = list(messages.keys())
+        results = {}
+
+        def on_result(account_id, result):
+            if isinstance(result, Exception):
+                error = "发送超时" if isinstance(result, asyncio.TimeoutError) else str(result)
+                result = {"account": account_id, "success": False, "error": error}
+            results[account_id] = result
+            self._report_progress(progress_callback, len(results), len(account_ids), result)
+
+        await gather_bounded(
+            account_ids,
+            lambda account_id: self._send_one(account_id, chat_id, messages[account_id]),
+            concurrency=self.concurrency,
+            timeout=self.account_timeout,
+            jitter=self.default_delay if delay is None else delay,
+            on_result=on_result
+        )
+
+        return [results[account_id] for account_id in account_ids]
 
     async def batch_send_message(
         self,
         chat_id: str,
         message: str,
         account_ids: List[str] = None,
-        delay: float = None
+        delay: float = None,
+        progress_callback: Callable = None
     ) -> Dict:
         """
         批量发送消息
@@ -42,6 +147,7 @@ class BatchOperations:
             message: 消息内容
             account_ids: 账号ID列表，None表示全部账号
             delay: 操作间隔（秒）
+            progress_callback: 进度回调 (done, total, item)
 
         Returns:
             执行结果
@@ -59,40 +165,14 @@ class BatchOperations:
         fail_count = 0
 
         for account_id in account_ids:
-            try:
-                # 获取客户端
-                client = await account_manager.get_client(account_id)
-                if not client:
-                    results.append({
-                        "account": account_id,
-                        "success": False,
-                        "error": "客户端不可用"
-                    })
-                    fail_count += 1
-                    log_manager.add_log("批量发送", account_id, f"发送失败: 客户端不可用", "error")
-                    continue
-
-                # 发送消息
-                entity = await client.get_entity(chat_id)
-                await client.send_message(entity, message)
-
-                results.append({
-                    "account": account_id,
-                    "success": True
-                })
+            result = await self._send_one(account_id, chat_id, message)
+            results.append(result)
+            if result["success"]:
                 success_count += 1
-                log_manager.add_log("批量发送", account_id, f"发送到 {chat_id}", "success")
-                stats_tracker.record_message_sent(account_id)
-
-            except Exception as e:
-                results.append({
-                    "account": account_id,
-                    "success": False,
-                    "error": str(e)
-                })
+            else:
                 fail_count += 1
-                log_manager.add_log("批量发送", account_id, f"发送失败: {str(e)}", "error")
-                health_monitor.record_message_failure(account_id, str(e))
+
+            self._report_progress(progress_callback, len(results), len(account_ids), result)
 
             # 延迟
             await asyncio.sleep(delay)
@@ -111,7 +191,8 @@ class BatchOperations:
         template_id: str,
         account_ids: List[str] = None,
         template_vars: Dict = None,
-        delay: float = None
+        delay: float = None,
+        progress_callback: Callable = None
     ) -> Dict:
         """
         批量发送模板消息
@@ -121,39 +202,45 @@ class BatchOperations:
             template_id: 模板ID
             account_ids: 账号ID列表
             template_vars: 模板变量
-            delay: 操作间隔
+            delay: 发送抖动上限（秒）
+            progress_callback: 进度回调 (done, total, item)
 
         Returns:
             执行结果
         """
-        # 渲染模板
         if template_vars is None:
             template_vars = {}
 
-        # 为每个账号添加默认变量
-        messages = {}
         accounts = account_ids or list(account_manager.accounts.keys())
 
-        for account_id in accounts:
-            vars_for_account = {
+        # 为每个账号添加默认变量，一次性渲染
+        now = datetime.now()
+        vars_list = [
+            {
                 **template_vars,
                 "account": account_id,
-                "time": datetime.now().strftime("%H:%M"),
-                "date": datetime.now().strftime("%Y-%m-%d")
+                "time": now.strftime("%H:%M"),
+                "date": now.strftime("%Y-%m-%d")
             }
-            messages[account_id] = template_manager.render_template(template_id, **vars_for_account)
+            for account_id in accounts
+        ]
+        rendered = template_manager.render_batch(template_id, vars_list)
+        if rendered is None:
+            return {"success": False, "error": "模板不存在"}
+
+        messages = {
+            account_id: message
+            for account_id, message in zip(accounts, rendered)
+            if message
+        }
 
-        # 批量发送
-        results = []
-        for account_id, message in messages.items():
-            if message:
-                result = await self.batch_send_message(
-                    chat_id=chat_id,
-                    message=message,
-                    account_ids=[account_id],
-                    delay=delay
-                )
-                results.extend(result.get("results", []))
+        # 一次并发分发
+        results = await self._dispatch_messages(
+            chat_id=chat_id,
+            messages=messages,
+            delay=delay,
+            progress_callback=progress_callback
+        )
 
         return {
             "success": True,
@@ -161,12 +248,17 @@ class BatchOperations:
             "results": results
         }
 
-    async def batch_check_health(self, account_ids: List[str] = None) -> Dict:
+    async def batch_check_health(
+        self,
+        account_ids: List[str] = None,
+        progress_callback: Callable = None
+    ) -> Dict:
         """
         批量检查账号健康状态
 
         Args:
             account_ids: 账号ID列表
+            progress_callback: 进度回调 (done, total, item)
 
         Returns:
             健康检查结果
@@ -176,13 +268,31 @@ class BatchOperations:
 
         results = []
 
-        for account_id in account_ids:
-            result = await health_monitor.check_account_health(account_id)
+        def on_result(account_id, result):
+            if isinstance(result, asyncio.TimeoutError):
+                health_monitor.record_login_failure(account_id, "健康检查超时")
+                result = {"status": "unhealthy", "error": "检查超时"}
+            elif isinstance(result, Exception):
+                result = {"status": "unhealthy", "error": str(result)}
             results.append({
                 "account": account_id,
                 "status": result.get("status", "unknown"),
                 "details": result
             })
+            self._report_progress(progress_callback, len(results), len(account_ids), results[-1])
+
+        await gather_bounded(
+            account_ids,
+            health_monitor.check_account_health,
+            concurrency=self.concurrency,
+            timeout=self.account_timeout,
+            jitter=self.jitter,
+            on_result=on_result
+        )
+
+        # 按请求顺序返回
+        order = {account_id: i for i, account_id in enumerate(account_ids)}
+        results.sort(key=lambda r: order[r["account"]])
 
         return {
             "success": True,
@@ -257,7 +367,8 @@ class BatchOperations:
     async def batch_get_dialogs(
         self,
         account_ids: List[str] = None,
-        limit: int = 20
+        limit: int = 20,
+        progress_callback: Callable = None
     ) -> Dict:
         """
         批量获取对话列表
@@ -265,6 +376,7 @@ class BatchOperations:
         Args:
             account_ids: 账号ID列表
             limit: 每个账号获取的数量
+            progress_callback: 进度回调 (done, total, item)
 
         Returns:
             对话列表
@@ -274,24 +386,42 @@ class BatchOperations:
 
         dialogs = {}
 
-        for account_id in account_ids:
-            try:
-                client = await account_manager.get_client(account_id)
-                if client:
-                    result = await client.get_dialogs(limit=limit)
-                    dialogs[account_id] = [
-                        {
-                            "id": d.id,
-                            "name": d.name,
-                            "unread": d.unread_count,
-                            "type": "user" if d.is_user else "chat" if d.is_group else "channel"
-                        }
-                        for d in result
-                    ]
-                    log_manager.add_log("获取对话", account_id, f"获取 {len(result)} 个对话", "info")
-            except Exception as e:
-                dialogs[account_id] = []
-                log_manager.add_log("获取对话", account_id, f"获取失败: {str(e)}", "error")
+        async def fetch_dialogs(account_id: str) -> List[Dict]:
+            client = await account_manager.get_client(account_id)
+            if not client:
+                return []
+            result = await client.get_dialogs(limit=limit)
+            log_manager.add_log("获取对话", account_id, f"获取 {len(result)} 个对话", "info")
+            return [
+                {
+                    "id": d.id,
+                    "name": d.name,
+                    "unread": d.unread_count,
+                    "type": "user" if d.is_user else "chat" if d.is_group else "channel"
+                }
+                for d in result
+            ]
+
+        def on_result(account_id, result):
+            if isinstance(result, Exception):
+                error = "获取超时" if isinstance(result, asyncio.TimeoutError) else str(result)
+                log_manager.add_log("获取对话", account_id, f"获取失败: {error}", "error")
+                result = []
+            dialogs[account_id] = result
+            self._report_progress(
+                progress_callback, len(dialogs), len(account_ids),
+                {"account": account_id, "count": len(result)}
+            )
+
+        await gather_bounded(
+            account_ids,
+            fetch_dialogs,
+            concurrency=self.concurrency,
+            timeout=self.account_timeout,
+            jitter=self.jitter,
+            on_result=on_result
+        )
+        dialogs = {account_id: dialogs[account_id] for account_id in account_ids}
 
         return {
             "success": True,
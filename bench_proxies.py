@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+代理测试基准
+在本地启动一个 TCP 服务作为代理替身，对比逐个测试与并发测试的耗时
+
+用法: python bench_proxies.py [代理数] [服务端延迟(ms)]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+
+async def main():
+    proxy_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    delay_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    # 在临时目录运行，避免写入真实的 accounts/proxies.json
+    os.chdir(tempfile.mkdtemp(prefix="bench_proxies_"))
+    from proxy_manager import ProxyManager
+
+    async def handle(reader, writer):
+        await asyncio.sleep(delay_ms / 1000)
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0, backlog=1024)
+    port = server.sockets[0].getsockname()[1]
+
+    manager = ProxyManager()
+    for i in range(proxy_count):
+        manager.proxies[f"p{i}"] = {
+            "protocol": "socks5",
+            "host": "127.0.0.1",
+            "port": port,
+            "assigned_to": []
+        }
+
+    print(f"{proxy_count} 个代理 -> 127.0.0.1:{port}")
+
+    start = time.perf_counter()
+    for proxy in manager.proxies.values():
+        await manager.test_proxy(proxy, target=f"tcp://127.0.0.1:{port}")
+        await asyncio.sleep(delay_ms / 1000)  # 模拟远端往返
+    sequential = time.perf_counter() - start
+    print(f"  逐个测试  {sequential:8.2f} 秒")
+
+    async def slow_test(proxy_config, timeout=10, target=None):
+        result = await original(proxy_config, timeout, target)
+        await asyncio.sleep(delay_ms / 1000)  # 模拟远端往返
+        return result
+
+    original = manager.test_proxy
+    manager.test_proxy = slow_test
+    start = time.perf_counter()
+    results = await manager.test_all_proxies(target=f"tcp://127.0.0.1:{port}")
+    concurrent = time.perf_counter() - start
+    ok = sum(1 for r in results["proxies"].values() if r["success"])
+    print(f"  并发测试  {concurrent:8.2f} 秒（成功 {ok}/{proxy_count}）")
+    print(f"提速 {sequential / concurrent:.1f}x")
+
+    await manager.close()
+    server.close()
+    await server.wait_closed()
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    asyncio.run(main())
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+模板渲染微基准测试
+对比逐变量 str.replace 与编译模板的每秒渲染次数
+
+用法: python bench_templates.py [变量数] [每个文本段长度]
+"""
+import sys
+import time
+
+from template_manager import CompiledTemplate
+
+
+def build_template(var_count: int, chunk_len: int) -> str:
+    """构造一个大模板：文本段和变量交替出现"""
+    chunk = ("消息内容 lorem ipsum " * chunk_len)[:chunk_len]
+    return "".join(f"{chunk}{{var{i}}}" for i in range(var_count)) + chunk
+
+
+def render_replace(content: str, variables: list, values: dict) -> str:
+    """旧实现：每个变量一次 content.replace"""
+    for var in variables:
+        content = content.replace("{" + var + "}", str(values.get(var, "")))
+    return content
+
+
+def bench(label: str, func, seconds: float = 1.0) -> float:
+    """运行 func 约 seconds 秒，返回每秒次数"""
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        func()
+        count += 1
+    rate = count / (time.perf_counter() - start)
+    print(f"  {label:<28} {rate:>12,.0f} 次/秒")
+    return rate
+
+
+def main():
+    var_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    chunk_len = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    content = build_template(var_count, chunk_len)
+    variables = [f"var{i}" for i in range(var_count)]
+    values = {var: f"值{i}" for i, var in enumerate(variables)}
+    values_list = [values] * 100
+
+    compiled = CompiledTemplate(content)
+    assert compiled.render(values) == render_replace(content, variables, values)
+
+    print(f"模板长度 {len(content):,} 字符，{var_count} 个变量")
+    replace_rate = bench("str.replace 逐变量", lambda: render_replace(content, variables, values))
+    compile_rate = bench("编译（每次重新解析）", lambda: CompiledTemplate(content).render(values))
+    compiled_rate = bench("编译缓存 render", lambda: compiled.render(values))
+    bulk_rate = bench("编译缓存 render_many x100", lambda: compiled.render_many(values_list)) * 100
+    print(f"  {'render_many 折算':<28} {bulk_rate:>12,.0f} 次/秒")
+    print(f"编译缓存相对 str.replace 提速 {compiled_rate / replace_rate:.1f}x"
+          f"（不缓存 {compile_rate / replace_rate:.1f}x）")
+
+
+if __name__ == "__main__":
+    main()
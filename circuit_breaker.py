@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+熔断器模块
+账号连续连接失败后快速失败，冷却后只放行一次试探连接
+"""
+import os
+import time
+from typing import Callable, Dict, Optional
+
+
+FAILURE_THRESHOLD = int(os.getenv("TELEGRAM_MCP_CIRCUIT_THRESHOLD", "3"))  # 连续失败多少次后熔断
+COOLDOWN = float(os.getenv("TELEGRAM_MCP_CIRCUIT_COOLDOWN", "60"))  # 熔断冷却时间（秒）
+MAX_COOLDOWN = 900.0  # 试探失败后冷却时间翻倍的上限（秒）
+
+CLOSED = "closed"  # 正常
+OPEN = "open"  # 熔断中，直接失败
+HALF_OPEN = "half_open"  # 冷却结束，允许一次试探
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开时抛出"""
+
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"账号 {name} 连接已熔断，{retry_after:.0f} 秒后重试")
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    closed --连续失败达到阈值--> open --冷却结束--> half_open
+    half_open 只放行一次试探：成功回到 closed，失败重新 open 且冷却时间翻倍。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        cooldown: float = COOLDOWN,
+        on_state_change: Optional[Callable[[str, str, str], None]] = None
+    ):
+        """
+        Args:
+            name: 名称（账号ID）
+            failure_threshold: 连续失败阈值
+            cooldown: 初始冷却时间（秒）
+            on_state_change: 状态变化回调 on_state_change(name, old_state, new_state)
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_error: Optional[str] = None
+        self._state = CLOSED
+        self._probing = False
+        self._on_state_change = on_state_change
+
+    def _set_state(self, state: str):
+        old_state = self._state
+        self._state = state
+        if old_state != state and self._on_state_change:
+            self._on_state_change(self.name, old_state, state)
+
+    @property
+    def state(self) -> str:
+        """当前状态（冷却结束的 open 视为 half_open）"""
+        if self._state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self._set_state(HALF_OPEN)
+        return self._state
+
+    def retry_after(self) -> float:
+        """距离允许试探的秒数"""
+        if self._state != OPEN:
+            return 0.0
+        return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def before_call(self):
+        """
+        调用前检查
+
+        Raises:
+            CircuitOpenError: 熔断中，或已有试探正在进行
+        """
+        state = self.state
+        if state == OPEN:
+            raise CircuitOpenError(self.name, self.retry_after())
+        if state == HALF_OPEN:
+            if self._probing:
+                raise CircuitOpenError(self.name, 0.0)
+            self._probing = True
+
+    def record_success(self):
+        """记录成功，关闭熔断"""
+        self._probing = False
+        self.failures = 0
+        self.cooldown = self.base_cooldown
+        self.last_error = None
+        self._set_state(CLOSED)
+
+    def release_probe(self):
+        """试探被取消（如调用方超时）时归还试探名额，不计入失败，下一次调用可以重新试探"""
+        self._probing = False
+
+    def record_failure(self, error: str = None):
+        """记录失败，达到阈值或试探失败时打开熔断"""
+        self.failures += 1
+        self.last_error = error
+        if self._state == HALF_OPEN:
+            self._probing = False
+            self.cooldown = min(self.cooldown * 2, MAX_COOLDOWN)
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+        elif self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+    def to_dict(self) -> Dict:
+        """状态快照"""
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "retry_after": round(self.retry_after(), 1),
+            "last_error": self.last_error
+        }
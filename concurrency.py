@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+并发工具模块
+有界并发执行、单项超时、随机抖动、令牌桶限速，供批量操作、健康监控和备份使用
+"""
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Iterable, List, Optional
+
+
+DEFAULT_CONCURRENCY = 20  # 默认并发数
+DEFAULT_JITTER = 0.5  # 默认启动抖动（秒）
+
+
+async def gather_bounded(
+    items: Iterable[Any],
+    worker: Callable[[Any], Awaitable[Any]],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    timeout: Optional[float] = None,
+    jitter: float = 0.0,
+    on_result: Optional[Callable[[Any, Any], None]] = None
+) -> List[Any]:
+    """
+    有界并发执行
+
+    每个任务先随机等待 0~jitter 秒再获取信号量执行，避免所有请求
+    在同一时刻打到 Telegram（惊群）；等待期间不占用并发名额。整体耗时约为 O(n / concurrency)。
+
+    Args:
+        items: 待处理的项目
+        worker: 异步处理函数 worker(item)
+        concurrency: 最大并发数
+        timeout: 单项超时（秒），None 表示不限制
+        jitter: 启动抖动上限（秒）
+        on_result: 每项完成时的回调 on_result(item, result)
+
+    Returns:
+        与 items 顺序一致的结果列表；失败或超时的项为对应的异常对象
+    """
+    items = list(items)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(item):
+        if jitter > 0:
+            await asyncio.sleep(random.uniform(0, jitter))
+        async with semaphore:
+            try:
+                if timeout:
+                    result = await asyncio.wait_for(worker(item), timeout=timeout)
+                else:
+                    result = await worker(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                result = e
+        if on_result:
+            on_result(item, result)
+        return result
+
+    return await asyncio.gather(*(run(item) for item in items))
+
+
+def jittered_interval(interval: float, ratio: float = 0.1) -> float:
+    """
+    给周期间隔加上 ±ratio 的随机抖动
+
+    Args:
+        interval: 基础间隔（秒）
+        ratio: 抖动比例
+
+    Returns:
+        抖动后的间隔
+    """
+    return max(0.0, interval * (1 + random.uniform(-ratio, ratio)))
+
+
+class RateLimiter:
+    """
+    令牌桶限速器
+
+    平均每秒放行 rate 次，最多允许 burst 次突发；多个协程共享同一个限速器时，
+    总请求速率受限，与并发数无关。
+    """
+
+    def __init__(self, rate: float, burst: int = None):
+        """
+        Args:
+            rate: 每秒放行次数
+            burst: 桶容量（默认等于 rate）
+        """
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """取一个令牌，没有时等待"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
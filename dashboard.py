@@ -7,13 +7,13 @@ import asyncio
 import json
 import os
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional, Set
 
-from fastapi import Depends, FastAPI, WebSocket, WebSocketDisconnect, HTTPException, BackgroundTasks
+from fastapi import Depends, FastAPI, Request, Response, WebSocket, WebSocketDisconnect, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 import uvicorn
 
@@ -22,10 +22,14 @@ from account_manager import account_manager
 from proxy_manager import proxy_manager
 from health_monitor import health_monitor
 from stats_tracker import stats_tracker
-from log_manager import log_manager
-from template_manager import template_manager
+from log_manager import MAX_LOGS, log_manager
+from template_manager import template_manager, extract_variables
 from scheduler import task_scheduler
 from batch_operations import batch_operations
+from job_manager import job_manager, JOB_RUNNING
+from snapshot_cache import SnapshotCache
+from pagination import page_response
+import metrics
 from security import mask_phone, require_admin_token, require_websocket_token
 
 
@@ -61,9 +65,13 @@ async def lifespan(app: FastAPI):
     await health_monitor.start_monitoring(interval=300)  # 每5分钟检查一次
     print("✅ 健康监控已启动")
 
+    # 采样事件循环延迟
+    loop_monitor_task = asyncio.create_task(metrics.monitor_event_loop())
+
     yield
 
     # 关闭时执行
+    loop_monitor_task.cancel()
     scheduler_task.cancel()
     health_monitor.stop_monitoring()
     print("🛴 定时任务调度器和健康监控已停止")
@@ -126,6 +134,34 @@ class BatchImportRequest(BaseModel):
     accounts: List[dict]
 
 
+# ============ 快照缓存 ============
+
+snapshot_cache = SnapshotCache()
+
+
+def _cached_json(request: Request, key: str, version, builder) -> Response:
+    """
+    返回带 ETag / Last-Modified 的 JSON 响应
+
+    数据版本没变时复用上次计算的结果；客户端缓存仍有效时直接返回 304，不做任何计算。
+    """
+    if snapshot_cache.not_modified(
+        key,
+        version,
+        request.headers.get("if-none-match"),
+        request.headers.get("if-modified-since")
+    ):
+        return Response(status_code=304, headers={"ETag": snapshot_cache.make_etag(key, version)})
+
+    # 缓存序列化后的响应体，命中时连 JSON 编码也省掉
+    body, etag, last_modified = snapshot_cache.get(key, version, lambda: JSONResponse(content=builder()).body)
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"ETag": etag, "Last-Modified": last_modified, "Cache-Control": "no-cache"}
+    )
+
+
 # ============ API 端点 ============
 
 @app.get("/")
@@ -137,15 +173,40 @@ async def root():
 # ============ 账号管理 API ============
 
 @app.get("/api/accounts")
-async def list_accounts():
-    """获取所有账号列表"""
-    try:
+async def list_accounts(
+    request: Request,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    premium: Optional[bool] = None,
+    q: Optional[str] = None,
+    sort: str = "account_id"
+):
+    """
+    获取账号列表
+
+    不带 limit 时返回全部账号（支持 ETag 条件请求）；带 limit 时按游标分页，
+    可按 status(online/offline)、premium、q(关键词) 筛选，sort 可选 account_id / use_count / last_online。
+    """
+    if limit is not None:
+        try:
+            page, next_cursor, total = account_manager.query_accounts(
+                limit, cursor, status=status, premium=premium, keyword=q, sort=sort
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return page_response("accounts", page, total, next_cursor)
+
+    def build():
         accounts = account_manager.list_accounts()
         return {
             "success": True,
             "accounts": accounts,
             "total": len(accounts)
         }
+
+    try:
+        return _cached_json(request, "accounts", account_manager.get_state_version(), build)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -465,13 +526,16 @@ async def test_proxies(proxy_id: Optional[str] = None):
 # ============ 健康监控 API ============
 
 @app.get("/api/health/report")
-async def get_health_report(account_id: Optional[str] = None):
-    """获取健康报告"""
-    report = health_monitor.get_health_report(account_id)
-    return {
-        "success": True,
-        "report": report
-    }
+async def get_health_report(request: Request, account_id: Optional[str] = None):
+    """获取健康报告（支持 ETag 条件请求）"""
+    def build():
+        return {
+            "success": True,
+            "report": health_monitor.get_health_report(account_id)
+        }
+
+    version = (health_monitor.version, account_manager.get_state_version())
+    return _cached_json(request, f"health:{account_id or ''}", version, build)
 
 
 @app.post("/api/health/check/{account_id}")
@@ -498,13 +562,23 @@ async def get_risk_accounts():
 # ============ 统计 API ============
 
 @app.get("/api/stats/summary")
-async def get_stats_summary():
-    """获取统计摘要"""
-    summary = stats_tracker.get_summary()
-    return {
-        "success": True,
-        "summary": summary
-    }
+async def get_stats_summary(request: Request):
+    """获取统计摘要（支持 ETag 条件请求）"""
+    def build():
+        return {
+            "success": True,
+            "summary": stats_tracker.get_summary()
+        }
+
+    # 摘要包含“今日”数据，日期变化也要重新计算
+    version = (stats_tracker.version, datetime.now().strftime("%Y-%m-%d"))
+    return _cached_json(request, "stats:summary", version, build)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus 指标（文本格式）"""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 @app.get("/api/stats/account/{account_id}")
@@ -564,14 +638,34 @@ async def get_activity_trend(account_id: str, days: int = 7):
 # ============ 日志管理 API ============
 
 @app.get("/api/logs")
-async def get_logs(limit: int = 100, account: Optional[str] = None, action: Optional[str] = None):
-    """获取操作日志"""
-    logs = log_manager.get_logs(limit=limit, account=account, action=action)
-    return {
-        "success": True,
-        "logs": logs,
-        "total": len(logs)
-    }
+async def get_logs(
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    account: Optional[str] = None,
+    action: Optional[str] = None,
+    level: Optional[str] = None
+):
+    """
+    获取操作日志（最新的在前）
+
+    不带 cursor 时与原接口一致：返回最新的 limit 条，total 为返回条数；
+    带 cursor 时按游标分页（cursor 传空字符串取第一页），total 为符合条件的总数。
+    """
+    if cursor is None:
+        logs = log_manager.get_logs(limit=limit, account=account, action=action, level=level)
+        return {
+            "success": True,
+            "logs": logs,
+            "total": len(logs)
+        }
+
+    try:
+        logs, next_cursor, total = log_manager.query_logs(
+            limit=min(max(limit, 1), MAX_LOGS), cursor=cursor, account=account, action=action, level=level
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return page_response("logs", logs, total, next_cursor)
 
 
 @app.get("/api/logs/stats")
@@ -594,8 +688,27 @@ async def clear_logs():
 # ============ 模板管理 API ============
 
 @app.get("/api/templates")
-async def list_templates(category: Optional[str] = None):
-    """获取消息模板列表"""
+async def list_templates(
+    category: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    q: Optional[str] = None,
+    sort: str = "use_count"
+):
+    """
+    获取消息模板列表
+
+    带 limit 时按游标分页，可按 q(关键词) 筛选，sort 可选 use_count / created_at / name。
+    """
+    if limit is not None:
+        try:
+            page, next_cursor, total = template_manager.query_templates(
+                limit, cursor, category=category, keyword=q, sort=sort
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return page_response("templates", page, total, next_cursor)
+
     templates = template_manager.list_templates(category=category)
     return {
         "success": True,
@@ -611,14 +724,13 @@ async def add_template(request: dict):
 
     # 如果只传了 content，自动生成其他字段
     if content and not request.get("template_id") and not request.get("name"):
-        import re
         import time
 
         # 自动生成模板ID（使用时间戳）
         template_id = f"template_{int(time.time() * 1000) % 1000000}"
 
         # 自动提取变量
-        variables = list(set(re.findall(r'\{(\w+)\}', content)))
+        variables = extract_variables(content)
 
         # 自动生成名称（取前20个字符）
         name = content[:20] + ("..." if len(content) > 20 else "")
@@ -675,8 +787,30 @@ async def preview_template(template_id: str, vars: Optional[str] = None):
 # ============ 定时任务 API ============
 
 @app.get("/api/schedules")
-async def list_schedules():
-    """获取定时任务列表"""
+async def list_schedules(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    account_id: Optional[str] = None,
+    enabled: Optional[bool] = None,
+    repeat: Optional[str] = None,
+    action: Optional[str] = None,
+    sort: str = "created_at"
+):
+    """
+    获取定时任务列表
+
+    带 limit 时按游标分页，可按 account_id、enabled、repeat、action 筛选，
+    sort 可选 created_at / name / next_run。
+    """
+    if limit is not None:
+        try:
+            page, next_cursor, total = task_scheduler.query_schedules(
+                limit, cursor, account_id=account_id, enabled=enabled, repeat=repeat, action=action, sort=sort
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return page_response("schedules", page, total, next_cursor)
+
     schedules = task_scheduler.list_schedules()
     return {
         "success": True,
@@ -821,13 +955,13 @@ async def batch_send_message_api(request: dict):
     if not chat_id or not message:
         raise HTTPException(status_code=400, detail="缺少必要参数")
 
-    result = await batch_operations.batch_send_message(
-        chat_id=chat_id,
-        message=message,
-        account_ids=account_ids,
-        delay=delay
-    )
-    return result
+    job_id = job_manager.submit("batch_send_message", batch_operations.batch_send_message, {
+        "chat_id": chat_id,
+        "message": message,
+        "account_ids": account_ids,
+        "delay": delay
+    })
+    return {"success": True, "job_id": job_id, "status": "pending"}
 
 
 @app.post("/api/batch/send-template")
@@ -856,8 +990,10 @@ async def batch_send_template_api(request: dict):
 async def batch_check_health_api(request: dict):
     """批量检查账号健康状态"""
     account_ids = request.get("account_ids")
-    result = await batch_operations.batch_check_health(account_ids)
-    return result
+    job_id = job_manager.submit("batch_check_health", batch_operations.batch_check_health, {
+        "account_ids": account_ids
+    })
+    return {"success": True, "job_id": job_id, "status": "pending"}
 
 
 @app.post("/api/batch/export-sessions")
@@ -883,95 +1019,388 @@ async def batch_get_dialogs_api(request: dict):
     account_ids = request.get("account_ids")
     limit = request.get("limit", 20)
 
-    result = await batch_operations.batch_get_dialogs(
-        account_ids=account_ids,
-        limit=limit
-    )
-    return result
+    job_id = job_manager.submit("batch_get_dialogs", batch_operations.batch_get_dialogs, {
+        "account_ids": account_ids,
+        "limit": limit
+    })
+    return {"success": True, "job_id": job_id, "status": "pending"}
+
+
+# ============ 后台任务 API ============
+
+@app.get("/api/jobs")
+async def list_jobs(status: Optional[str] = None):
+    """获取后台任务列表"""
+    jobs = job_manager.list_jobs(status=status)
+    return {
+        "success": True,
+        "jobs": jobs,
+        "total": len(jobs)
+    }
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """获取后台任务进度和结果"""
+    job = job_manager.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return {
+        "success": True,
+        "job": job
+    }
+
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """取消后台任务"""
+    if job_id not in job_manager.jobs:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    if job_manager.cancel_job(job_id):
+        log_manager.add_log("后台任务", "system", f"取消任务 {job_id}", "warning")
+        return {"success": True, "message": "任务已取消"}
+    else:
+        raise HTTPException(status_code=400, detail="任务已结束，无法取消")
 
 
 # ============ WebSocket 实时推送 ============
 
+STATUS_INTERVAL = 5  # 状态推送间隔（秒）
+WS_QUEUE_SIZE = int(os.getenv("TELEGRAM_MCP_WS_QUEUE_SIZE", "100"))  # 每个连接的待发送消息上限
+
+
+def _has_null(value) -> bool:
+    """值（含嵌套字典）中是否有 None；列表整体替换，不受影响"""
+    if value is None:
+        return True
+    return isinstance(value, dict) and any(_has_null(item) for item in value.values())
+
+
+def _merge_patch(old, new):
+    """
+    计算 JSON Merge Patch（RFC 7396）：把 old 变成 new 需要的最小改动
+
+    字典递归比较，被删除的键为 None；其他类型（包括列表）变化时整体替换。
+    Merge Patch 里的 null 表示删除，无法表达“值变成 null”，遇到这种改动返回 None，
+    调用方改发完整快照。
+    """
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return None if _has_null(new) else new
+    patch = {}
+    for key in old.keys() - new.keys():
+        patch[key] = None
+    for key, value in new.items():
+        if key in old and old[key] == value:
+            continue
+        change = _merge_patch(old[key], value) if key in old else (None if _has_null(value) else value)
+        if change is None:
+            return None
+        patch[key] = change
+    return patch
+
+
+# 订阅主题：
+#   status           全局状态（账号列表、健康报告、统计摘要），定期推送差异
+#   account:<id>     单个账号的信息、健康数据和统计，定期推送差异
+#   logs / logs:<id> 新日志（全部 / 指定账号）
+#   jobs / job:<id>  后台任务事件（全部 / 指定任务）
+#   scheduler        定时任务事件
+SNAPSHOT_TOPICS = ("status",)
+SNAPSHOT_TOPIC_PREFIXES = ("account:",)
+EVENT_TOPICS = ("logs", "jobs", "scheduler")
+EVENT_TOPIC_PREFIXES = ("logs:", "job:")
+DEFAULT_TOPICS = ("status", "jobs")  # 未指定订阅时的默认主题（与旧版行为一致）
+LOGS_TAIL = 50  # 订阅日志时先推送的最近日志条数
+
+
+def _is_snapshot_topic(topic: str) -> bool:
+    return topic in SNAPSHOT_TOPICS or topic.startswith(SNAPSHOT_TOPIC_PREFIXES)
+
+
+def _is_valid_topic(topic: str) -> bool:
+    return (
+        _is_snapshot_topic(topic)
+        or topic in EVENT_TOPICS
+        or topic.startswith(EVENT_TOPIC_PREFIXES)
+    )
+
+
 class ConnectionManager:
-    """WebSocket 连接管理器"""
+    """
+    WebSocket 连接管理器
+
+    客户端按主题订阅，消息只发给订阅了对应主题的连接。
+    快照类主题由单个后台任务每 STATUS_INTERVAL 秒计算一次（每个主题只算一次），只推送与上次的差异；
+    每个连接有独立的有界发送队列，队列满（消费过慢）的连接会被断开，客户端重连后重新获取全量快照。
+    """
 
     def __init__(self):
         self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
+        self._queues: Dict[WebSocket, asyncio.Queue] = {}
+        self._senders: Dict[WebSocket, asyncio.Task] = {}
+        self._subscriptions: Dict[WebSocket, Set[str]] = {}
+        self._status_task: Optional[asyncio.Task] = None
+        self._snapshots: Dict[str, dict] = {}  # 各快照主题的上次快照
+        self._snapshot_version = None
+
+    async def connect(self, websocket: WebSocket, topics: List[str] = None):
         await websocket.accept()
         self.active_connections.append(websocket)
+        self._queues[websocket] = asyncio.Queue(maxsize=WS_QUEUE_SIZE)
+        self._senders[websocket] = asyncio.create_task(self._sender(websocket))
+        self._subscriptions[websocket] = set()
+        self.subscribe(websocket, topics or list(DEFAULT_TOPICS))
+
+        if self._status_task is None or self._status_task.done():
+            self._status_task = asyncio.create_task(self._status_loop())
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        if websocket in self.active_connections:
+            self.active_connections.remove(websocket)
+        self._queues.pop(websocket, None)
+        self._subscriptions.pop(websocket, None)
+        sender = self._senders.pop(websocket, None)
+        if sender and sender is not asyncio.current_task():
+            sender.cancel()
+
+    def subscribe(self, websocket: WebSocket, topics: List[str]):
+        """订阅主题，新订阅的主题先推送一次当前状态"""
+        subscriptions = self._subscriptions.get(websocket)
+        if subscriptions is None:
+            return
+        invalid = [topic for topic in topics if not _is_valid_topic(topic)]
+        if invalid:
+            self.send(websocket, {"type": "error", "error": f"未知主题: {', '.join(invalid)}"})
+
+        for topic in topics:
+            if topic in subscriptions or not _is_valid_topic(topic):
+                continue
+            subscriptions.add(topic)
+            initial = self._initial_message(topic)
+            if initial:
+                self.send(websocket, initial)
+
+        self.send(websocket, {"type": "subscribed", "topics": sorted(subscriptions)})
+
+    def unsubscribe(self, websocket: WebSocket, topics: List[str]):
+        """取消订阅"""
+        subscriptions = self._subscriptions.get(websocket)
+        if subscriptions is None:
+            return
+        subscriptions.difference_update(topics)
+        self.send(websocket, {"type": "subscribed", "topics": sorted(subscriptions)})
+
+    def send(self, websocket: WebSocket, message: dict):
+        """把消息放入连接的发送队列；队列已满说明消费过慢，直接断开"""
+        queue = self._queues.get(websocket)
+        if queue is None:
+            return
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            print("WebSocket 客户端消费过慢，断开连接")
+            self.disconnect(websocket)
+            asyncio.create_task(self._close(websocket))
+
+    def publish(self, topics: List[str], message: dict):
+        """发送给订阅了任一主题的连接（每个连接只发一次）"""
+        for connection, subscriptions in list(self._subscriptions.items()):
+            if not subscriptions.isdisjoint(topics):
+                self.send(connection, message)
+
+    def broadcast(self, message: dict):
+        """广播消息到所有连接（只入队，不等待发送）"""
+        for connection in list(self.active_connections):
+            self.send(connection, message)
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+
+    async def _sender(self, websocket: WebSocket):
+        """逐条发送连接队列中的消息"""
+        queue = self._queues[websocket]
+        try:
+            while True:
+                message = await queue.get()
+                await websocket.send_json(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.disconnect(websocket)
+
+    @staticmethod
+    def _state_version() -> tuple:
+        """快照依赖的数据版本，没变就不必重新计算"""
+        return (
+            account_manager.get_state_version(),
+            health_monitor.version,
+            stats_tracker.version,
+            datetime.now().strftime("%Y-%m-%d")
+        )
 
-    async def broadcast(self, message: dict):
-        """广播消息到所有连接"""
-        for connection in self.active_connections:
+    @staticmethod
+    def _build_snapshot(topic: str) -> dict:
+        """计算一个快照主题的当前状态"""
+        if topic == "status":
+            # 账号按 account_id 索引，便于计算差异
+            accounts = account_manager.list_accounts()
+            snapshot = {
+                "accounts": {a.get("account_id"): a for a in accounts},
+                "health": health_monitor.get_health_report(),
+                "stats": stats_tracker.get_summary()
+            }
+        else:
+            account_id = topic.split(":", 1)[1]
+            snapshot = {
+                "account": account_manager.get_account_summary(account_id),
+                "health": health_monitor.get_health_report(account_id),
+                "stats": stats_tracker.get_account_stats(account_id)
+            }
+        # 统一成 JSON 类型，保证前后两次快照可以直接比较
+        return json.loads(json.dumps(snapshot, ensure_ascii=False, default=str))
+
+    @staticmethod
+    def _full_message(topic: str, snapshot: dict) -> dict:
+        if topic == "status":
+            return {
+                "type": "status_update",
+                "timestamp": datetime.now().isoformat(),
+                "accounts": list(snapshot["accounts"].values()),
+                "health": snapshot["health"],
+                "stats": snapshot["stats"]
+            }
+        return {
+            "type": "account_update",
+            "timestamp": datetime.now().isoformat(),
+            "account_id": topic.split(":", 1)[1],
+            **snapshot
+        }
+
+    @staticmethod
+    def _delta_message(topic: str, changes: dict) -> dict:
+        message = {
+            "type": "status_delta" if topic == "status" else "account_delta",
+            "timestamp": datetime.now().isoformat(),
+            "changes": changes
+        }
+        if topic != "status":
+            message["account_id"] = topic.split(":", 1)[1]
+        return message
+
+    def _initial_message(self, topic: str) -> Optional[dict]:
+        """新订阅时推送的当前状态"""
+        if _is_snapshot_topic(topic):
+            if topic not in self._snapshots:
+                if not self._snapshots:
+                    self._snapshot_version = self._state_version()
+                self._snapshots[topic] = self._build_snapshot(topic)
+            return self._full_message(topic, self._snapshots[topic])
+        if topic == "logs" or topic.startswith("logs:"):
+            account = topic.split(":", 1)[1] if ":" in topic else None
+            return {"type": "logs", "topic": topic, "logs": log_manager.get_logs(limit=LOGS_TAIL, account=account)}
+        if topic.startswith("job:"):
+            job = job_manager.get_job(topic.split(":", 1)[1])
+            return {"type": "job_state", "job": job} if job else None
+        return None
+
+    async def _status_loop(self):
+        """定期计算有人订阅的快照主题并推送差异（没有连接时退出）"""
+        while self.active_connections:
+            await asyncio.sleep(STATUS_INTERVAL)
             try:
-                await connection.send_json(message)
-            except:
-                pass
+                topics = set()
+                for subscriptions in self._subscriptions.values():
+                    topics.update(t for t in subscriptions if _is_snapshot_topic(t))
+
+                # 不再有人订阅的主题不再计算
+                for topic in list(self._snapshots):
+                    if topic not in topics:
+                        del self._snapshots[topic]
+
+                version = self._state_version()
+                if version == self._snapshot_version:
+                    continue
+                self._snapshot_version = version
+
+                for topic in topics:
+                    snapshot = self._build_snapshot(topic)
+                    changes = _merge_patch(self._snapshots.get(topic), snapshot)
+                    self._snapshots[topic] = snapshot
+                    if changes is None:
+                        # 有字段变成 null，差异无法表达，发完整快照
+                        self.publish([topic], self._full_message(topic, snapshot))
+                    elif changes:
+                        self.publish([topic], self._delta_message(topic, changes))
+            except Exception as e:
+                print(f"广播错误: {e}")
+        self._snapshots = {}
 
 
 manager = ConnectionManager()
 
+metrics.registry.gauge(
+    "telegram_mcp_websocket_connections", "Dashboard WebSocket connections"
+).set_function(lambda: len(manager.active_connections))
+metrics.registry.gauge(
+    "telegram_mcp_jobs_running", "Running background jobs"
+).set_function(lambda: sum(1 for job in job_manager.jobs.values() if job["status"] == JOB_RUNNING))
+
+
+def _push_job_event(event: dict):
+    """将后台任务进度推送给订阅者"""
+    manager.publish(["jobs", f"job:{event['job']['job_id']}"], event)
+
+
+def _push_log(log: dict):
+    """将新日志推送给订阅者"""
+    manager.publish(["logs", f"logs:{log.get('account')}"], {"type": "log", "log": log})
+
+
+def _push_scheduler_event(event: dict):
+    """将定时任务事件推送给订阅者"""
+    manager.publish(["scheduler"], event)
+
+
+job_manager.add_listener(_push_job_event)
+log_manager.add_listener(_push_log)
+task_scheduler.add_listener(_push_scheduler_event)
+
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket 实时推送"""
+    """
+    WebSocket 实时推送
+
+    连接时可用 ?topics=status,account:xxx 指定订阅，之后发送
+    {"type": "subscribe" / "unsubscribe", "topics": [...]} 调整订阅。
+    """
     await require_websocket_token(websocket)
-    await manager.connect(websocket)
+    topics = [t.strip() for t in websocket.query_params.get("topics", "").split(",") if t.strip()]
+    await manager.connect(websocket, topics)
 
     try:
-        # 启动后台任务，定期推送状态更新
-        stop_event = asyncio.Event()
-
-        async def broadcast_status():
-            """定期广播状态"""
-            while not stop_event.is_set():
-                try:
-                    # 获取账号列表
-                    accounts = account_manager.list_accounts()
-
-                    # 获取健康报告
-                    health_report = health_monitor.get_health_report()
-
-                    # 获取统计摘要
-                    stats_summary = stats_tracker.get_summary()
-
-                    # 广播状态
-                    await manager.broadcast({
-                        "type": "status_update",
-                        "timestamp": datetime.now().isoformat(),
-                        "accounts": accounts,
-                        "health": health_report,
-                        "stats": stats_summary
-                    })
-
-                    await asyncio.sleep(5)  # 每5秒更新一次
-                except Exception as e:
-                    print(f"广播错误: {e}")
-                    await asyncio.sleep(5)
-
-        # 启动广播任务
-        broadcast_task = asyncio.create_task(broadcast_status())
-
         # 处理客户端消息
         while True:
             data = await websocket.receive_json()
 
             # 处理客户端请求
-            if data.get("type") == "ping":
-                await websocket.send_json({"type": "pong"})
+            message_type = data.get("type")
+            if message_type == "ping":
+                manager.send(websocket, {"type": "pong"})
+            elif message_type == "subscribe":
+                manager.subscribe(websocket, list(data.get("topics") or []))
+            elif message_type == "unsubscribe":
+                manager.unsubscribe(websocket, list(data.get("topics") or []))
 
     except WebSocketDisconnect:
         manager.disconnect(websocket)
-        stop_event.set()
     except Exception as e:
         print(f"WebSocket 错误: {e}")
         manager.disconnect(websocket)
-        stop_event.set()
 
 
 # ============ 启动入口 ============
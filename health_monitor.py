@@ -6,14 +6,30 @@
 import asyncio
 import json
 import os
+import time
 from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import Dict, List, Optional
+from telethon.tl.functions.updates import GetStateRequest
 from account_manager import account_manager
+from circuit_breaker import CircuitOpenError, OPEN, HALF_OPEN
 from proxy_manager import proxy_manager
+from concurrency import gather_bounded, jittered_interval
+import metrics
 
 
 ACCOUNTS_DIR = "./accounts"
 HEALTH_FILE = os.path.join(ACCOUNTS_DIR, "health.json")
+CHECK_CONCURRENCY = int(os.getenv("TELEGRAM_MCP_HEALTH_CONCURRENCY", "20"))  # 巡检并发数
+CHECK_TIMEOUT = 30  # 单个账号检查超时（秒）
+CHECK_JITTER = 1.0  # 单个检查启动抖动（秒）
+PROBE_TIMEOUT = 10  # 轻量探测超时（秒）
+FULL_CHECK_INTERVAL = int(os.getenv("TELEGRAM_MCP_HEALTH_FULL_INTERVAL", "3600"))  # 完整检查间隔（秒）
+
+# 自适应巡检：高风险/最近失败的账号频繁检查，健康账号按指数退避
+RISK_CHECK_INTERVALS = {"high": 60, "medium": 120}  # 按风险等级的检查间隔（秒）
+MAX_CHECK_INTERVAL = int(os.getenv("TELEGRAM_MCP_HEALTH_MAX_INTERVAL", "3600"))  # 健康账号最长检查间隔（秒）
+SWEEP_BUDGET = int(os.getenv("TELEGRAM_MCP_HEALTH_SWEEP_BUDGET", "100"))  # 每轮最多检查的账号数
+MIN_SWEEP_SLEEP = 5  # 两轮巡检最短间隔（秒）
 
 
 class HealthMonitor:
@@ -21,8 +37,12 @@ class HealthMonitor:
 
     def __init__(self):
         self.health_data: Dict = {}
+        self.version = 0  # 数据版本号，每次保存时递增（用于快照缓存）
         self._load_health()
         self._monitoring = False
+        self._schedule: Dict[str, Dict] = {}  # 巡检计划 {account_id: {"next_check": monotonic, "streak": 连续健康次数}}
+        self._base_interval = 300  # 低风险账号的基础检查间隔（秒）
+        account_manager.add_breaker_listener(self._on_breaker_change)
 
     def _load_health(self):
         """加载健康数据"""
@@ -32,6 +52,7 @@ class HealthMonitor:
 
     def _save_health(self):
         """保存健康数据"""
+        self.version += 1
         os.makedirs(ACCOUNTS_DIR, exist_ok=True)
         with open(HEALTH_FILE, 'w', encoding='utf-8') as f:
             json.dump(self.health_data, f, ensure_ascii=False, indent=2)
@@ -50,7 +71,9 @@ class HealthMonitor:
                 "risk_level": "low",  # low, medium, high
                 "banned": False,
                 "proxy_response_time": 0,
-                "last_check": None
+                "probe_rtt": None,
+                "last_check": None,
+                "last_full_check": None
             }
             self._save_health()
 
@@ -74,6 +97,7 @@ class HealthMonitor:
         self.health_data[account_id]["consecutive_fails"] += 1
         self.health_data[account_id]["last_check"] = datetime.now().isoformat()
         self._update_risk_level(account_id)
+        self._expedite_check(account_id)
         self._save_health()
 
     def record_message_success(self, account_id: str):
@@ -96,6 +120,7 @@ class HealthMonitor:
         self.health_data[account_id]["consecutive_fails"] += 1
         self.health_data[account_id]["last_check"] = datetime.now().isoformat()
         self._update_risk_level(account_id)
+        self._expedite_check(account_id)
         self._save_health()
 
     def record_proxy_response_time(self, account_id: str, response_time: float):
@@ -112,6 +137,22 @@ class HealthMonitor:
         self.health_data[account_id]["last_check"] = datetime.now().isoformat()
         self._save_health()
 
+    def record_probe_success(self, account_id: str, rtt: float):
+        """记录轻量探测成功（RTT 单位 ms）"""
+        self.init_account_health(account_id)
+        health = self.health_data[account_id]
+        health["consecutive_fails"] = 0
+        health["probe_rtt"] = rtt
+        health["last_check"] = datetime.now().isoformat()
+        self._update_risk_level(account_id)
+        self._save_health()
+
+    def _on_breaker_change(self, account_id: str, old_state: str, new_state: str):
+        """熔断状态变化时重新评估风险等级"""
+        self.init_account_health(account_id)
+        self._update_risk_level(account_id)
+        self._save_health()
+
     def _update_risk_level(self, account_id: str):
         """更新风险等级"""
         health = self.health_data[account_id]
@@ -130,6 +171,15 @@ class HealthMonitor:
         else:
             health["risk_level"] = "low"
 
+        # 熔断状态：熔断中为高风险，试探中至少为中风险
+        breaker = account_manager.breakers.get(account_id)
+        circuit_state = breaker.state if breaker else "closed"
+        health["circuit_state"] = circuit_state
+        if circuit_state == OPEN:
+            health["risk_level"] = "high"
+        elif circuit_state == HALF_OPEN and health["risk_level"] == "low":
+            health["risk_level"] = "medium"
+
         # 检查是否被封号
         error_str = str(health.get("last_login_fail", {})).lower() + str(health.get("last_message_fail", {})).lower()
         if any(keyword in error_str for keyword in ["banned", "deactivated", "flood", "restricted"]):
@@ -149,31 +199,160 @@ class HealthMonitor:
         if account_id:
             return self.health_data.get(account_id, {})
 
-        # 获取高风险账号列表
-        risk_accounts = self.get_risk_accounts()
+        # 在线状态只需要连接状态，不必构造完整账号列表
+        online = sum(1 for account_id in account_manager.accounts if account_manager.is_online(account_id))
+
+        # 一次遍历统计风险等级和高风险账号列表
+        risk_counts = {"high": 0, "medium": 0, "low": 0}
+        banned = 0
+        risk_accounts = []
+        for acc_id, health in self.health_data.items():
+            risk_level = health.get("risk_level")
+            if risk_level in risk_counts:
+                risk_counts[risk_level] += 1
+            if health.get("banned"):
+                banned += 1
+            if risk_level in ["medium", "high"] or health.get("banned"):
+                risk_accounts.append(acc_id)
 
         return {
             "total_accounts": len(account_manager.accounts),
-            "online_accounts": sum(1 for a in account_manager.list_accounts() if a["status"] == "online"),
-            "offline_accounts": sum(1 for a in account_manager.list_accounts() if a["status"] == "offline"),
-            "high_risk": sum(1 for h in self.health_data.values() if h.get("risk_level") == "high"),
-            "medium_risk": sum(1 for h in self.health_data.values() if h.get("risk_level") == "medium"),
-            "low_risk": sum(1 for h in self.health_data.values() if h.get("risk_level") == "low"),
-            "banned": sum(1 for h in self.health_data.values() if h.get("banned")),
+            "online_accounts": online,
+            "offline_accounts": len(account_manager.accounts) - online,
+            "high_risk": risk_counts["high"],
+            "medium_risk": risk_counts["medium"],
+            "low_risk": risk_counts["low"],
+            "banned": banned,
             "risk_accounts": risk_accounts,  # 前端需要的字段
             "details": self.health_data
         }
 
-    async def check_account_health(self, account_id: str) -> Dict:
+    def _expedite_check(self, account_id: str):
+        """账号出现失败时，把下次巡检提前到高风险间隔内，并清零退避"""
+        schedule = self._schedule.get(account_id)
+        if schedule:
+            schedule["streak"] = 0
+            schedule["next_check"] = min(schedule["next_check"], time.monotonic() + RISK_CHECK_INTERVALS["high"])
+
+    def _schedule_next(self, account_id: str, result: Dict):
+        """
+        根据检查结果安排下次巡检
+
+        失败或高/中风险账号使用固定的短间隔；健康的低风险账号每连续健康一次，
+        间隔翻倍，最长 MAX_CHECK_INTERVAL。
+        """
+        health = self.health_data.get(account_id, {})
+        risk_level = health.get("risk_level", "low")
+        schedule = self._schedule.setdefault(account_id, {"next_check": 0.0, "streak": 0})
+
+        if result.get("status") != "healthy" or health.get("consecutive_fails", 0) > 0:
+            schedule["streak"] = 0
+            delay = RISK_CHECK_INTERVALS["high"]
+        elif risk_level in RISK_CHECK_INTERVALS:
+            schedule["streak"] = 0
+            delay = RISK_CHECK_INTERVALS[risk_level]
+        else:
+            delay = min(self._base_interval * 2 ** schedule["streak"], MAX_CHECK_INTERVAL)
+            schedule["streak"] += 1
+
+        schedule["next_check"] = time.monotonic() + jittered_interval(delay)
+
+    def get_due_accounts(self, budget: int = None) -> List[str]:
+        """
+        获取到期需要巡检的账号（最早到期的在前；从未检查过的账号立即到期）
+
+        Args:
+            budget: 最多返回的账号数
+
+        Returns:
+            账号ID列表
+        """
+        now = time.monotonic()
+        due = [
+            (self._schedule.get(account_id, {}).get("next_check", 0.0), account_id)
+            for account_id in account_manager.accounts
+        ]
+        due = [item for item in due if item[0] <= now]
+        due.sort()
+        if budget:
+            due = due[:budget]
+        return [account_id for _, account_id in due]
+
+    def _seconds_until_next_check(self) -> float:
+        """距离最早一次到期巡检的秒数"""
+        next_checks = [
+            self._schedule.get(account_id, {}).get("next_check", 0.0)
+            for account_id in account_manager.accounts
+        ]
+        if not next_checks:
+            return self._base_interval
+        return max(0.0, min(next_checks) - time.monotonic())
+
+    def _needs_full_check(self, account_id: str) -> bool:
+        """距上次完整检查是否已超过 FULL_CHECK_INTERVAL"""
+        last_full = self.health_data.get(account_id, {}).get("last_full_check")
+        if not last_full:
+            return True
+        return datetime.now() - datetime.fromisoformat(last_full) >= timedelta(seconds=FULL_CHECK_INTERVAL)
+
+    async def probe_account(self, account_id: str) -> Optional[Dict]:
+        """
+        轻量探测：在已建立的连接上发送一次 updates.getState，测量往返时间
+
+        不会新建连接，也不会改写账号配置；没有可用连接时返回 None。
+
+        Args:
+            account_id: 账号ID
+
+        Returns:
+            探测结果，失败时抛出异常
+        """
+        client = account_manager.clients.get(account_id)
+        if not client or not client.is_connected():
+            return None
+
+        start = time.perf_counter()
+        await asyncio.wait_for(client(GetStateRequest()), timeout=PROBE_TIMEOUT)
+        rtt = (time.perf_counter() - start) * 1000
+
+        self.record_probe_success(account_id, rtt)
+        # RTT 包含代理转发耗时，同时计入代理延迟统计
+        proxy_manager.record_result(account_manager.client_proxies.get(account_id), True, rtt, save=False)
+
+        return {
+            "status": "healthy",
+            "account_id": account_id,
+            "mode": "probe",
+            "rtt": rtt,
+            "risk_level": self.health_data.get(account_id, {}).get("risk_level", "low")
+        }
+
+    async def check_account_health(self, account_id: str, mode: str = "full") -> Dict:
         """
         检查账号健康状态
 
         Args:
             account_id: 账号ID
+            mode: 检查方式
+                full  - 完整检查（获取客户端、授权状态、get_me、代理测试）
+                probe - 只做轻量探测，没有连接或探测失败时改做完整检查
+                auto  - 距上次完整检查超过 FULL_CHECK_INTERVAL 时完整检查，否则同 probe
 
         Returns:
             健康状态
         """
+        if mode == "auto":
+            mode = "full" if self._needs_full_check(account_id) else "probe"
+
+        if mode == "probe":
+            try:
+                result = await self.probe_account(account_id)
+                if result:
+                    return result
+            except Exception:
+                # 探测失败，改做完整检查确认
+                pass
+
         try:
             client = await account_manager.get_client(account_id)
             if not client:
@@ -188,56 +367,105 @@ class HealthMonitor:
             me = await client.get_me()
 
             # 记录成功
+            self.init_account_health(account_id)
+            self.health_data[account_id]["last_full_check"] = datetime.now().isoformat()
             self.record_login_success(account_id)
 
-            # 检查代理响应时间
-            proxy = proxy_manager.get_proxy_for_account(account_id)
-            if proxy:
-                # 转换回原始格式用于测试
-                proxy_for_test = None
-                if proxy_manager.global_proxy and proxy_manager.global_proxy.get("host"):
-                    proxy_for_test = proxy_manager.global_proxy
-                else:
-                    # 查找账号关联的独立代理
-                    for proxy_id, proxy_config in proxy_manager.proxies.items():
-                        if "assigned_to" in proxy_config and account_id in proxy_config["assigned_to"]:
-                            proxy_for_test = proxy_config
-                            break
-
-                if proxy_for_test:
-                    result = await proxy_manager.test_proxy(proxy_for_test)
-                    if result.get("success"):
-                        self.record_proxy_response_time(account_id, result.get("response_time", 0))
+            # 检查当前连接所用代理的响应时间
+            proxy_id = account_manager.client_proxies.get(account_id)
+            proxy_for_test = proxy_manager.global_proxy if proxy_id == "global" else proxy_manager.proxies.get(proxy_id)
+            if proxy_for_test:
+                result = await proxy_manager.test_proxy(proxy_for_test)
+                proxy_manager.record_result(proxy_id, result.get("success"), result.get("response_time"))
+                if result.get("success"):
+                    self.record_proxy_response_time(account_id, result.get("response_time", 0))
 
             return {
                 "status": "healthy",
                 "account_id": account_id,
+                "mode": "full",
                 "username": me.username,
                 "phone": me.phone,
                 "risk_level": self.health_data.get(account_id, {}).get("risk_level", "low")
             }
 
+        except CircuitOpenError as e:
+            # 熔断中不计入登录失败，等冷却后由试探连接决定
+            return {"status": "unhealthy", "error": str(e), "circuit_state": OPEN}
+
         except Exception as e:
             self.record_login_failure(account_id, str(e))
             return {"status": "unhealthy", "error": str(e)}
 
+    async def check_all_accounts(
+        self,
+        concurrency: int = CHECK_CONCURRENCY,
+        timeout: float = CHECK_TIMEOUT,
+        due_only: bool = False,
+        budget: int = None
+    ) -> Dict[str, Dict]:
+        """
+        并发巡检账号（多数账号只做轻量探测，定期完整检查）
+
+        Args:
+            concurrency: 最大并发数
+            timeout: 单个账号超时（秒）
+            due_only: 只检查按自适应计划到期的账号
+            budget: 本轮最多检查的账号数
+
+        Returns:
+            {account_id: 检查结果}
+        """
+        if due_only:
+            account_ids = self.get_due_accounts(budget)
+        else:
+            account_ids = list(account_manager.accounts.keys())[:budget]
+        results = await gather_bounded(
+            account_ids,
+            lambda account_id: self.check_account_health(account_id, mode="auto"),
+            concurrency=concurrency,
+            timeout=timeout,
+            jitter=CHECK_JITTER
+        )
+        proxy_manager.save_stats()
+
+        report = {}
+        for account_id, result in zip(account_ids, results):
+            if isinstance(result, asyncio.TimeoutError):
+                self.record_login_failure(account_id, "健康检查超时")
+                result = {"status": "unhealthy", "error": "检查超时"}
+            elif isinstance(result, Exception):
+                result = {"status": "unhealthy", "error": str(result)}
+            report[account_id] = result
+            self._schedule_next(account_id, result)
+            metrics.health_checks.inc(mode=result.get("mode", "full"), status=result.get("status"))
+        return report
+
     async def start_monitoring(self, interval: int = 60):
         """
-        启动后台监控
+        启动后台监控（自适应间隔）
+
+        每轮只检查到期的账号，且不超过 SWEEP_BUDGET 个；
+        高风险和最近失败的账号约每分钟检查一次，健康账号从 interval 开始指数退避。
 
         Args:
-            interval: 检查间隔（秒）
+            interval: 低风险账号的基础检查间隔（秒）
         """
         if self._monitoring:
             return
 
         self._monitoring = True
+        self._base_interval = interval
 
         async def monitor_loop():
             while self._monitoring:
-                for account_id in account_manager.accounts.keys():
-                    await self.check_account_health(account_id)
-                await asyncio.sleep(interval)
+                try:
+                    await self.check_all_accounts(due_only=True, budget=SWEEP_BUDGET)
+                except Exception as e:
+                    print(f"健康巡检错误: {e}")
+                # 睡到下一个账号到期，加抖动避免多个实例同时巡检
+                wait = min(self._seconds_until_next_check(), interval)
+                await asyncio.sleep(max(MIN_SWEEP_SLEEP, jittered_interval(wait)))
 
         asyncio.create_task(monitor_loop())
 
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+后台任务管理模块
+长耗时的批量操作在后台执行，立即返回任务ID，进度通过监听器推送
+"""
+import asyncio
+import uuid
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+MAX_JOBS = 200  # 最多保留200个任务记录
+MAX_RUNNING_JOBS = 4  # 同时执行的任务数
+
+# 任务状态
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+FINISHED_STATUSES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+
+class JobManager:
+    """后台任务管理器"""
+
+    def __init__(self, max_running: int = MAX_RUNNING_JOBS):
+        self.jobs: Dict[str, Dict] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._listeners: List[Callable[[Dict], Any]] = []
+        self._max_running = max_running
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def add_listener(self, callback: Callable[[Dict], Any]):
+        """注册任务事件监听器（如 WebSocket 推送）"""
+        self._listeners.append(callback)
+
+    def _notify(self, job: Dict, event_type: str = "job_progress"):
+        """通知所有监听器"""
+        event = {
+            "type": event_type,
+            "timestamp": datetime.now().isoformat(),
+            "job": self._public_job(job, include_result=False)
+        }
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                print(f"任务事件推送失败: {e}")
+
+    def submit(
+        self,
+        job_type: str,
+        func: Callable[..., Awaitable[Dict]],
+        params: Dict = None
+    ) -> str:
+        """
+        提交后台任务
+
+        Args:
+            job_type: 任务类型 (batch_send_message, batch_check_health 等)
+            func: 异步执行函数，接收 progress_callback 关键字参数
+            params: 传给执行函数的参数
+
+        Returns:
+            任务ID
+        """
+        job_id = uuid.uuid4().hex[:12]
+        params = params or {}
+
+        self.jobs[job_id] = {
+            "job_id": job_id,
+            "type": job_type,
+            "status": JOB_PENDING,
+            "created_at": datetime.now().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "progress": {"done": 0, "total": 0},
+            "partial_results": [],
+            "result": None,
+            "error": None
+        }
+        self._prune()
+
+        task = asyncio.create_task(self._run(job_id, func, params))
+        task.add_done_callback(lambda _: self._on_task_done(job_id))
+        self._tasks[job_id] = task
+        self._notify(self.jobs[job_id], "job_created")
+        return job_id
+
+    def _on_task_done(self, job_id: str):
+        """任务还没开始执行就被取消时 _run 不会运行，在这里补记结束状态"""
+        job = self.jobs.get(job_id)
+        if self._tasks.pop(job_id, None) is None or not job or job["status"] in FINISHED_STATUSES:
+            return
+        job["status"] = JOB_CANCELLED
+        job["finished_at"] = datetime.now().isoformat()
+        self._notify(job, "job_finished")
+
+    async def _run(self, job_id: str, func: Callable[..., Awaitable[Dict]], params: Dict):
+        """在后台执行任务"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_running)
+
+        job = self.jobs[job_id]
+
+        def progress_callback(done: int, total: int, item: Dict = None):
+            job["progress"] = {"done": done, "total": total}
+            if item is not None:
+                job["partial_results"].append(item)
+            self._notify(job)
+
+        try:
+            async with self._semaphore:
+                job["status"] = JOB_RUNNING
+                job["started_at"] = datetime.now().isoformat()
+                self._notify(job)
+
+                job["result"] = await func(**params, progress_callback=progress_callback)
+                job["status"] = JOB_COMPLETED
+        except asyncio.CancelledError:
+            job["status"] = JOB_CANCELLED
+        except Exception as e:
+            job["status"] = JOB_FAILED
+            job["error"] = str(e)
+        finally:
+            job["finished_at"] = datetime.now().isoformat()
+            self._tasks.pop(job_id, None)
+            self._notify(job, "job_finished")
+
+    def cancel_job(self, job_id: str) -> bool:
+        """
+        取消任务
+
+        Args:
+            job_id: 任务ID
+
+        Returns:
+            是否成功（任务不存在或已结束返回 False）
+        """
+        task = self._tasks.get(job_id)
+        if not task or task.done():
+            return False
+        task.cancel()
+        return True
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """获取任务详情（含结果）"""
+        job = self.jobs.get(job_id)
+        if not job:
+            return None
+        return self._public_job(job, include_result=True)
+
+    def list_jobs(self, status: str = None) -> List[Dict]:
+        """
+        列出任务
+
+        Args:
+            status: 筛选状态
+
+        Returns:
+            任务列表（最新在前，不含结果）
+        """
+        jobs = [
+            self._public_job(job, include_result=False)
+            for job in self.jobs.values()
+            if not status or job["status"] == status
+        ]
+        return list(reversed(jobs))
+
+    def _public_job(self, job: Dict, include_result: bool) -> Dict:
+        """生成对外展示的任务数据"""
+        data = {k: v for k, v in job.items() if k not in ("result", "partial_results")}
+        if include_result:
+            data["result"] = job["result"]
+            data["partial_results"] = list(job["partial_results"])
+        return data
+
+    def _prune(self):
+        """清理过多的已结束任务"""
+        if len(self.jobs) <= MAX_JOBS:
+            return
+        for job_id in list(self.jobs.keys()):
+            if len(self.jobs) <= MAX_JOBS:
+                break
+            if self.jobs[job_id]["status"] in FINISHED_STATUSES:
+                del self.jobs[job_id]
+
+
+# 全局实例
+job_manager = JobManager()
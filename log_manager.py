@@ -3,18 +3,22 @@
 操作日志管理模块
 持久化存储所有操作日志
 """
+import bisect
 import json
 import os
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Any, Callable, List, Dict, Optional, Tuple
 from collections import deque
 
 from security import sanitize_log_text
+from pagination import decode_cursor, encode_cursor
+import metrics
 
 
 ACCOUNTS_DIR = "./accounts"
 LOG_FILE = os.path.join(ACCOUNTS_DIR, "logs.json")
 MAX_LOGS = 1000  # 最多保留1000条日志
+INDEXED_FIELDS = ("account", "action", "level")  # 建立筛选索引的字段
 
 
 class LogManager:
@@ -22,8 +26,16 @@ class LogManager:
 
     def __init__(self):
         self.logs: List[Dict] = []
+        self._listeners: List[Callable[[Dict], Any]] = []
+        # 筛选索引 {字段: {值: [日志...]}}，列表与 self.logs 一样按 id 升序
+        self._index: Dict[str, Dict[str, List[Dict]]] = {}
+        self._next_id = 1
         self._load_logs()
 
+    def add_listener(self, callback: Callable[[Dict], Any]):
+        """注册新日志监听器（如 WebSocket 推送）"""
+        self._listeners.append(callback)
+
     def _load_logs(self):
         """加载日志"""
         if os.path.exists(LOG_FILE):
@@ -33,6 +45,34 @@ class LogManager:
             except:
                 self.logs = []
 
+        # 旧日志没有 id，按顺序补上
+        self._next_id = max((log.get("id", 0) for log in self.logs), default=0) + 1
+        for log in self.logs:
+            if "id" not in log:
+                log["id"] = self._next_id
+                self._next_id += 1
+        self.logs.sort(key=lambda log: log["id"])
+        self._rebuild_index()
+
+    def _rebuild_index(self):
+        """重建筛选索引"""
+        self._index = {field: {} for field in INDEXED_FIELDS}
+        for log in self.logs:
+            self._index_add(log)
+
+    def _index_add(self, log: Dict):
+        for field in INDEXED_FIELDS:
+            self._index[field].setdefault(log.get(field), []).append(log)
+
+    def _index_remove_oldest(self, log: Dict):
+        """移除最旧的一条日志（它一定在各索引列表的开头）"""
+        for field in INDEXED_FIELDS:
+            bucket = self._index[field].get(log.get(field))
+            if bucket and bucket[0] is log:
+                bucket.pop(0)
+                if not bucket:
+                    del self._index[field][log.get(field)]
+
     def _save_logs(self):
         """保存日志"""
         os.makedirs(ACCOUNTS_DIR, exist_ok=True)
@@ -51,6 +91,7 @@ class LogManager:
         """
         now_iso = datetime.now().isoformat()
         log = {
+            "id": self._next_id,
             "time": now_iso,
             "timestamp": now_iso,  # 前端使用的字段名
             "action": sanitize_log_text(action),
@@ -59,15 +100,24 @@ class LogManager:
             "level": level
         }
 
+        self._next_id += 1
         self.logs.append(log)
+        self._index_add(log)
+        metrics.log_writes.inc(level=level)
 
         # 限制日志数量
-        if len(self.logs) > MAX_LOGS:
-            self.logs = self.logs[-MAX_LOGS:]
+        while len(self.logs) > MAX_LOGS:
+            self._index_remove_oldest(self.logs.pop(0))
 
         self._save_logs()
 
-    def get_logs(self, limit: int = 100, account: str = None, action: str = None) -> List[Dict]:
+        for listener in self._listeners:
+            try:
+                listener(log)
+            except Exception as e:
+                print(f"日志推送失败: {e}")
+
+    def get_logs(self, limit: int = 100, account: str = None, action: str = None, level: str = None) -> List[Dict]:
         """
         获取日志
 
@@ -75,20 +125,85 @@ class LogManager:
             limit: 返回数量
             account: 筛选账号
             action: 筛选操作类型
+            level: 筛选日志级别
 
         Returns:
             日志列表（倒序）
         """
-        logs = self.logs
+        if limit <= 0:
+            return []
+        page, _, _ = self.query_logs(limit=min(limit, MAX_LOGS), account=account, action=action, level=level)
+        return page
+
+    def _candidates(self, filters: Dict[str, str]) -> Tuple[List[Dict], Dict[str, str]]:
+        """
+        选出最小的候选列表
+
+        Returns:
+            (按 id 升序的候选日志, 还需逐条检查的筛选条件)
+        """
+        filters = {field: value for field, value in filters.items() if value}
+        if not filters:
+            return self.logs, {}
+        field = min(filters, key=lambda f: len(self._index[f].get(filters[f], ())))
+        rest = {f: v for f, v in filters.items() if f != field}
+        return self._index[field].get(filters[field], []), rest
 
-        # 筛选
-        if account:
-            logs = [log for log in logs if log.get("account") == account]
-        if action:
-            logs = [log for log in logs if log.get("action") == action]
+    def query_logs(
+        self,
+        limit: int = 100,
+        cursor: str = None,
+        account: str = None,
+        action: str = None,
+        level: str = None
+    ) -> Tuple[List[Dict], Optional[str], int]:
+        """
+        分页查询日志（最新的在前）
+
+        Args:
+            limit: 每页条数
+            cursor: 上一页返回的游标
+            account: 筛选账号
+            action: 筛选操作类型
+            level: 筛选日志级别
+
+        Returns:
+            (本页日志, 下一页游标, 符合条件的总数)
 
-        # 倒序并限制数量（返回最新的记录）
-        return list(reversed(logs))[:limit]
+        Raises:
+            ValueError: 游标或 limit 无效
+        """
+        if limit < 1 or limit > MAX_LOGS:
+            raise ValueError(f"limit 必须在 1 到 {MAX_LOGS} 之间")
+
+        candidates, rest = self._candidates({"account": account, "action": action, "level": level})
+
+        # 候选列表按 id 升序，游标之前的位置二分查找
+        end = len(candidates)
+        if cursor:
+            before_id = decode_cursor(cursor)[0]
+            if not isinstance(before_id, int):
+                raise ValueError("无效的游标")
+            end = bisect.bisect_left(candidates, before_id, key=lambda log: log["id"])
+
+        page = []
+        for i in range(end - 1, -1, -1):
+            log = candidates[i]
+            if all(log.get(field) == value for field, value in rest.items()):
+                page.append(log)
+                if len(page) > limit:
+                    break
+
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_cursor((page[-1]["id"],))
+
+        if rest:
+            total = sum(1 for log in candidates if all(log.get(f) == v for f, v in rest.items()))
+        else:
+            total = len(candidates)
+        return page, next_cursor, total
 
     def clear_logs(self, before: str = None) -> int:
         """
@@ -111,6 +226,7 @@ class LogManager:
             cleared = len(self.logs)
             self.logs = []
 
+        self._rebuild_index()
         self._save_logs()
         return cleared
 
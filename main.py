@@ -6,24 +6,35 @@ import os
 import sys
 import json
 import asyncio
+import heapq
 import logging
 import nest_asyncio
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from enum import Enum
 from typing import List, Dict, Optional, Union, Any
 
 from dotenv import load_dotenv
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
 from mcp.types import ToolAnnotations
-from telethon import TelegramClient, functions, utils
+from telethon import TelegramClient, functions, types, utils
+from telethon.errors import FileReferenceExpiredError, FileReferenceInvalidError, FloodWaitError, ServerError
 from telethon.sessions import StringSession
 from telethon.tl.types import (
     User, Chat, Channel,
     ChatAdminRights, ChatBannedRights,
     ChannelParticipantsAdmins, ChannelParticipantsKicked,
     InputChatPhotoEmpty,
+    InputMessagesFilterDocument, InputMessagesFilterGif, InputMessagesFilterMusic,
+    InputMessagesFilterPhotos, InputMessagesFilterPhotoVideo, InputMessagesFilterRoundVideo,
+    InputMessagesFilterUrl, InputMessagesFilterVideo, InputMessagesFilterVoice,
 )
 from security import decrypt_session, encrypt_session, mask_phone, validate_export_path, validate_file_path
+import metrics
+from backup_store import BackupStore
+from concurrency import RateLimiter, gather_bounded
+from media_cache import media_cache, media_key
+from message_archive import ARCHIVE_ENABLED, message_archive
+from upload_cache import upload_cache
 
 load_dotenv()
 
@@ -31,6 +42,12 @@ load_dotenv()
 API_ID = int(os.getenv("TELEGRAM_API_ID", "2040"))
 API_HASH = os.getenv("TELEGRAM_API_HASH", "b18441a1ff607e10a989891a5462e627")
 SESSION_FILE = os.getenv("SESSION_FILE", ".telegram_session")
+BACKUP_CONCURRENCY = int(os.getenv("TELEGRAM_MCP_BACKUP_CONCURRENCY", "8"))  # 备份并发聊天数
+BACKUP_RATE = float(os.getenv("TELEGRAM_MCP_BACKUP_RATE", "10"))  # 备份时每秒最多请求数
+DOWNLOAD_CONCURRENCY = int(os.getenv("TELEGRAM_MCP_DOWNLOAD_CONCURRENCY", "4"))  # 批量下载并行文件数
+ALBUM_UPLOAD_CONCURRENCY = int(os.getenv("TELEGRAM_MCP_ALBUM_UPLOAD_CONCURRENCY", "4"))  # 相册并行上传文件数
+UPLOAD_RETRIES = 3  # 单个文件上传失败的最大尝试次数
+MAX_FLOOD_WAIT = 60  # 上传遇到 FloodWait 时最多等待的秒数，超过则放弃
 
 # 允许嵌套事件循环
 nest_asyncio.apply()
@@ -83,6 +100,8 @@ def log_and_format_error(
         prefix_str = prefix.value if isinstance(prefix, ErrorCategory) else (prefix or "GEN")
         error_code = f"{prefix_str}-ERR-{abs(hash(function_name)) % 1000:03d}"
 
+    metrics.record_error(function_name, error)
+
     context = ", ".join(f"{k}={v}" for k, v in kwargs.items())
     logger.error(f"Error in {function_name} ({context}) - Code: {error_code}", exc_info=True)
 
@@ -137,6 +156,9 @@ async def get_client() -> TelegramClient:
             API_ID,
             API_HASH
         )
+        if ARCHIVE_ENABLED:
+            # 新消息、编辑、删除实时写入本地存档
+            message_archive.attach(client)
 
     if not client.is_connected():
         await client.connect()
@@ -179,6 +201,241 @@ def get_sender_name(message) -> str:
     return "Unknown"
 
 
+async def sync_archive(c: TelegramClient, entity, min_count: int = 0, start: bool = True) -> Optional[int]:
+    """
+    增量同步本地消息存档
+
+    Args:
+        c: Telegram Client
+        entity: 聊天实体
+        min_count: 需要的最新消息数
+        start: 聊天还没有存档时是否开始存档（搜索类工具传 False，只使用已有存档）
+
+    Returns:
+        聊天ID；存档关闭、未存档或同步失败时返回 None，调用方改为直接请求 Telegram
+    """
+    if not ARCHIVE_ENABLED:
+        return None
+    chat_id = utils.get_peer_id(entity)
+    archive = message_archive.get()
+    if not start and not archive.get_state(chat_id):
+        return None
+    try:
+        await archive.sync_chat(c, entity, min_count)
+    except Exception as e:
+        logger.warning(f"本地存档同步失败，改为直接请求: {e}")
+        return None
+    return chat_id
+
+
+def parse_day(date: str) -> datetime:
+    """解析 YYYY-MM-DD 为当天 0 点（UTC，与 message.date 一致）"""
+    return datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+
+
+async def iter_messages_between(
+    c: TelegramClient,
+    entity,
+    start: datetime,
+    end: datetime,
+    newest_first: bool = False,
+    limit: Optional[int] = None
+):
+    """
+    逐条获取 [start, end) 时间范围内的消息
+
+    用 offset_date 让服务端直接定位到范围的一端，越过另一端立即停止，
+    不需要从最新消息开始扫描；按页拉取，内存占用与范围大小无关。
+
+    Args:
+        c: Telegram Client
+        entity: 聊天实体
+        start: 起始时间（含）
+        end: 结束时间（不含）
+        newest_first: True 从 end 往前（新的在前），False 从 start 往后（按时间顺序）
+        limit: 最多返回条数
+    """
+    if newest_first:
+        async for message in c.iter_messages(entity, offset_date=end, limit=limit):
+            if message.date < start:
+                break
+            yield message
+    else:
+        # reverse 时 offset_date 不含边界，恰好在 start 发出的消息会被跳过：往前多取一秒，再在本地滤掉
+        count = 0
+        async for message in c.iter_messages(entity, offset_date=start - timedelta(seconds=1), reverse=True):
+            if message.date < start:
+                continue
+            if message.date >= end or (limit is not None and count >= limit):
+                break
+            yield message
+            count += 1
+
+
+# 服务端消息类型过滤器：只返回匹配的消息，不需要拉取全部消息再在本地筛选
+MESSAGE_FILTERS = {
+    "photos": InputMessagesFilterPhotos,
+    "videos": InputMessagesFilterVideo,
+    "photo_video": InputMessagesFilterPhotoVideo,
+    "audios": InputMessagesFilterMusic,
+    "voices": InputMessagesFilterVoice,
+    "round_videos": InputMessagesFilterRoundVideo,
+    "gifs": InputMessagesFilterGif,
+    "files": InputMessagesFilterDocument,
+    "links": InputMessagesFilterUrl,
+}
+# search_media 的“全部媒体”：Telegram 没有对应的单个过滤器，合并这几类的结果
+ALL_MEDIA_FILTERS = ("photo_video", "files", "audios", "voices", "round_videos")
+
+
+async def fetch_filtered_messages(
+    c: TelegramClient,
+    entity,
+    filter_types: List[str],
+    limit: int,
+    offset_id: int = 0
+) -> tuple:
+    """
+    按类型从服务端获取消息（新的在前），多个类型并发请求后按消息ID合并去重
+
+    Args:
+        c: Telegram Client
+        entity: 聊天实体
+        filter_types: MESSAGE_FILTERS 中的类型
+        limit: 本页条数
+        offset_id: 游标，只返回ID小于它的消息（0 表示从最新开始）
+
+    Returns:
+        (消息列表, 下一页 offset_id，没有更多时为 None)
+    """
+    async def fetch(filter_type: str) -> list:
+        # 多取一条用于判断是否还有下一页
+        return [
+            message async for message in c.iter_messages(
+                entity, limit=limit + 1, offset_id=offset_id, filter=MESSAGE_FILTERS[filter_type]
+            )
+        ]
+
+    merged = {}
+    for messages in await asyncio.gather(*(fetch(filter_type) for filter_type in filter_types)):
+        for message in messages:
+            merged[message.id] = message
+
+    page = heapq.nlargest(limit + 1, merged.values(), key=lambda message: message.id)
+    if len(page) > limit:
+        page = page[:limit]
+        return page, page[-1].id
+    return page, None
+
+
+EXPORT_FLUSH_EVERY = 500  # 导出时每写入多少条消息刷盘并保存一次游标
+HISTORY_PAGE_SIZE = 100  # iter_messages 每次请求拉取的消息数
+
+
+def _save_export_cursor(path: str, state: Dict[str, Any]):
+    """原子写入导出游标、备份清单等 JSON 状态（先写临时文件再替换）"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+async def export_messages_jsonl(
+    c: TelegramClient,
+    entity,
+    output: str,
+    limit: Optional[int] = None,
+    resume: bool = True,
+    rate_limiter: Optional[RateLimiter] = None
+) -> Dict[str, Any]:
+    """
+    按时间顺序把聊天消息流式写入 JSONL 文件（每行一条），内存占用恒定
+
+    每写入 EXPORT_FLUSH_EVERY 条刷盘一次，并在 <output>.cursor 中记录最后一条消息ID和文件长度。
+    中断后再次调用会先截掉游标之后未确认的内容，再从最后一条消息之后继续；
+    导出完成后再次调用只追加新消息。首次导出指定 limit 时导出最新的 limit 条（更早的消息不导出）。
+
+    Args:
+        c: Telegram Client
+        entity: 聊天实体
+        output: 输出文件路径
+        limit: 本次最多导出的消息数（None 表示全部）；首次导出时为最新的 limit 条，之后为游标之后最早的 limit 条
+        resume: 是否从上次的游标继续，False 则重新导出
+        rate_limiter: 请求限速器，每拉取一页消息前取一个令牌
+
+    Returns:
+        {"written": 本次写入条数, "total": 文件中总条数, "last_id": 最后一条消息ID, "done": 是否已导出到最新}
+    """
+    cursor_path = f"{output}.cursor"
+    chat_id = utils.get_peer_id(entity)
+
+    state = None
+    if resume and os.path.exists(cursor_path) and os.path.exists(output):
+        with open(cursor_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("chat_id") != chat_id or os.path.getsize(output) < state.get("offset", 0):
+            state = None
+    if state is None:
+        state = {"chat_id": chat_id, "last_id": 0, "total": 0, "offset": 0}
+
+    written = 0
+    done = True
+    with open(output, "r+b" if state["offset"] else "wb") as f:
+        # 丢弃上次中断时写入但未记录进游标的部分
+        f.seek(state["offset"])
+        f.truncate()
+
+        if state["total"] == 0 and limit is not None:
+            # 首次导出且限制了条数：和以前一样导出最新的 limit 条，从第 limit+1 新的消息之后开始
+            if rate_limiter:
+                await rate_limiter.acquire()
+            older = await c.get_messages(entity, limit=1, add_offset=limit)
+            if older:
+                state["last_id"] = older[0].id
+
+        if rate_limiter:
+            await rate_limiter.acquire()
+        # 多取一条，只有确实还有剩余消息时才报告未完成
+        fetch_limit = None if limit is None else limit + 1
+        async for message in c.iter_messages(entity, min_id=state["last_id"], reverse=True, limit=fetch_limit):
+            if limit is not None and written >= limit:
+                done = False
+                break
+            if rate_limiter and written and written % HISTORY_PAGE_SIZE == 0:
+                await rate_limiter.acquire()
+            f.write((json.dumps(message_to_record(message), ensure_ascii=False) + "\n").encode("utf-8"))
+            written += 1
+            state["last_id"] = message.id
+            state["total"] += 1
+
+            if written % EXPORT_FLUSH_EVERY == 0:
+                f.flush()
+                os.fsync(f.fileno())
+                state["offset"] = f.tell()
+                _save_export_cursor(cursor_path, state)
+
+        f.flush()
+        os.fsync(f.fileno())
+        state["offset"] = f.tell()
+
+    state["done"] = done
+    state["updated_at"] = datetime.now().isoformat()
+    _save_export_cursor(cursor_path, state)
+    return {"written": written, "total": state["total"], "last_id": state["last_id"], "done": done}
+
+
+def message_to_record(message) -> Dict[str, Any]:
+    """消息转为可 JSON 序列化的记录（导出用）"""
+    return {
+        "id": message.id,
+        "date": message.date.isoformat() if message.date else None,
+        "sender_id": message.sender_id,
+        "text": message.message,
+        "reply_to": message.reply_to.reply_to_msg_id if message.reply_to else None,
+        "media_type": type(message.media).__name__ if message.media else None
+    }
+
+
 # ============================================================================
 # 聊天管理工具
 # ============================================================================
@@ -368,8 +625,10 @@ async def send_message(
         c = await get_client()
         entity = await c.get_entity(chat_id)
         await c.send_message(entity, message, parse_mode=parse_mode)
+        metrics.messages_sent.inc(source="mcp")
         return f"✅ 消息已发送到 {chat_id}"
     except Exception as e:
+        metrics.message_failures.inc(source="mcp")
         return log_and_format_error("send_message", e, chat_id=chat_id)
 
 
@@ -389,7 +648,21 @@ async def get_messages(
     try:
         c = await get_client()
         entity = await c.get_entity(chat_id)
-        messages = await c.get_messages(entity, limit=limit, offset=offset)
+
+        archived_chat = await sync_archive(c, entity, min_count=limit + offset)
+        if archived_chat is not None:
+            archived = message_archive.get().latest(archived_chat, limit, offset)
+            if not archived:
+                return "没有找到消息"
+            lines = []
+            for msg in archived:
+                date = msg["date"].strftime("%H:%M")
+                content = msg["text"] or "[媒体/无文本]"
+                reply_info = f" ↩️{msg['reply_to']}" if msg["reply_to"] else ""
+                lines.append(f"[{date}] {msg['sender_name']}{reply_info}: {content}")
+            return "\n".join(reversed(lines))
+
+        messages = await c.get_messages(entity, limit=limit, add_offset=offset)
 
         if not messages:
             return "没有找到消息"
@@ -570,6 +843,19 @@ async def search_messages(
     try:
         c = await get_client()
         entity = await c.get_entity(chat_id)
+
+        # 已完整存档的聊天直接在本地搜索
+        archived_chat = await sync_archive(c, entity, start=False)
+        if archived_chat is not None and message_archive.get().covers(archived_chat):
+            archived = message_archive.get().query(archived_chat, limit, text=query)
+            if not archived:
+                return f"未找到包含 '{query}' 的消息"
+            lines = [f"🔍 搜索 '{query}' 的结果:"]
+            for msg in archived:
+                date = msg["date"].strftime("%Y-%m-%d %H:%M")
+                lines.append(f"[{date}] {msg['sender_name']}: {msg['text'] or '[媒体]'}")
+            return "\n".join(lines)
+
         messages = await c.get_messages(entity, limit=limit, search=query)
 
         if not messages:
@@ -1204,6 +1490,44 @@ async def create_poll(
 # 媒体文件操作工具 (8个)
 # ============================================================================
 
+async def cache_upload(c: TelegramClient, file_path: str, kind: str, message):
+    """记录刚上传的媒体，缓存失败不影响发送结果"""
+    try:
+        await upload_cache.put(c, file_path, kind, message)
+    except Exception as e:
+        logger.warning(f"记录上传缓存失败: {e}")
+
+
+async def send_cached_file(c: TelegramClient, entity, file_path: str, kind: str, **kwargs):
+    """
+    发送本地文件，同一账号发送过的相同内容直接引用已上传的媒体，不再重新上传
+
+    文件引用过期时通过原消息刷新引用后重发；原消息已不存在则重新上传。
+
+    Args:
+        c: Telegram Client
+        entity: 聊天实体
+        file_path: 已校验的本地文件路径
+        kind: 发送方式（photo、video、document、sticker、gif），决定缓存的区分
+        **kwargs: 传给 send_file 的参数
+
+    Returns:
+        发送的消息
+    """
+    media = await upload_cache.get(c, file_path, kind)
+    if media is not None:
+        try:
+            return await c.send_file(entity, media, **kwargs)
+        except (FileReferenceExpiredError, FileReferenceInvalidError):
+            media = await upload_cache.refresh(c, file_path, kind)
+            if media is not None:
+                return await c.send_file(entity, media, **kwargs)
+
+    message = await c.send_file(entity, file_path, **kwargs)
+    await cache_upload(c, file_path, kind, message)
+    return message
+
+
 @mcp.tool(annotations=ToolAnnotations(title="发送图片", openWorldHint=True, destructiveHint=True))
 async def send_photo(
     chat_id: Union[int, str],
@@ -1221,7 +1545,7 @@ async def send_photo(
         file_path = validate_file_path(file_path, must_exist=True)
         c = await get_client()
         entity = await c.get_entity(chat_id)
-        await c.send_file(entity, file_path, caption=caption)
+        await send_cached_file(c, entity, file_path, "photo", caption=caption)
         return f"✅ 图片已发送"
     except Exception as e:
         return log_and_format_error("send_photo", e, chat_id=chat_id)
@@ -1244,7 +1568,7 @@ async def send_video(
         file_path = validate_file_path(file_path, must_exist=True)
         c = await get_client()
         entity = await c.get_entity(chat_id)
-        await c.send_file(entity, file_path, caption=caption, supports_streaming=True)
+        await send_cached_file(c, entity, file_path, "video", caption=caption, supports_streaming=True)
         return f"✅ 视频已发送"
     except Exception as e:
         return log_and_format_error("send_video", e, chat_id=chat_id)
@@ -1267,7 +1591,7 @@ async def send_document(
         file_path = validate_file_path(file_path, must_exist=True)
         c = await get_client()
         entity = await c.get_entity(chat_id)
-        await c.send_file(entity, file_path, caption=caption, force_document=True)
+        await send_cached_file(c, entity, file_path, "document", caption=caption, force_document=True)
         return f"✅ 文件已发送"
     except Exception as e:
         return log_and_format_error("send_document", e, chat_id=chat_id)
@@ -1341,38 +1665,132 @@ async def download_media(
             return "❌ 消息不包含媒体文件"
 
         safe_path = validate_export_path(save_path, f"telegram_media_{chat_id}_{message_id}")
-        path = await c.download_media(message.media, file=safe_path)
-        return f"✅ 媒体已下载到: {path}"
+        if media_key(message.media) is None:
+            path = await c.download_media(message.media, file=safe_path)
+            return f"✅ 媒体已下载到: {path}"
+
+        path, cached = await fetch_cached_media(c, entity, message, safe_path)
+        return f"✅ 媒体已下载到: {path}" + ("（缓存）" if cached else "")
     except Exception as e:
         return log_and_format_error("download_media", e, chat_id=chat_id)
 
 
+async def fetch_cached_media(c: TelegramClient, entity, message, dest: str = None):
+    """
+    通过媒体缓存下载消息中的媒体，文件引用过期时重新获取消息后继续（已下载的分片保留）
+
+    Args:
+        c: Telegram Client
+        entity: 聊天实体
+        message: 消息
+        dest: 目标路径（不含扩展名时自动补上）
+
+    Returns:
+        (目标文件路径, 是否命中缓存)
+    """
+    try:
+        cached_path, cached = await media_cache.fetch(c, message.media)
+    except FileReferenceExpiredError:
+        message = await c.get_messages(entity, ids=message.id)
+        if not message or not message.media:
+            raise ValueError("消息已不包含媒体文件")
+        cached_path, cached = await media_cache.fetch(c, message.media)
+
+    if dest is None:
+        return cached_path, cached
+    if not os.path.splitext(dest)[1]:
+        dest += os.path.splitext(cached_path)[1]
+    return await asyncio.to_thread(media_cache.materialize, cached_path, dest), cached
+
+
+@mcp.tool(annotations=ToolAnnotations(title="批量下载媒体", openWorldHint=True, destructiveHint=False))
+async def download_media_batch(
+    chat_id: Union[int, str],
+    message_ids: List[int],
+    output_dir: str = "",
+    concurrency: int = DOWNLOAD_CONCURRENCY
+) -> str:
+    """并行下载多条消息中的媒体文件
+
+    文件按固定大小分片并行下载，中断后再次调用只下载缺失的分片；
+    已下载过的文件（按文件ID和内容哈希缓存）直接复用，不再请求 Telegram。
+
+    Args:
+        chat_id: 聊天 ID
+        message_ids: 消息 ID 列表
+        output_dir: 保存目录（可选，默认 exports/media_<chat_id>）
+        concurrency: 同时下载的文件数
+    """
+    try:
+        if not message_ids:
+            raise ValueError("message_ids 不能为空")
+
+        output_dir = validate_export_path(output_dir, f"media_{chat_id}")
+        os.makedirs(output_dir, exist_ok=True)
+
+        c = await get_client()
+        entity = await c.get_entity(chat_id)
+        messages = await c.get_messages(entity, ids=list(message_ids))
+        found = {message.id: message for message in messages if message and message.media}
+
+        async def download_one(message):
+            dest = os.path.join(output_dir, f"{message.id}")
+            if media_key(message.media) is None:
+                return await c.download_media(message.media, file=dest), False
+            return await fetch_cached_media(c, entity, message, dest)
+
+        targets = [found[message_id] for message_id in message_ids if message_id in found]
+        results = await gather_bounded(targets, download_one, concurrency=concurrency)
+
+        lines = []
+        downloaded = hits = failed = 0
+        for message, result in zip(targets, results):
+            if isinstance(result, Exception):
+                failed += 1
+                lines.append(f"❌ {message.id}: {result}")
+                continue
+            path, cached = result
+            hits += cached
+            downloaded += not cached
+            lines.append(f"✅ {message.id}: {path}" + ("（缓存）" if cached else ""))
+        for message_id in message_ids:
+            if message_id not in found:
+                lines.append(f"⚠️ {message_id}: 消息不存在或不包含媒体")
+
+        header = f"下载完成: {downloaded} 个新下载，{hits} 个命中缓存，{failed} 个失败 → {output_dir}"
+        return "\n".join([header] + lines)
+    except ValueError as e:
+        return f"❌ {e}"
+    except Exception as e:
+        return log_and_format_error("download_media_batch", e, chat_id=chat_id)
+
+
 @mcp.tool(annotations=ToolAnnotations(title="获取聊天图片", openWorldHint=True, readOnlyHint=True))
 async def get_chat_photos(
     chat_id: Union[int, str],
-    limit: int = 20
+    limit: int = 20,
+    offset_id: int = 0
 ) -> str:
     """获取聊天中的所有图片
 
     Args:
         chat_id: 聊天 ID
         limit: 最大数量
+        offset_id: 分页游标（上一页返回的 offset_id，0 表示从最新开始）
     """
     try:
         c = await get_client()
         entity = await c.get_entity(chat_id)
 
-        photos = []
-        async for message in c.iter_messages(entity, limit=limit):
-            if message.photo:
-                photos.append(f"📷 图片 {message.id}")
-            if len(photos) >= limit:
-                break
+        messages, next_offset = await fetch_filtered_messages(c, entity, ["photos"], limit, offset_id)
+        photos = [f"📷 图片 {message.id}" for message in messages]
 
         if not photos:
             return "没有找到图片"
 
-        return "\n".join(photos[:limit])
+        if next_offset:
+            photos.append(f"下一页 offset_id: {next_offset}")
+        return "\n".join(photos)
     except Exception as e:
         return log_and_format_error("get_chat_photos", e, chat_id=chat_id)
 
@@ -1892,26 +2310,31 @@ async def terminate_session(
 @mcp.tool(annotations=ToolAnnotations(title="搜索媒体文件", openWorldHint=True, readOnlyHint=True))
 async def search_media(
     chat_id: Union[int, str],
-    limit: int = 20
+    limit: int = 20,
+    media_type: str = "all",
+    offset_id: int = 0
 ) -> str:
     """搜索聊天中的媒体文件
 
     Args:
         chat_id: 聊天 ID
         limit: 最大数量
+        media_type: 媒体类型 all/photos/videos/photo_video/audios/voices/round_videos/gifs/files
+        offset_id: 分页游标（上一页返回的 offset_id，0 表示从最新开始）
     """
     try:
+        if media_type != "all" and media_type not in MESSAGE_FILTERS:
+            return f"❌ 不支持的媒体类型: {media_type}，可选 all/{'/'.join(MESSAGE_FILTERS)}"
+
         c = await get_client()
         entity = await c.get_entity(chat_id)
 
-        media_files = []
-        async for message in c.iter_messages(entity, limit=limit):
-            if message.media:
-                media_type = type(message.media).__name__
-                media_files.append(f"📎 {media_type} (ID: {message.id})")
-            if len(media_files) >= limit:
-                break
+        filter_types = list(ALL_MEDIA_FILTERS) if media_type == "all" else [media_type]
+        messages, next_offset = await fetch_filtered_messages(c, entity, filter_types, limit, offset_id)
+        media_files = [f"📎 {type(message.media).__name__} (ID: {message.id})" for message in messages]
 
+        if media_files and next_offset:
+            media_files.append(f"下一页 offset_id: {next_offset}")
         return "\n".join(media_files) if media_files else "没有找到媒体文件"
     except Exception as e:
         return log_and_format_error("search_media", e, chat_id=chat_id)
@@ -1921,35 +2344,34 @@ async def search_media(
 async def filter_messages(
     chat_id: Union[int, str],
     filter_type: str,
-    limit: int = 20
+    limit: int = 20,
+    offset_id: int = 0
 ) -> str:
-    """按类型过滤消息
+    """按类型过滤消息（由服务端过滤，limit 是匹配的消息数）
 
     Args:
         chat_id: 聊天 ID
-        filter_type: 过滤类型 (photos/videos/audios/files/links)
+        filter_type: 过滤类型 (photos/videos/photo_video/audios/voices/round_videos/gifs/files/links)
         limit: 最大数量
+        offset_id: 分页游标（上一页返回的 offset_id，0 表示从最新开始）
     """
     try:
+        if filter_type not in MESSAGE_FILTERS:
+            return f"❌ 不支持的过滤类型: {filter_type}，可选 {'/'.join(MESSAGE_FILTERS)}"
+
         c = await get_client()
         entity = await c.get_entity(chat_id)
 
-        filtered = []
-        async for message in c.iter_messages(entity, limit=limit):
-            if filter_type == "photos" and message.photo:
-                filtered.append(f"📷 图片 (ID: {message.id})")
-            elif filter_type == "videos" and message.video:
-                filtered.append(f"🎬 视频 (ID: {message.id})")
-            elif filter_type == "audios" and message.audio:
-                filtered.append(f"🎵 音频 (ID: {message.id})")
-            elif filter_type == "files" and message.document:
-                filtered.append(f"📄 文件 (ID: {message.id})")
-            elif filter_type == "links" and message.entities:
-                filtered.append(f"🔗 链接 (ID: {message.id})")
-
-            if len(filtered) >= limit:
-                break
+        labels = {
+            "photos": "📷 图片", "videos": "🎬 视频", "photo_video": "🖼️ 图片/视频",
+            "audios": "🎵 音频", "voices": "🎤 语音", "round_videos": "⏺️ 圆形视频",
+            "gifs": "🎞️ GIF", "files": "📄 文件", "links": "🔗 链接",
+        }
+        messages, next_offset = await fetch_filtered_messages(c, entity, [filter_type], limit, offset_id)
+        filtered = [f"{labels[filter_type]} (ID: {message.id})" for message in messages]
 
+        if filtered and next_offset:
+            filtered.append(f"下一页 offset_id: {next_offset}")
         return "\n".join(filtered) if filtered else f"没有找到{filter_type}"
     except Exception as e:
         return log_and_format_error("filter_messages", e, chat_id=chat_id)
@@ -1970,6 +2392,13 @@ async def get_history(
         c = await get_client()
         entity = await c.get_entity(chat_id)
 
+        archived_chat = await sync_archive(c, entity, min_count=limit)
+        if archived_chat is not None:
+            return "\n".join(
+                f"{msg['sender_name']}: {(msg['text'] or '[媒体文件]')[:100]}"
+                for msg in message_archive.get().latest(archived_chat, limit)
+            )
+
         messages = []
         async for message in c.iter_messages(entity, limit=limit):
             sender = get_sender_name(message)
@@ -2452,7 +2881,7 @@ async def send_sticker(chat_id: Union[int, str], file_path: str) -> str:
         c = await get_client()
         entity = await c.get_entity(chat_id)
 
-        await c.send_file(entity, file_path)
+        await send_cached_file(c, entity, file_path, "sticker")
 
         return f"✅ 贴纸已发送"
     except Exception as e:
@@ -2482,9 +2911,11 @@ async def send_gif(chat_id: Union[int, str], file_path: str, caption: str = "")
         c = await get_client()
         entity = await c.get_entity(chat_id)
 
-        await c.send_file(
+        await send_cached_file(
+            c,
             entity,
             file_path,
+            "gif",
             caption=caption,
             attributes=[types.DocumentAttributeAnimated()]
         )
@@ -2583,6 +3014,48 @@ async def send_game(chat_id: Union[int, str], bot_id: Union[int, str], game_shor
         return log_and_format_error("send_game", e, chat_id=chat_id)
 
 
+async def upload_album_item(c: TelegramClient, peer, file_path: str, progress=None):
+    """
+    上传相册中的一个文件，并通过 messages.uploadMedia 转换为可直接放进相册的 InputPhoto / InputDocument
+
+    网络错误、服务器错误和较短的 FloodWait 会重试，最多 UPLOAD_RETRIES 次。
+
+    Args:
+        c: Telegram Client
+        peer: 目标聊天的 InputPeer
+        file_path: 本地文件路径
+        progress: 上传进度回调 progress(已上传字节数, 总字节数)
+    """
+    is_image = utils.is_image(file_path)
+    for attempt in range(1, UPLOAD_RETRIES + 1):
+        try:
+            uploaded = await c.upload_file(file_path, progress_callback=progress)
+            if is_image:
+                result = await c(functions.messages.UploadMediaRequest(
+                    peer=peer, media=types.InputMediaUploadedPhoto(file=uploaded)
+                ))
+                return utils.get_input_photo(result.photo)
+
+            # 流式播放标记只对视频有意义；不设 nosound_video，否则有声视频会被当成 GIF 式动图
+            attributes, mime_type = utils.get_attributes(file_path, supports_streaming=utils.is_video(file_path))
+            result = await c(functions.messages.UploadMediaRequest(
+                peer=peer,
+                media=types.InputMediaUploadedDocument(
+                    file=uploaded, mime_type=mime_type, attributes=attributes
+                )
+            ))
+            return utils.get_input_document(result.document)
+        except FloodWaitError as e:
+            if attempt == UPLOAD_RETRIES or e.seconds > MAX_FLOOD_WAIT:
+                raise
+            await asyncio.sleep(e.seconds)
+        except (ConnectionError, asyncio.TimeoutError, ServerError) as e:
+            if attempt == UPLOAD_RETRIES:
+                raise
+            logger.warning(f"上传 {os.path.basename(file_path)} 失败（第 {attempt} 次）: {e}")
+            await asyncio.sleep(2 ** attempt)
+
+
 @mcp.tool(
     annotations=ToolAnnotations(
         title="发送媒体组",
@@ -2593,10 +3066,14 @@ async def send_game(chat_id: Union[int, str], bot_id: Union[int, str], game_shor
 async def send_media_group(
     chat_id: Union[int, str],
     file_paths: list,
-    caption: str = ""
+    caption: str = "",
+    ctx: Context = None
 ) -> str:
     """发送媒体组（相册形式）
 
+    未缓存的文件先并行上传（每个文件失败单独重试），全部就绪后一次发送整个相册；
+    发送过的文件直接复用已上传的媒体。
+
     Args:
         chat_id: 聊天ID
         file_paths: 文件路径列表
@@ -2608,14 +3085,68 @@ async def send_media_group(
     try:
         c = await get_client()
         entity = await c.get_entity(chat_id)
+        peer = await c.get_input_entity(entity)
 
         files = []
         for path in file_paths:
             files.append(validate_file_path(path, must_exist=True))
 
-        await c.send_file(entity, files, caption=caption)
+        media = [await upload_cache.get(c, path, "album") for path in files]
+        from_cache = [item is not None for item in media]
+
+        async def upload_missing():
+            missing = [i for i, item in enumerate(media) if item is None]
+            if not missing:
+                return []
+            sizes = {i: os.path.getsize(files[i]) for i in missing}
+            total = sum(sizes.values())
+            sent = dict.fromkeys(missing, 0)
+            reports = []
+            last_percent = [-1]
+
+            def progress_for(i):
+                def callback(current, _):
+                    sent[i] = current
+                    percent = int(sum(sent.values()) * 100 / total) if total else 100
+                    if ctx is not None and percent != last_percent[0]:
+                        last_percent[0] = percent
+                        reports.append(asyncio.ensure_future(ctx.report_progress(
+                            sum(sent.values()), total, f"正在上传 {len(missing)} 个文件"
+                        )))
+                return callback
+
+            async def upload(i):
+                media[i] = await upload_album_item(c, peer, files[i], progress_for(i))
+
+            results = await gather_bounded(missing, upload, concurrency=ALBUM_UPLOAD_CONCURRENCY)
+            await asyncio.gather(*reports, return_exceptions=True)
+            return [
+                f"{os.path.basename(files[i])}: {result}"
+                for i, result in zip(missing, results) if isinstance(result, Exception)
+            ]
+
+        failures = await upload_missing()
+        if failures:
+            return f"❌ {len(failures)} 个文件上传失败，相册未发送:\n" + "\n".join(failures)
 
-        return f"✅ 媒体组已发送（{len(files)}个文件）"
+        try:
+            messages = await c.send_file(entity, media, caption=caption)
+        except (FileReferenceExpiredError, FileReferenceInvalidError):
+            for i, path in enumerate(files):
+                if from_cache[i]:
+                    media[i] = await upload_cache.refresh(c, path, "album")
+                    from_cache[i] = media[i] is not None
+            failures = await upload_missing()
+            if failures:
+                return f"❌ {len(failures)} 个文件上传失败，相册未发送:\n" + "\n".join(failures)
+            messages = await c.send_file(entity, media, caption=caption)
+
+        for path, cached, message in zip(files, from_cache, messages):
+            if not cached:
+                await cache_upload(c, path, "album", message)
+
+        reused = sum(from_cache)
+        return f"✅ 媒体组已发送（{len(files)}个文件" + (f"，{reused}个复用已上传的媒体）" if reused else "）")
     except Exception as e:
         return log_and_format_error("send_media_group", e, chat_id=chat_id)
 
@@ -2632,14 +3163,19 @@ async def send_media_group(
 async def export_chat(
     chat_id: Union[int, str],
     output_path: str = "",
-    limit: int = 1000
+    limit: Optional[int] = 1000,
+    resume: bool = True
 ) -> str:
-    """导出聊天记录为JSON格式
+    """导出聊天记录为 JSONL 格式（每行一条消息，按时间顺序）
+
+    首次导出最新的 limit 条消息（limit 为 None 时导出全部历史）。边获取边写入，内存占用与聊天大小无关；
+    中断后再次调用会从上次导出的最后一条消息继续，已导出完成的文件再次调用只追加新消息。
 
     Args:
         chat_id: 聊天ID
         output_path: 输出文件路径（可选）
-        limit: 导出消息数量
+        limit: 本次最多导出的消息数（默认 1000，None 表示全部）
+        resume: 是否从上次的进度继续（False 重新导出）
 
     Returns:
         导出结果信息
@@ -2648,23 +3184,11 @@ async def export_chat(
         c = await get_client()
         entity = await c.get_entity(chat_id)
 
-        messages_data = []
-        async for message in c.iter_messages(entity, limit=limit):
-            msg_data = {
-                "id": message.id,
-                "date": str(message.date),
-                "sender_id": message.sender_id,
-                "text": message.message,
-                "media_type": type(message.media).__name__ if message.media else None
-            }
-            messages_data.append(msg_data)
-
-        import json
-        output = validate_export_path(output_path, f"chat_export_{entity.id}.json")
-        with open(output, 'w', encoding='utf-8') as f:
-            json.dump(messages_data, f, ensure_ascii=False, indent=2)
+        output = validate_export_path(output_path, f"chat_export_{entity.id}.jsonl")
+        result = await export_messages_jsonl(c, entity, output, limit=limit, resume=resume)
 
-        return f"✅ 聊天记录已导出到: {output}（共{len(messages_data)}条消息）"
+        status = "" if result["done"] else "，未导出完，再次调用继续"
+        return f"✅ 聊天记录已导出到: {output}（本次{result['written']}条，共{result['total']}条消息{status}）"
     except Exception as e:
         return log_and_format_error("export_chat", e, chat_id=chat_id)
 
@@ -2678,13 +3202,15 @@ async def export_chat(
 )
 async def get_chat_file(
     chat_id: Union[int, str],
-    limit: int = 100
+    limit: int = 100,
+    offset_id: int = 0
 ) -> str:
     """获取聊天中的所有文件
 
     Args:
         chat_id: 聊天ID
-        limit: 获取数量
+        limit: 获取数量（文件消息数）
+        offset_id: 分页游标（上一页返回的 offset_id，0 表示从最新开始）
 
     Returns:
         文件列表信息
@@ -2693,14 +3219,17 @@ async def get_chat_file(
         c = await get_client()
         entity = await c.get_entity(chat_id)
 
+        messages, next_offset = await fetch_filtered_messages(c, entity, ["files"], limit, offset_id)
         files = []
-        async for message in c.iter_messages(entity, limit=limit):
-            if message.media and hasattr(message.media, 'document'):
-                doc = message.media.document
-                for attr in doc.attributes:
-                    if hasattr(attr, 'file_name'):
-                        files.append(f"  - {attr.file_name} ({doc.size} bytes)")
+        for message in messages:
+            doc = message.document
+            if not doc:
+                continue
+            file_name = next((attr.file_name for attr in doc.attributes if hasattr(attr, 'file_name')), None)
+            files.append(f"  - {file_name or f'未命名文件 (ID: {message.id})'} ({doc.size} bytes)")
 
+        if files and next_offset:
+            files.append(f"下一页 offset_id: {next_offset}")
         return "📁 聊天文件列表:\n" + "\n".join(files) if files else "暂无文件"
     except Exception as e:
         return log_and_format_error("get_chat_file", e, chat_id=chat_id)
@@ -2713,56 +3242,210 @@ async def get_chat_file(
         destructiveHint=False,
     )
 )
-async def backup_chats(output_dir: str = "") -> str:
-    """备份所有聊天记录
+async def backup_chats(
+    output_dir: str = "",
+    concurrency: int = BACKUP_CONCURRENCY,
+    limit_per_chat: Optional[int] = None
+) -> str:
+    """增量备份所有聊天记录
+
+    备份目录中的 manifest.json 记录每个聊天已备份到的消息ID和最新快照，每次只拉取新消息，
+    在上一个快照的基础上生成新快照。消息按内容寻址分块压缩存储，未变化的分块在快照之间共享。
+    最新消息没有变化的聊天不发任何请求；多个聊天并行备份，总请求速率受 TELEGRAM_MCP_BACKUP_RATE 限制。
+    已备份的消息不会重新拉取，之后在 Telegram 上的编辑和删除不会反映到备份中。
 
     Args:
         output_dir: 备份目录
+        concurrency: 同时备份的聊天数
+        limit_per_chat: 每个聊天本次最多备份的消息数（None 表示全部，未完成的下次继续）
 
     Returns:
         备份结果信息
     """
     try:
-        import os
-        import json
         from pathlib import Path
 
+        if limit_per_chat is not None and limit_per_chat < 1:
+            raise ValueError("limit_per_chat 必须大于 0")
+
         output_dir = validate_export_path(output_dir, "backup")
         Path(output_dir).mkdir(parents=True, exist_ok=True)
 
+        manifest_path = os.path.join(output_dir, "manifest.json")
+        manifest = {"chats": {}}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        chats = manifest.setdefault("chats", {})
+
         c = await get_client()
 
-        dialogs = await c.get_dialogs()
-        backed_up = 0
+        pending = []
+        unchanged = 0
+        async for dialog in c.iter_dialogs():
+            if not (dialog.is_user or dialog.is_group or dialog.is_channel):
+                continue
+            entry = chats.get(str(dialog.id))
+            top_id = dialog.message.id if dialog.message else 0
+            if entry and entry.get("snapshot") and entry.get("done") and entry.get("last_id", 0) >= top_id:
+                unchanged += 1
+                continue
+            pending.append(dialog)
+
+        store = BackupStore(output_dir)
+        limiter = RateLimiter(BACKUP_RATE)
+
+        async def backup_one(dialog):
+            base = chats.get(str(dialog.id), {}).get("snapshot")
+            # 读写分块涉及压缩、哈希和 fsync，放到线程里，避免阻塞事件循环
+            writer = await asyncio.to_thread(store.open_snapshot, str(dialog.id), base)
+            written = 0
+            done = True
+            batch = []
+
+            await limiter.acquire()
+            async for message in c.iter_messages(dialog.entity, min_id=writer.last_id, reverse=True):
+                if limit_per_chat is not None and written >= limit_per_chat:
+                    done = False
+                    break
+                if written and written % HISTORY_PAGE_SIZE == 0:
+                    await asyncio.to_thread(writer.add_many, batch)
+                    batch = []
+                    await limiter.acquire()
+                batch.append(message_to_record(message))
+                written += 1
+            if batch:
+                await asyncio.to_thread(writer.add_many, batch)
+
+            if not written and base:
+                entry = chats[str(dialog.id)]
+                snapshot = {"id": base, "count": entry["count"], "last_id": entry["last_id"], "new_bytes": 0}
+            else:
+                snapshot = await asyncio.to_thread(writer.commit, {"title": dialog.name})
+            return {"written": written, "done": done, "snapshot": snapshot}
+
+        def record(dialog, result):
+            if isinstance(result, Exception):
+                logger.warning(f"备份聊天 {dialog.id} 失败: {result}")
+                return
+            chats[str(dialog.id)] = {
+                "title": dialog.name,
+                "type": "user" if dialog.is_user else "group" if dialog.is_group else "channel",
+                "snapshot": result["snapshot"]["id"],
+                "last_id": result["snapshot"]["last_id"],
+                "count": result["snapshot"]["count"],
+                "done": result["done"],
+                "updated_at": datetime.now().isoformat()
+            }
 
-        for dialog in dialogs:
-            if dialog.is_user or dialog.is_group or dialog.is_channel:
-                chat_data = {
-                    "id": dialog.entity.id,
-                    "title": dialog.name,
-                    "type": "user" if dialog.is_user else "group" if dialog.is_group else "channel"
-                }
+        results = await gather_bounded(pending, backup_one, concurrency=concurrency, on_result=record)
 
-                output_file = os.path.join(output_dir, f"chat_{dialog.entity.id}.json")
+        manifest["updated_at"] = datetime.now().isoformat()
+        _save_export_cursor(manifest_path, manifest)
 
-                messages = []
-                async for message in c.iter_messages(dialog.entity, limit=100):
-                    messages.append({
-                        "id": message.id,
-                        "date": str(message.date),
-                        "text": message.message
-                    })
+        succeeded = [result for result in results if not isinstance(result, Exception)]
+        failed = len(results) - len(succeeded)
+        new_messages = sum(result["written"] for result in succeeded)
+        new_bytes = sum(result["snapshot"]["new_bytes"] for result in succeeded)
 
-                chat_data["messages"] = messages
+        lines = [
+            f"✅ 已备份到: {output_dir}",
+            f"更新 {len(succeeded)} 个聊天，新增 {new_messages} 条消息（新增存储 {new_bytes / 1024:.1f} KB），"
+            f"{unchanged} 个聊天无变化",
+        ]
+        incomplete = sum(1 for result in succeeded if not result["done"])
+        if incomplete:
+            lines.append(f"{incomplete} 个聊天未备份完，下次运行继续")
+        if failed:
+            lines.append(f"⚠️ {failed} 个聊天备份失败，下次运行重试")
+        return "\n".join(lines)
+    except ValueError as e:
+        return f"❌ {e}"
+    except Exception as e:
+        return log_and_format_error("backup_chats", e)
 
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    json.dump(chat_data, f, ensure_ascii=False, indent=2)
 
-                backed_up += 1
+@mcp.tool(
+    annotations=ToolAnnotations(
+        title="查看备份快照",
+        openWorldHint=False,
+        readOnlyHint=True,
+    )
+)
+async def list_backups(chat_id: Union[int, str] = "", output_dir: str = "") -> str:
+    """列出 backup_chats 生成的快照
 
-        return f"✅ 已备份 {backed_up} 个聊天到: {output_dir}"
+    Args:
+        chat_id: 聊天ID（backup_chats 清单中的ID），为空列出所有聊天的最新快照
+        output_dir: 备份目录
+
+    Returns:
+        快照列表
+    """
+    try:
+        output_dir = validate_export_path(output_dir, "backup")
+        store = BackupStore(output_dir)
+
+        if chat_id != "":
+            snapshots = store.list_snapshots(str(chat_id))
+            if not snapshots:
+                return f"没有聊天 {chat_id} 的备份"
+            lines = [f"聊天 {chat_id} 的快照（{len(snapshots)} 个）:"]
+            for snapshot in reversed(snapshots):
+                lines.append(f"- {snapshot['id']}  {snapshot['count']} 条消息，最后消息ID {snapshot['last_id']}")
+            return "\n".join(lines)
+
+        manifest_path = os.path.join(output_dir, "manifest.json")
+        if not os.path.exists(manifest_path):
+            return "还没有备份"
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            chats = json.load(f).get("chats", {})
+        lines = [f"已备份 {len(chats)} 个聊天:"]
+        for peer_id, entry in chats.items():
+            lines.append(
+                f"- {entry.get('title')} (ID: {peer_id})  {entry.get('count', 0)} 条消息，"
+                f"最新快照 {entry.get('snapshot')}"
+            )
+        return "\n".join(lines)
+    except ValueError as e:
+        return f"❌ {e}"
     except Exception as e:
-        return log_and_format_error("backup_chats", e)
+        return log_and_format_error("list_backups", e, chat_id=chat_id)
+
+
+@mcp.tool(
+    annotations=ToolAnnotations(
+        title="还原备份",
+        openWorldHint=False,
+        destructiveHint=False,
+    )
+)
+async def restore_backup(
+    chat_id: Union[int, str],
+    snapshot_id: str = "",
+    output_path: str = "",
+    output_dir: str = ""
+) -> str:
+    """把备份快照还原为 JSONL 文件（每行一条消息）
+
+    Args:
+        chat_id: 聊天ID（backup_chats 清单中的ID）
+        snapshot_id: 快照ID，为空使用最新快照
+        output_path: 输出文件路径
+        output_dir: 备份目录
+
+    Returns:
+        还原结果信息
+    """
+    try:
+        store = BackupStore(validate_export_path(output_dir, "backup"))
+        output_path = validate_export_path(output_path, f"restore_{chat_id}.jsonl")
+        written = await asyncio.to_thread(store.restore, str(chat_id), output_path, snapshot_id or None)
+        return f"✅ 已还原 {written} 条消息到: {output_path}"
+    except ValueError as e:
+        return f"❌ {e}"
+    except Exception as e:
+        return log_and_format_error("restore_backup", e, chat_id=chat_id)
 
 
 # ------------------- 账号设置 -------------------
@@ -3119,22 +3802,89 @@ async def search_by_date(
         搜索结果
     """
     try:
-        from datetime import datetime
-
-        target_date = datetime.strptime(date, "%Y-%m-%d")
+        day_start = parse_day(date)
+        day_end = day_start + timedelta(days=1)
         c = await get_client()
         entity = await c.get_entity(chat_id)
 
+        # 存档覆盖到这一天时直接在本地按日期查（日期按 UTC，与 message.date 一致）
+        archived_chat = await sync_archive(c, entity, start=False)
+        if archived_chat is not None and message_archive.get().covers(archived_chat, since=day_start):
+            archived = message_archive.get().query(archived_chat, limit, date_from=day_start, date_to=day_end)
+            messages = [f"  - [{msg['date']}] {msg['text'][:50]}" for msg in archived]
+            return f"📅 {date} 的消息:\n" + "\n".join(messages) if messages else "未找到消息"
+
+        # 从当天结束处往前取，越过当天开始即停止
         messages = []
-        async for message in c.iter_messages(entity, limit=limit):
-            if message.date and message.date.date() == target_date.date():
-                messages.append(f"  - [{message.date}] {message.message[:50]}")
+        async for message in iter_messages_between(c, entity, day_start, day_end, newest_first=True, limit=limit):
+            messages.append(f"  - [{message.date}] {(message.message or '')[:50]}")
 
         return f"📅 {date} 的消息:\n" + "\n".join(messages) if messages else "未找到消息"
     except Exception as e:
         return log_and_format_error("search_by_date", e, chat_id=chat_id)
 
 
+@mcp.tool(
+    annotations=ToolAnnotations(
+        title="按日期范围获取消息",
+        openWorldHint=True,
+        destructiveHint=False,
+    )
+)
+async def get_messages_by_date_range(
+    chat_id: Union[int, str],
+    start_date: str,
+    end_date: str,
+    limit: int = 200,
+    output_path: str = ""
+) -> str:
+    """按时间顺序获取日期范围内的消息
+
+    指定 output_path 时把范围内的全部消息逐条写入 JSONL 文件（每行一条），
+    不受 limit 限制，内存占用与范围大小无关；否则返回前 limit 条。
+
+    Args:
+        chat_id: 聊天ID
+        start_date: 起始日期 YYYY-MM-DD（含，UTC）
+        end_date: 结束日期 YYYY-MM-DD（含，UTC）
+        limit: 不写文件时最多返回的消息数
+        output_path: JSONL 输出文件路径（可选，位于导出目录内）
+
+    Returns:
+        消息列表或导出结果
+    """
+    try:
+        start = parse_day(start_date)
+        end = parse_day(end_date) + timedelta(days=1)
+        if end <= start:
+            return "❌ 结束日期不能早于起始日期"
+
+        c = await get_client()
+        entity = await c.get_entity(chat_id)
+
+        if output_path:
+            output = validate_export_path(output_path, f"messages_{entity.id}_{start_date}_{end_date}.jsonl")
+            count = 0
+            with open(output, "w", encoding="utf-8") as f:
+                async for message in iter_messages_between(c, entity, start, end):
+                    f.write(json.dumps(message_to_record(message), ensure_ascii=False) + "\n")
+                    count += 1
+            return f"✅ {start_date} ~ {end_date} 的消息已导出到: {output}（共{count}条消息）"
+
+        lines = []
+        async for message in iter_messages_between(c, entity, start, end, limit=limit):
+            date = message.date.strftime("%Y-%m-%d %H:%M")
+            lines.append(f"[{date}] {get_sender_name(message)}: {message.message or '[媒体]'}")
+
+        if not lines:
+            return f"{start_date} ~ {end_date} 没有消息"
+        return f"📅 {start_date} ~ {end_date} 的消息（{len(lines)}条）:\n" + "\n".join(lines)
+    except ValueError as e:
+        return f"❌ {e}"
+    except Exception as e:
+        return log_and_format_error("get_messages_by_date_range", e, chat_id=chat_id)
+
+
 @mcp.tool(
     annotations=ToolAnnotations(
         title="按发送者搜索",
@@ -3162,6 +3912,12 @@ async def search_by_sender(
         entity = await c.get_entity(chat_id)
         sender = await c.get_entity(sender_id)
 
+        archived_chat = await sync_archive(c, entity, start=False)
+        if archived_chat is not None and message_archive.get().covers(archived_chat):
+            archived = message_archive.get().query(archived_chat, limit, sender_id=utils.get_peer_id(sender))
+            messages = [f"  - {msg['text'][:50]}" for msg in archived]
+            return f"👤 来自 @{sender_id} 的消息:\n" + "\n".join(messages) if messages else "未找到消息"
+
         messages = []
         async for message in c.iter_messages(entity, from_user=sender, limit=limit):
             messages.append(f"  - {message.message[:50]}")
@@ -3199,6 +3955,12 @@ async def search_hashtags(
 
         tag = hashtag if hashtag.startswith("#") else f"#{hashtag}"
 
+        archived_chat = await sync_archive(c, entity, start=False)
+        if archived_chat is not None and message_archive.get().covers(archived_chat):
+            archived = message_archive.get().query(archived_chat, limit, text=tag)
+            messages = [f"  - {msg['text'][:50]}" for msg in archived]
+            return f"#️⃣ 标签 '{tag}' 的消息:\n" + "\n".join(messages) if messages else "未找到消息"
+
         messages = []
         async for message in c.iter_messages(entity, search=tag, limit=limit):
             messages.append(f"  - {message.message[:50]}")
@@ -3208,6 +3970,85 @@ async def search_hashtags(
         return log_and_format_error("search_hashtags", e, chat_id=chat_id)
 
 
+@mcp.tool(
+    annotations=ToolAnnotations(
+        title="本地全文搜索",
+        openWorldHint=False,
+        readOnlyHint=True,
+    )
+)
+async def search_local(
+    query: str,
+    chat_id: Optional[Union[int, str]] = None,
+    sender_id: Optional[Union[int, str]] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    sort: str = "rank",
+    limit: int = 20,
+    cursor: Optional[str] = None
+) -> str:
+    """在本地消息存档中全文搜索（只包含已同步的聊天，不受 Telegram 搜索频率限制）
+
+    搜索语法：空格分隔的词需全部匹配；"短语" 精确匹配；词* 前缀匹配；-词 排除；
+    两个词之间写 OR 表示任一匹配。中文按字索引，连续汉字按短语匹配。
+
+    Args:
+        query: 搜索内容
+        chat_id: 只搜索该聊天（可选）
+        sender_id: 只搜索该发送者（可选）
+        date_from: 起始日期 YYYY-MM-DD（含，UTC）
+        date_to: 结束日期 YYYY-MM-DD（含，UTC）
+        sort: rank（按相关度）或 date（按时间，新的在前）
+        limit: 每页结果数
+        cursor: 上一页返回的游标
+    """
+    try:
+        archive = message_archive.get()
+        start = parse_day(date_from) if date_from else None
+        end = parse_day(date_to) + timedelta(days=1) if date_to else None
+
+        # 数字ID（含字符串形式）直接使用，只有用户名需要请求 Telegram 解析
+        if isinstance(sender_id, str) and sender_id.lstrip("-").isdigit():
+            sender_id = int(sender_id)
+        archived_chat = None
+        archived_sender = sender_id if isinstance(sender_id, int) else None
+        if chat_id is not None or isinstance(sender_id, str):
+            c = await get_client()
+            if chat_id is not None:
+                entity = await c.get_entity(chat_id)
+                # 已存档的聊天先增量同步，保证结果包含最新消息
+                archived_chat = await sync_archive(c, entity, start=False)
+                if archived_chat is None:
+                    archived_chat = utils.get_peer_id(entity)
+            if isinstance(sender_id, str):
+                archived_sender = utils.get_peer_id(await c.get_entity(sender_id))
+
+        results, next_cursor = archive.search(
+            query,
+            chat_id=archived_chat,
+            sender_id=archived_sender,
+            date_from=start,
+            date_to=end,
+            limit=limit,
+            cursor=cursor,
+            order=sort
+        )
+        if not results:
+            return f"本地存档中未找到 '{query}'"
+
+        lines = [f"🔎 本地搜索 '{query}' 的结果:"]
+        for msg in results:
+            date = msg["date"].strftime("%Y-%m-%d %H:%M")
+            lines.append(f"[{date}] {msg['chat_id']}#{msg['id']} {msg['sender_name']}: {(msg['text'] or '[媒体]')[:200]}")
+        if next_cursor:
+            lines.append(f"下一页 cursor: {next_cursor}")
+        return "\n".join(lines)
+    except ValueError as e:
+        return f"❌ {e}"
+    except Exception as e:
+        return log_and_format_error("search_local", e, query=query, chat_id=chat_id)
+
+
 # ------------------- 其他高级功能 -------------------
 
 @mcp.tool(
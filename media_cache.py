@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+媒体缓存模块
+按内容寻址的媒体文件缓存：索引以 Telegram 文件ID + access_hash 为键，文件本身以内容 SHA-256 存放，
+不同聊天转发的同一个文件、或内容相同的不同文件只保存一份，重复下载直接命中缓存。
+
+文档按固定大小分片并行下载，已完成的分片记录在旁路文件中，中断后只补下载缺失的分片。
+"""
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from telethon import utils
+from telethon.tl.types import Document, MessageMediaDocument, MessageMediaPhoto, Photo
+
+from concurrency import gather_bounded
+
+
+MEDIA_CACHE_DIR = os.path.join("./accounts", "media_cache")
+PART_SIZE = 1024 * 1024  # 分片大小（Telegram 单次请求不能跨越 1MB 边界）
+REQUEST_SIZE = 512 * 1024  # 单次 upload.getFile 请求大小
+PART_CONCURRENCY = int(os.getenv("TELEGRAM_MCP_DOWNLOAD_PART_CONCURRENCY", "4"))  # 单个文件的并行分片数
+
+
+def media_file(media) -> Optional[Any]:
+    """取出消息媒体中的 Document / Photo，其它类型返回 None"""
+    if isinstance(media, MessageMediaDocument):
+        media = media.document
+    elif isinstance(media, MessageMediaPhoto):
+        media = media.photo
+    if isinstance(media, (Document, Photo)):
+        return media
+    return None
+
+
+def media_key(media) -> Optional[str]:
+    """
+    媒体的缓存键（文件ID + access_hash），不支持缓存的媒体返回 None
+    """
+    file = media_file(media)
+    if file is None:
+        return None
+    kind = "doc" if isinstance(file, Document) else "photo"
+    return f"{kind}_{file.id}_{file.access_hash}"
+
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_file(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _save_json(path: str, data: Any):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class MediaCache:
+    """内容寻址的媒体缓存"""
+
+    def __init__(self, root: str = MEDIA_CACHE_DIR):
+        """
+        Args:
+            root: 缓存目录（objects/ 保存文件，partial/ 保存未完成的下载，index.json 为索引）
+        """
+        self.root = root
+        self.object_dir = os.path.join(root, "objects")
+        self.partial_dir = os.path.join(root, "partial")
+        self.index_path = os.path.join(root, "index.json")
+        self._index: Optional[Dict[str, Dict[str, Any]]] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @property
+    def index(self) -> Dict[str, Dict[str, Any]]:
+        if self._index is None:
+            self._index = {}
+            if os.path.exists(self.index_path):
+                try:
+                    with open(self.index_path, "r", encoding="utf-8") as f:
+                        self._index = json.load(f)
+                except (OSError, ValueError):
+                    self._index = {}
+        return self._index
+
+    def _object_path(self, sha256: str, ext: str) -> str:
+        return os.path.join(self.object_dir, sha256[:2], f"{sha256}{ext}")
+
+    def lookup(self, key: str) -> Optional[str]:
+        """
+        查找已缓存的文件
+
+        Returns:
+            缓存文件路径，未缓存、文件已丢失或大小不符时为 None
+        """
+        entry = self.index.get(key)
+        if not entry:
+            return None
+        path = self._object_path(entry["sha256"], entry.get("ext", ""))
+        if not os.path.exists(path) or os.path.getsize(path) != entry.get("size"):
+            return None
+        return path
+
+    def _place(self, tmp_path: str, ext: str) -> Tuple[str, str]:
+        """计算临时文件的哈希并移入对象目录（内容相同的文件只保留一份），返回 (sha256, 路径)"""
+        sha256 = _sha256_file(tmp_path)
+        path = self._object_path(sha256, ext)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        return sha256, path
+
+    async def _store(self, key: str, tmp_path: str, ext: str, mime: Optional[str]) -> str:
+        """把下载完成的临时文件移入缓存并更新索引"""
+        # 大文件哈希耗时较长，放到线程里，避免阻塞事件循环
+        sha256, path = await asyncio.to_thread(self._place, tmp_path, ext)
+        self.index[key] = {
+            "sha256": sha256,
+            "size": os.path.getsize(path),
+            "ext": ext,
+            "mime": mime,
+            "cached_at": datetime.now().isoformat()
+        }
+        os.makedirs(self.root, exist_ok=True)
+        _save_json(self.index_path, self.index)
+        return path
+
+    async def fetch(
+        self,
+        client,
+        media,
+        progress: Optional[Callable[[int, int], Any]] = None
+    ) -> Tuple[str, bool]:
+        """
+        获取媒体文件（优先使用缓存）
+
+        同一个文件的并发请求只下载一次。
+
+        Args:
+            client: Telegram Client
+            media: 消息媒体（Document / Photo）
+            progress: 进度回调 progress(已下载字节数, 总字节数)
+
+        Returns:
+            (缓存文件路径, 是否命中缓存)
+
+        Raises:
+            ValueError: 媒体类型不支持缓存
+        """
+        key = media_key(media)
+        if key is None:
+            raise ValueError("该媒体类型不支持缓存下载")
+
+        path = self.lookup(key)
+        if path:
+            return path, True
+
+        inflight = self._inflight.get(key)
+        if inflight:
+            return await asyncio.shield(inflight), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            path = await self._download(client, key, media_file(media), progress)
+            future.set_result(path)
+            return path, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其它等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _download(self, client, key: str, file, progress) -> str:
+        os.makedirs(self.partial_dir, exist_ok=True)
+        ext = utils.get_extension(file)
+        mime = getattr(file, "mime_type", None)
+        partial_path = os.path.join(self.partial_dir, f"{key}.part")
+
+        if isinstance(file, Photo):
+            # 图片很小，且最大尺寸的类型需要 download_media 选择，整文件下载
+            data = await client.download_media(file, file=bytes)
+            await asyncio.to_thread(_write_file, partial_path, data)
+            if progress:
+                progress(len(data), len(data))
+        else:
+            await self._download_parts(client, file, partial_path, file.size, progress)
+
+        return await self._store(key, partial_path, ext, mime)
+
+    async def _download_parts(self, client, document: Document, partial_path: str, size: int, progress):
+        """
+        分片并行下载文档，已完成的分片记录在 <partial>.json 中，重新调用时跳过
+        """
+        state_path = f"{partial_path}.json"
+        done = set()
+        if os.path.exists(partial_path) and os.path.exists(state_path):
+            try:
+                with open(state_path, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+                if state.get("size") == size:
+                    done = set(state.get("parts", []))
+            except (OSError, ValueError):
+                done = set()
+        if not done:
+            with open(partial_path, "wb") as f:
+                f.truncate(size)
+
+        part_count = max(1, (size + PART_SIZE - 1) // PART_SIZE)
+        received = sum(min(PART_SIZE, size - i * PART_SIZE) for i in done)
+
+        async def download_part(index: int):
+            nonlocal received
+            start = index * PART_SIZE
+            length = min(PART_SIZE, size - start)
+            data = bytearray()
+            async for chunk in client.iter_download(
+                document,
+                offset=start,
+                request_size=REQUEST_SIZE,
+                limit=(length + REQUEST_SIZE - 1) // REQUEST_SIZE,
+                file_size=size
+            ):
+                data += chunk
+            if len(data) < length:
+                raise IOError(f"分片 {index} 不完整: {len(data)}/{length}")
+
+            with open(partial_path, "r+b") as f:
+                f.seek(start)
+                f.write(data[:length])
+            done.add(index)
+            _save_json(state_path, {"size": size, "parts": sorted(done)})
+            received += length
+            if progress:
+                progress(received, size)
+
+        pending = [index for index in range(part_count) if index not in done]
+        results = await gather_bounded(pending, download_part, concurrency=PART_CONCURRENCY)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+        if os.path.exists(state_path):
+            os.remove(state_path)
+
+    def materialize(self, cached_path: str, dest: str) -> str:
+        """
+        把缓存文件复制到目标路径
+
+        不用硬链接：用户修改导出的文件不能影响缓存里按内容哈希存放的对象。
+
+        Returns:
+            目标路径
+        """
+        os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+        tmp_path = f"{dest}.tmp"
+        shutil.copyfile(cached_path, tmp_path)
+        # 替换目录项而不是原地写入，目标若是旧版本留下的硬链接也不会改到缓存对象
+        os.replace(tmp_path, dest)
+        return dest
+
+
+# 全局实例
+media_cache = MediaCache()
@@ -0,0 +1,601 @@
+#!/usr/bin/env python3
+"""
+本地消息存档模块
+每个账号一个 SQLite 数据库，按聊天增量同步（min_id），并通过更新事件跟踪编辑和删除
+
+每个聊天记录一段连续的已同步区间 [min_id, max_id]：区间内的消息都在本地，
+读取工具在区间足够且同步未过期时直接查本地，不再请求 Telegram。
+"""
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from telethon import events, utils
+
+from pagination import decode_cursor, encode_cursor
+
+
+ARCHIVE_DIR = os.path.join("./accounts", "archive")
+ARCHIVE_ENABLED = os.getenv("TELEGRAM_MCP_ARCHIVE", "1") != "0"  # 设为 0 关闭本地存档
+ARCHIVE_TTL = float(os.getenv("TELEGRAM_MCP_ARCHIVE_TTL", "60"))  # 同步结果的有效期（秒）
+SYNC_BATCH = 1000  # 单次增量同步最多拉取的新消息数，超过视为断档，重新开始区间
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    chat_id INTEGER NOT NULL,
+    msg_id INTEGER NOT NULL,
+    date INTEGER NOT NULL,
+    sender_id INTEGER,
+    sender_name TEXT,
+    text TEXT NOT NULL DEFAULT '',
+    reply_to INTEGER,
+    has_media INTEGER NOT NULL DEFAULT 0,
+    edit_date INTEGER,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (chat_id, msg_id)
+);
+CREATE INDEX IF NOT EXISTS idx_messages_date ON messages (chat_id, date);
+CREATE INDEX IF NOT EXISTS idx_messages_sender ON messages (chat_id, sender_id, msg_id);
+CREATE TABLE IF NOT EXISTS sync_state (
+    chat_id INTEGER PRIMARY KEY,
+    min_id INTEGER NOT NULL,
+    max_id INTEGER NOT NULL,
+    complete INTEGER NOT NULL DEFAULT 0,
+    synced_at REAL NOT NULL
+);
+"""
+
+MESSAGE_COLUMNS = "msg_id, date, sender_id, sender_name, text, reply_to, has_media, edit_date"
+
+# 全文索引：unicode61 不会切分连续的汉字，写入前先把中日韩字符按单字用空格隔开，
+# 查询时连续汉字作为短语匹配（相邻单字），效果等同于按字的 n-gram 检索
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(body, tokenize='unicode61 remove_diacritics 2');
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, body) VALUES (new.rowid, cjk_segment(new.text));
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF text ON messages
+WHEN old.text IS NOT new.text BEGIN
+    DELETE FROM messages_fts WHERE rowid = old.rowid;
+    INSERT INTO messages_fts (rowid, body) VALUES (new.rowid, cjk_segment(new.text));
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    DELETE FROM messages_fts WHERE rowid = old.rowid;
+END;
+"""
+
+CJK_PATTERN = re.compile(
+    "([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\U00020000-\U0002ebef])"
+)
+TOKEN_PATTERN = re.compile(r"[^\W_]+")  # 与 unicode61 一致：字母和数字为词，其余为分隔符
+QUERY_TERM_PATTERN = re.compile(r'(-?)"([^"]*)"(\*?)|(\S+)')
+SEARCH_ORDERS = ("rank", "date")
+
+
+def segment_cjk(text: Optional[str]) -> str:
+    """在每个中日韩字符两侧加空格，使其成为单独的词"""
+    return CJK_PATTERN.sub(r" \1 ", text or "")
+
+
+def _query_tokens(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(segment_cjk(text))
+
+
+def build_fts_query(query: str) -> str:
+    """
+    把搜索语法转为 FTS5 查询表达式
+
+    语法：空格分隔的词默认 AND；"短语" 精确匹配；词* 前缀匹配；-词 排除；
+    两个词之间写 OR 表示任一匹配。连续汉字按短语匹配，如 “世界” 只匹配相邻的 “世” “界”。
+
+    Args:
+        query: 用户输入的搜索词
+
+    Returns:
+        FTS5 MATCH 表达式
+
+    Raises:
+        ValueError: 没有可匹配的词
+    """
+    positive: List[str] = []
+    negative: List[str] = []
+    pending_or = False
+    for match in QUERY_TERM_PATTERN.finditer(query):
+        if match.group(4) is not None:
+            raw = match.group(4)
+            if raw == "OR":
+                pending_or = bool(positive)
+                continue
+            exclude = raw.startswith("-") and len(raw) > 1
+            if exclude:
+                raw = raw[1:]
+            prefix = raw.endswith("*")
+            raw = raw.rstrip("*")
+        else:
+            exclude, raw, prefix = match.group(1) == "-", match.group(2), bool(match.group(3))
+
+        tokens = _query_tokens(raw)
+        if not tokens:
+            continue
+        term = '"' + " ".join(tokens) + '"' + (" *" if prefix else "")
+        if exclude:
+            negative.append(term)
+        elif pending_or:
+            positive[-1] = f"{positive[-1]} OR {term}"
+            pending_or = False
+        else:
+            positive.append(term)
+
+    if not positive:
+        raise ValueError("搜索内容至少需要一个要匹配的词")
+    expression = " AND ".join(f"({term})" if " OR " in term else term for term in positive)
+    for term in negative:
+        expression = f"({expression}) NOT {term}"
+    return expression
+
+
+def _timestamp(date: Optional[datetime]) -> Optional[int]:
+    return int(date.timestamp()) if date else None
+
+
+def _sender_name(sender) -> str:
+    """发送者名称（与 main.get_sender_name 一致）"""
+    if not sender:
+        return "Unknown"
+    if getattr(sender, "title", None):
+        return sender.title
+    if hasattr(sender, "first_name"):
+        full_name = f"{getattr(sender, 'first_name', '') or ''} {getattr(sender, 'last_name', '') or ''}".strip()
+        return full_name or "Unknown"
+    return "Unknown"
+
+
+def _to_dict(row: sqlite3.Row) -> Dict:
+    """数据库行转为消息字典（date 为 UTC datetime，与 Telethon 消息一致）"""
+    return {
+        "id": row["msg_id"],
+        "date": datetime.fromtimestamp(row["date"], tz=timezone.utc),
+        "sender_id": row["sender_id"],
+        "sender_name": row["sender_name"] or "Unknown",
+        "text": row["text"],
+        "reply_to": row["reply_to"],
+        "has_media": bool(row["has_media"]),
+        "edited": row["edit_date"] is not None
+    }
+
+
+class MessageArchive:
+    """单个账号的消息存档"""
+
+    def __init__(self, account_id: str, path: str = None):
+        """
+        Args:
+            account_id: 账号ID
+            path: 数据库路径，默认 ./accounts/archive/<account_id>.db
+        """
+        self.account_id = account_id
+        if path is None:
+            os.makedirs(ARCHIVE_DIR, exist_ok=True)
+            path = os.path.join(ARCHIVE_DIR, f"{account_id}.db")
+        self.path = path
+        # 写入（含全文索引触发器和分词）在线程里执行，读取在事件循环里，共用一个连接
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self._init_fts()
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._write_lock = threading.Lock()  # 同一连接上的写事务不能交错
+
+    def _init_fts(self):
+        """创建全文索引（触发器随消息写入自动维护），已有存档首次升级时补建索引"""
+        self.db.create_function("cjk_segment", 1, segment_cjk, deterministic=True)
+        exists = self.db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+        ).fetchone()
+        with self.db:
+            self.db.executescript(FTS_SCHEMA)
+            if not exists:
+                self.db.execute(
+                    "INSERT INTO messages_fts (rowid, body) SELECT rowid, cjk_segment(text) FROM messages"
+                )
+
+    def close(self):
+        self.db.close()
+
+    # ---------- 写入 ----------
+
+    @staticmethod
+    def _row(chat_id: int, message) -> tuple:
+        reply_to = getattr(message.reply_to, "reply_to_msg_id", None) if message.reply_to else None
+        return (
+            chat_id,
+            message.id,
+            _timestamp(message.date) or 0,
+            message.sender_id,
+            _sender_name(message.sender),
+            message.message or "",
+            reply_to,
+            1 if message.media else 0,
+            _timestamp(message.edit_date)
+        )
+
+    def store_messages(self, chat_id: int, messages: Iterable) -> int:
+        """
+        写入消息（已存在的更新内容）
+
+        Returns:
+            写入条数
+        """
+        rows = [self._row(chat_id, m) for m in messages if m is not None]
+        if rows:
+            with self._write_lock, self.db:
+                self.db.executemany(
+                    """
+                    INSERT INTO messages (chat_id, msg_id, date, sender_id, sender_name, text, reply_to, has_media, edit_date)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (chat_id, msg_id) DO UPDATE SET
+                        sender_name = excluded.sender_name,
+                        text = excluded.text,
+                        has_media = excluded.has_media,
+                        edit_date = excluded.edit_date,
+                        deleted = 0
+                    """,
+                    rows
+                )
+        return len(rows)
+
+    def apply_edit(self, chat_id: int, message):
+        """更新已存档消息的内容（未存档的忽略）"""
+        with self._write_lock, self.db:
+            self.db.execute(
+                "UPDATE messages SET text = ?, has_media = ?, edit_date = ? WHERE chat_id = ? AND msg_id = ?",
+                (message.message or "", 1 if message.media else 0, _timestamp(message.edit_date),
+                 chat_id, message.id)
+            )
+
+    def mark_deleted(self, chat_id: Optional[int], msg_ids: List[int]):
+        """
+        标记消息已删除
+
+        Args:
+            chat_id: 频道/超级群的 ID；私聊和普通群的删除事件不带聊天ID（消息ID在账号内唯一），传 None
+            msg_ids: 消息ID列表
+        """
+        if not msg_ids:
+            return
+        placeholders = ",".join("?" * len(msg_ids))
+        with self._write_lock, self.db:
+            if chat_id is None:
+                # 频道消息ID各自独立编号，不能按ID跨聊天删除；频道ID为 -100 开头的负数
+                self.db.execute(
+                    f"UPDATE messages SET deleted = 1 WHERE chat_id > -1000000000000 AND msg_id IN ({placeholders})",
+                    msg_ids
+                )
+            else:
+                self.db.execute(
+                    f"UPDATE messages SET deleted = 1 WHERE chat_id = ? AND msg_id IN ({placeholders})",
+                    [chat_id, *msg_ids]
+                )
+
+    # ---------- 同步 ----------
+
+    def get_state(self, chat_id: int) -> Optional[Dict]:
+        """获取聊天的同步区间"""
+        row = self.db.execute("SELECT * FROM sync_state WHERE chat_id = ?", (chat_id,)).fetchone()
+        return dict(row) if row else None
+
+    def _save_state(self, chat_id: int, min_id: int, max_id: int, complete: bool):
+        with self._write_lock, self.db:
+            self.db.execute(
+                """
+                INSERT INTO sync_state (chat_id, min_id, max_id, complete, synced_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (chat_id) DO UPDATE SET
+                    min_id = excluded.min_id, max_id = excluded.max_id,
+                    complete = excluded.complete, synced_at = excluded.synced_at
+                """,
+                (chat_id, min_id, max_id, 1 if complete else 0, time.time())
+            )
+
+    def is_fresh(self, chat_id: int) -> bool:
+        """同步结果是否仍在有效期内"""
+        state = self.get_state(chat_id)
+        return bool(state) and time.time() - state["synced_at"] < ARCHIVE_TTL
+
+    def count(self, chat_id: int, min_id: int = None) -> int:
+        """已同步区间内（或 min_id 之后）的消息数"""
+        if min_id is None:
+            state = self.get_state(chat_id)
+            if not state:
+                return 0
+            min_id = state["min_id"]
+        return self.db.execute(
+            "SELECT COUNT(*) FROM messages WHERE chat_id = ? AND msg_id >= ? AND deleted = 0",
+            (chat_id, min_id)
+        ).fetchone()[0]
+
+    async def sync_chat(self, client, entity, min_count: int = 0) -> Dict:
+        """
+        增量同步聊天，保证本地至少有 min_count 条最新消息（或已同步到聊天开头）
+
+        同步未过期且数量足够时不发任何请求；否则只拉取 max_id 之后的新消息，
+        数量不够再从 min_id 往前补。首次同步只拉取 min_count 条，不会比直接读取多请求。
+        写入数据库（含全文索引分词）放到线程里执行，不阻塞事件循环。
+
+        Args:
+            client: TelegramClient
+            entity: 聊天实体
+            min_count: 需要的最新消息数
+
+        Returns:
+            同步区间 {chat_id, min_id, max_id, complete, synced_at}
+        """
+        chat_id = utils.get_peer_id(entity)
+        lock = self._locks.setdefault(chat_id, asyncio.Lock())
+        async with lock:
+            state = self.get_state(chat_id)
+            if (state and time.time() - state["synced_at"] < ARCHIVE_TTL
+                    and (state["complete"] or self.count(chat_id) >= min_count)):
+                return state
+
+            if state:
+                # 增量：只取上次同步之后的新消息
+                new = [m async for m in client.iter_messages(entity, min_id=state["max_id"], limit=SYNC_BATCH)]
+                await asyncio.to_thread(self.store_messages, chat_id, new)
+                min_id, max_id, complete = state["min_id"], state["max_id"], bool(state["complete"])
+                if new:
+                    max_id = max(max_id, max(m.id for m in new))
+                    if len(new) >= SYNC_BATCH:
+                        # 新消息太多，中间可能有断档：区间从这批消息重新开始
+                        min_id, complete = min(m.id for m in new), False
+            else:
+                requested = max(min_count, 1)
+                new = [m async for m in client.iter_messages(entity, limit=requested)]
+                await asyncio.to_thread(self.store_messages, chat_id, new)
+                max_id = max((m.id for m in new), default=0)
+                min_id = min((m.id for m in new), default=0)
+                complete = len(new) < requested
+
+            # 数量不够时往前补
+            missing = min_count - self.count(chat_id, min_id) if min_id else 0
+            if missing > 0 and not complete:
+                older = [m async for m in client.iter_messages(entity, offset_id=min_id, limit=missing)]
+                await asyncio.to_thread(self.store_messages, chat_id, older)
+                if older:
+                    min_id = min(m.id for m in older)
+                complete = len(older) < missing
+
+            await asyncio.to_thread(self._save_state, chat_id, min_id, max_id, complete)
+            return self.get_state(chat_id)
+
+    # ---------- 查询 ----------
+
+    def latest(self, chat_id: int, limit: int, offset: int = 0) -> List[Dict]:
+        """已同步区间内最新的消息（新的在前）"""
+        state = self.get_state(chat_id)
+        if not state:
+            return []
+        rows = self.db.execute(
+            f"""
+            SELECT {MESSAGE_COLUMNS} FROM messages
+            WHERE chat_id = ? AND msg_id >= ? AND deleted = 0
+            ORDER BY msg_id DESC LIMIT ? OFFSET ?
+            """,
+            (chat_id, state["min_id"], limit, offset)
+        ).fetchall()
+        return [_to_dict(row) for row in rows]
+
+    def covers(self, chat_id: int, since: datetime = None) -> bool:
+        """
+        已同步区间是否覆盖 since 之后的全部消息（since 为空表示整个聊天）
+        """
+        state = self.get_state(chat_id)
+        if not state:
+            return False
+        if state["complete"]:
+            return True
+        if since is None:
+            return False
+        oldest = self.db.execute(
+            "SELECT date FROM messages WHERE chat_id = ? AND msg_id = ?", (chat_id, state["min_id"])
+        ).fetchone()
+        return bool(oldest) and oldest["date"] <= since.timestamp()
+
+    def query(
+        self,
+        chat_id: int,
+        limit: int,
+        text: str = None,
+        sender_id: int = None,
+        date_from: datetime = None,
+        date_to: datetime = None
+    ) -> List[Dict]:
+        """
+        按条件查询已同步区间内的消息（新的在前）
+
+        Args:
+            chat_id: 聊天ID
+            limit: 最大条数
+            text: 包含的文本（不区分大小写）
+            sender_id: 发送者ID
+            date_from: 起始时间（含）
+            date_to: 结束时间（不含）
+        """
+        state = self.get_state(chat_id)
+        if not state:
+            return []
+        conditions = ["chat_id = ?", "msg_id >= ?", "deleted = 0"]
+        params: list = [chat_id, state["min_id"]]
+        if text:
+            conditions.append("text LIKE ? ESCAPE '\\'")
+            escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.append(f"%{escaped}%")
+        if sender_id is not None:
+            conditions.append("sender_id = ?")
+            params.append(sender_id)
+        if date_from is not None:
+            conditions.append("date >= ?")
+            params.append(int(date_from.timestamp()))
+        if date_to is not None:
+            conditions.append("date < ?")
+            params.append(int(date_to.timestamp()))
+        rows = self.db.execute(
+            f"SELECT {MESSAGE_COLUMNS} FROM messages WHERE {' AND '.join(conditions)} ORDER BY msg_id DESC LIMIT ?",
+            [*params, limit]
+        ).fetchall()
+        return [_to_dict(row) for row in rows]
+
+    def search(
+        self,
+        query: str,
+        chat_id: int = None,
+        sender_id: int = None,
+        date_from: datetime = None,
+        date_to: datetime = None,
+        limit: int = 20,
+        cursor: str = None,
+        order: str = "rank"
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        全文搜索存档中的消息
+
+        Args:
+            query: 搜索语法见 build_fts_query
+            chat_id: 只搜索该聊天
+            sender_id: 只搜索该发送者
+            date_from: 起始时间（含）
+            date_to: 结束时间（不含）
+            limit: 每页条数
+            cursor: 上一页返回的游标
+            order: rank（相关度，BM25）或 date（新的在前）
+
+        Returns:
+            (结果列表，每条带 chat_id, 下一页游标)
+
+        Raises:
+            ValueError: 查询、游标或排序方式无效
+        """
+        if order not in SEARCH_ORDERS:
+            raise ValueError(f"不支持的排序方式: {order}")
+
+        conditions = ["messages_fts MATCH ?", "m.deleted = 0"]
+        params: list = [build_fts_query(query)]
+        if chat_id is not None:
+            conditions.append("m.chat_id = ?")
+            params.append(chat_id)
+        if sender_id is not None:
+            conditions.append("m.sender_id = ?")
+            params.append(sender_id)
+        if date_from is not None:
+            conditions.append("m.date >= ?")
+            params.append(int(date_from.timestamp()))
+        if date_to is not None:
+            conditions.append("m.date < ?")
+            params.append(int(date_to.timestamp()))
+
+        # 游标记下第一页时的最大 rowid，翻页期间新存档的消息不会插进后续页。
+        # 相关度按 (score, rowid) 排序，但 BM25 分数会随索引内容变化，不能作为游标键，按已返回的条数翻页；
+        # 时间排序按 (date, rowid) 定位上一页最后一条
+        if cursor:
+            key = decode_cursor(cursor)
+            if len(key) != 4 or key[0] != order:
+                raise ValueError("游标与排序方式不匹配")
+            max_rowid = key[3]
+        else:
+            key = None
+            max_rowid = self.db.execute("SELECT COALESCE(MAX(rowid), 0) FROM messages").fetchone()[0]
+        conditions.append("m.rowid <= ?")
+        params.append(max_rowid)
+
+        offset = 0
+        if order == "rank":
+            order_by = "score ASC, row_id ASC"
+            if key:
+                offset = key[1]
+        else:
+            order_by = "date DESC, row_id DESC"
+            if key:
+                conditions.append("(m.date, m.rowid) < (?, ?)")
+                params.extend(key[1:3])
+
+        columns = ", ".join(f"m.{column}" for column in MESSAGE_COLUMNS.split(", "))
+        rows = self.db.execute(
+            f"""
+            SELECT m.rowid AS row_id, m.chat_id, {columns}, bm25(messages_fts) AS score
+            FROM messages_fts JOIN messages m ON m.rowid = messages_fts.rowid
+            WHERE {' AND '.join(conditions)}
+            ORDER BY {order_by}
+            LIMIT ? OFFSET ?
+            """,
+            [*params, limit + 1, offset]
+        ).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            if order == "rank":
+                next_cursor = encode_cursor((order, offset + limit, None, max_rowid))
+            else:
+                next_cursor = encode_cursor((order, last["date"], last["row_id"], max_rowid))
+        return [dict(_to_dict(row), chat_id=row["chat_id"]) for row in rows], next_cursor
+
+
+class ArchiveManager:
+    """按账号管理消息存档，并把更新事件接到对应存档"""
+
+    def __init__(self):
+        self.archives: Dict[str, MessageArchive] = {}
+        self._attached: Dict[str, object] = {}  # {account_id: 已注册事件的 client}
+
+    def get(self, account_id: str = "default") -> MessageArchive:
+        """获取账号的存档（首次调用时打开数据库）"""
+        archive = self.archives.get(account_id)
+        if archive is None:
+            archive = MessageArchive(account_id)
+            self.archives[account_id] = archive
+        return archive
+
+    def attach(self, client, account_id: str = "default"):
+        """
+        在 client 上注册新消息、编辑、删除事件，只更新已在同步的聊天
+
+        同一个 client 重复调用不会重复注册。
+        """
+        if self._attached.get(account_id) is client:
+            return
+        archive = self.get(account_id)
+
+        async def on_new_message(event):
+            if archive.get_state(event.chat_id):
+                if event.message.sender is None:
+                    await event.message.get_sender()
+                await asyncio.to_thread(archive.store_messages, event.chat_id, [event.message])
+
+        async def on_message_edited(event):
+            if archive.get_state(event.chat_id):
+                await asyncio.to_thread(archive.apply_edit, event.chat_id, event.message)
+
+        async def on_message_deleted(event):
+            await asyncio.to_thread(archive.mark_deleted, event.chat_id, event.deleted_ids)
+
+        client.add_event_handler(on_new_message, events.NewMessage())
+        client.add_event_handler(on_message_edited, events.MessageEdited())
+        client.add_event_handler(on_message_deleted, events.MessageDeleted())
+        self._attached[account_id] = client
+
+    def close(self):
+        for archive in self.archives.values():
+            archive.close()
+        self.archives = {}
+        self._attached = {}
+
+
+# 全局实例
+message_archive = ArchiveManager()
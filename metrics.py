@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+运行指标模块
+轻量的计数器 / 仪表 / 直方图，在热路径上直接累加，抓取时只做文本格式化（Prometheus 文本格式）
+"""
+import abc
+import asyncio
+import math
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LATENCY_MS_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+LOOP_MONITOR_INTERVAL = 0.5  # 事件循环延迟采样间隔（秒）
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple[str, str] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric(abc.ABC):
+    type_name = ""
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    @abc.abstractmethod
+    def _samples(self) -> List[str]:
+        """按 Prometheus 文本格式输出的样本行"""
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.type_name}",
+            *self._samples()
+        ]
+
+
+class Counter(_Metric):
+    """只增计数器"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        super().__init__(name, description, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(_Metric):
+    """仪表：可设置数值，或在抓取时调用函数取值"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        super().__init__(name, description, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float]):
+        """抓取时取值（只用于 O(1) 或很便宜的读取）"""
+        self._function = function
+
+    def _samples(self) -> List[str]:
+        if self._function:
+            try:
+                return [f"{self.name} {_format_value(float(self._function()))}"]
+            except Exception:
+                return []
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Histogram(_Metric):
+    """直方图"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # {labels: [各桶计数..., sum, count]}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = [0.0] * (len(self.buckets) + 2)
+            self._series[key] = series
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+                break
+        series[-2] += value
+        series[-1] += 1
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, series in self._series.items():
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.label_names, key, ('le', _format_value(float(bound))))} "
+                    f"{_format_value(cumulative)}"
+                )
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {_format_value(series[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, description: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, description, labels))
+
+    def gauge(self, name: str, description: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, description, labels))
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, description, labels, buckets))
+
+    def render(self) -> str:
+        """输出 Prometheus 文本格式"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# 全局注册表和各模块共用的指标
+registry = MetricsRegistry()
+
+messages_sent = registry.counter(
+    "telegram_mcp_messages_sent_total", "Messages sent", ["source"]
+)
+message_failures = registry.counter(
+    "telegram_mcp_message_failures_total", "Message send failures", ["source"]
+)
+flood_waits = registry.counter(
+    "telegram_mcp_flood_wait_total", "FloodWait errors", ["method"]
+)
+flood_wait_seconds = registry.counter(
+    "telegram_mcp_flood_wait_seconds_total", "Seconds requested by FloodWait errors", ["method"]
+)
+connected_clients = registry.gauge(
+    "telegram_mcp_connected_clients", "Connected Telegram clients"
+)
+client_connects = registry.counter(
+    "telegram_mcp_client_connects_total", "Telegram client connect attempts", ["result"]
+)
+scheduler_lag = registry.histogram(
+    "telegram_mcp_scheduler_lag_seconds", "Delay between a schedule's due time and its execution",
+    buckets=(1, 2.5, 5, 10, 15, 20, 30, 60)
+)
+scheduler_runs = registry.counter(
+    "telegram_mcp_scheduler_runs_total", "Scheduled task executions", ["result"]
+)
+proxy_latency = registry.histogram(
+    "telegram_mcp_proxy_latency_ms", "Proxy latency in milliseconds", ["proxy"], buckets=LATENCY_MS_BUCKETS
+)
+proxy_failures = registry.counter(
+    "telegram_mcp_proxy_failures_total", "Proxy connection failures", ["proxy"]
+)
+log_writes = registry.counter(
+    "telegram_mcp_log_writes_total", "Operation log entries written", ["level"]
+)
+health_checks = registry.counter(
+    "telegram_mcp_health_checks_total", "Account health checks", ["mode", "status"]
+)
+event_loop_lag = registry.histogram(
+    "telegram_mcp_event_loop_lag_seconds", "Event loop scheduling delay",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+
+
+def record_error(method: str, error: Exception):
+    """记录错误中的 FloodWait（按方法名统计）"""
+    seconds = getattr(error, "seconds", None)
+    if type(error).__name__.startswith(("FloodWait", "SlowModeWait", "FloodPremiumWait")) and seconds is not None:
+        flood_waits.inc(method=method)
+        flood_wait_seconds.inc(seconds, method=method)
+
+
+async def monitor_event_loop(interval: float = LOOP_MONITOR_INTERVAL):
+    """定期睡眠 interval 秒，实际多睡的时间就是事件循环的调度延迟"""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        event_loop_lag.observe(max(0.0, time.perf_counter() - start - interval))
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+分页模块
+基于游标的分页：游标记录上一页最后一项的排序键，数据增删不会导致翻页重复或遗漏
+"""
+import base64
+import heapq
+import json
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+MAX_PAGE_SIZE = 500  # 单页最大条数
+
+
+def encode_cursor(key: Tuple) -> str:
+    """把排序键编码为不透明游标"""
+    raw = json.dumps(list(key), ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple:
+    """
+    解析游标
+
+    Raises:
+        ValueError: 游标格式无效
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+    except Exception:
+        raise ValueError("无效的游标")
+    if not isinstance(key, list):
+        raise ValueError("无效的游标")
+    return tuple(key)
+
+
+def paginate(
+    items: Iterable[Any],
+    sort_key: Callable[[Any], Tuple],
+    limit: int,
+    cursor: Optional[str] = None,
+    descending: bool = False
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    取一页数据
+
+    排序键必须唯一（末尾带上ID），只对游标之后的数据做 top-k 选择，不做全量排序。
+
+    Args:
+        items: 已筛选的数据
+        sort_key: 排序键函数，返回元组
+        limit: 每页条数
+        cursor: 上一页返回的 next_cursor
+        descending: 是否倒序
+
+    Returns:
+        (本页数据, 下一页游标，没有更多时为 None)
+
+    Raises:
+        ValueError: 游标无效或 limit 超出范围
+    """
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise ValueError(f"limit 必须在 1 到 {MAX_PAGE_SIZE} 之间")
+
+    keyed = ((sort_key(item), item) for item in items)
+    if cursor:
+        after = decode_cursor(cursor)
+        try:
+            if descending:
+                keyed = [(key, item) for key, item in keyed if list(key) < list(after)]
+            else:
+                keyed = [(key, item) for key, item in keyed if list(key) > list(after)]
+        except TypeError:
+            raise ValueError("游标与排序方式不匹配")
+
+    select = heapq.nlargest if descending else heapq.nsmallest
+    # 多取一条判断是否还有下一页
+    page = select(limit + 1, keyed, key=lambda pair: pair[0])
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(page[-1][0])
+    return [item for _, item in page], next_cursor
+
+
+def page_response(name: str, page: List[Any], total: int, next_cursor: Optional[str]) -> Dict[str, Any]:
+    """分页接口的统一返回格式"""
+    return {
+        "success": True,
+        name: page,
+        "total": total,
+        "count": len(page),
+        "next_cursor": next_cursor
+    }
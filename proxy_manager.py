@@ -4,19 +4,39 @@
 支持全局代理和独立代理，真实生效
 """
 import asyncio
+import heapq
 import json
 import os
+import time
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 import aiohttp
-from urllib.parse import quote
+from urllib.parse import quote, urlparse
 
 from security import decrypt_session, encrypt_session, mask_secret
+from concurrency import gather_bounded
+import metrics
 
 
 ACCOUNTS_DIR = "./accounts"
 PROXIES_FILE = os.path.join(ACCOUNTS_DIR, "proxies.json")
 
+# 代理测试目标：
+#   https://... / http://...  通过代理发起 HTTP 请求（仅 HTTP 代理，SOCKS 代理自动改为 TCP 连接测试）
+#   tcp                       直接 TCP 连接代理自身的 host:port
+#   tcp://host:port           TCP 连接指定地址（可用于离线 CI 或本地基准测试）
+PROXY_TEST_TARGET = os.getenv("TELEGRAM_MCP_PROXY_TEST_TARGET", "https://www.google.com")
+PROXY_TEST_CONCURRENCY = int(os.getenv("TELEGRAM_MCP_PROXY_TEST_CONCURRENCY", "50"))
+
+# 代理池选择参数
+LATENCY_EWMA_ALPHA = 0.3  # 延迟 EWMA 平滑系数（越大越看重最近的结果）
+UNKNOWN_LATENCY = 1000.0  # 未测过的代理按 1 秒估计
+MAX_CONSECUTIVE_FAILURES = 3  # 连续失败达到此值视为不健康
+MAX_FAILOVER_CANDIDATES = 3  # 连接失败时最多尝试的代理数
+UNHEALTHY_RETRY_INTERVAL = float(os.getenv("TELEGRAM_MCP_PROXY_RETRY_INTERVAL", "300"))  # 不健康代理冷却多久后重新试探(秒)
+STATS_SAVE_INTERVAL = float(os.getenv("TELEGRAM_MCP_PROXY_STATS_SAVE_INTERVAL", "60"))  # 连接结果最多每隔多久写一次盘(秒)
+AUTO_ASSIGN_PROXY = os.getenv("TELEGRAM_MCP_PROXY_AUTO_ASSIGN", "false").lower() == "true"
+
 
 class ProxyManager:
     """代理管理器"""
@@ -25,6 +45,13 @@ class ProxyManager:
         self.proxies: Dict[str, Dict] = {}  # 代理配置
         self.global_proxy: Optional[Dict] = None  # 全局代理
         self.proxy_stats: Dict[str, Dict] = {}  # 代理统计
+        self._session: Optional[aiohttp.ClientSession] = None  # 代理测试共用的 HTTP 会话
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None  # 创建会话时的事件循环
+        self._account_index: Dict[str, List[str]] = {}  # 反向索引 {account_id: [proxy_id, ...]}
+        self._telethon_cache: Dict[str, Dict] = {}  # Telethon 格式配置缓存 {proxy_id/"global": config}
+        self._preferred: Dict[str, str] = {}  # 进程内记住的账号最近连通的代理 {account_id: proxy_id}
+        self._stats_dirty = False  # 有没写盘的统计
+        self._last_save = 0.0  # 上次写盘时间(monotonic)
         self._load_proxies()
 
     def _load_proxies(self):
@@ -35,9 +62,30 @@ class ProxyManager:
                 self.global_proxy = data.get("global")
                 self.proxies = data.get("proxies", {})
                 self.proxy_stats = data.get("stats", {})
+            # 在用连接数只在进程内有效
+            for stats in self.proxy_stats.values():
+                stats["in_flight"] = 0
+        self._rebuild_index()
+
+    def _rebuild_index(self):
+        """重建账号→代理反向索引，并清空配置缓存"""
+        self._account_index = {}
+        for proxy_id, proxy_config in self.proxies.items():
+            for account_id in proxy_config.get("assigned_to", []):
+                self._account_index.setdefault(account_id, []).append(proxy_id)
+        self._telethon_cache = {}
+
+    def _index_remove(self, account_id: str, proxy_id: str):
+        proxy_ids = self._account_index.get(account_id)
+        if proxy_ids and proxy_id in proxy_ids:
+            proxy_ids.remove(proxy_id)
+            if not proxy_ids:
+                del self._account_index[account_id]
 
     def _save_proxies(self):
         """保存代理配置"""
+        self._stats_dirty = False
+        self._last_save = time.monotonic()
         os.makedirs(ACCOUNTS_DIR, exist_ok=True)
         with open(PROXIES_FILE, 'w', encoding='utf-8') as f:
             json.dump({
@@ -97,6 +145,9 @@ class ProxyManager:
         if protocol.lower() not in ["socks5", "http", "https", "socks4"]:
             return False
 
+        # 覆盖已有代理时保留账号分配
+        assigned_to = self.proxies.get(proxy_id, {}).get("assigned_to", [])
+
         self.proxies[proxy_id] = {
             "proxy_id": proxy_id,
             "protocol": protocol.lower(),
@@ -104,17 +155,14 @@ class ProxyManager:
             "port": port,
             "username": username,
             "password": encrypt_session(password) if password else None,
-            "created_at": datetime.now().isoformat()
+            "created_at": datetime.now().isoformat(),
+            "assigned_to": assigned_to
         }
+        self._telethon_cache.pop(proxy_id, None)
 
         # 初始化统计
         if proxy_id not in self.proxy_stats:
-            self.proxy_stats[proxy_id] = {
-                "success_count": 0,
-                "fail_count": 0,
-                "avg_response_time": 0,
-                "last_test": None
-            }
+            self.proxy_stats[proxy_id] = self._new_stats()
 
         self._save_proxies()
         return True
@@ -132,10 +180,12 @@ class ProxyManager:
         if proxy_id not in self.proxies:
             return False
 
-        del self.proxies[proxy_id]
-
         # 清除相关账号的代理引用
-        # (实际使用时会从 account_manager 读取)
+        for account_id in self.proxies[proxy_id].get("assigned_to", []):
+            self._index_remove(account_id, proxy_id)
+
+        del self.proxies[proxy_id]
+        self._telethon_cache.pop(proxy_id, None)
 
         self._save_proxies()
         return True
@@ -172,6 +222,7 @@ class ProxyManager:
             "password": encrypt_session(password) if password else None,
             "updated_at": datetime.now().isoformat()
         }
+        self._telethon_cache.pop("global", None)
 
         self._save_proxies()
         return True
@@ -184,6 +235,7 @@ class ProxyManager:
             是否成功
         """
         self.global_proxy = None
+        self._telethon_cache.pop("global", None)
         self._save_proxies()
         return True
 
@@ -208,6 +260,7 @@ class ProxyManager:
 
         if account_id not in self.proxies[proxy_id]["assigned_to"]:
             self.proxies[proxy_id]["assigned_to"].append(account_id)
+            self._account_index.setdefault(account_id, []).append(proxy_id)
 
         self._save_proxies()
         return True
@@ -229,6 +282,7 @@ class ProxyManager:
         if "assigned_to" in self.proxies[proxy_id]:
             if account_id in self.proxies[proxy_id]["assigned_to"]:
                 self.proxies[proxy_id]["assigned_to"].remove(account_id)
+        self._index_remove(account_id, proxy_id)
 
         self._save_proxies()
         return True
@@ -285,6 +339,25 @@ class ProxyManager:
 
         return config
 
+    def _telethon_config(self, proxy_id: str) -> Optional[Dict]:
+        """
+        获取 Telethon 格式配置（缓存，密码只在首次使用时解密一次）
+
+        Args:
+            proxy_id: 代理ID，"global" 表示全局代理
+
+        Returns:
+            配置副本，代理不存在或不完整返回 None
+        """
+        config = self._telethon_cache.get(proxy_id)
+        if config is None:
+            proxy_config = self.global_proxy if proxy_id == "global" else self.proxies.get(proxy_id)
+            if not (proxy_config and proxy_config.get("host") and proxy_config.get("port")):
+                return None
+            config = self.to_telethon_format(proxy_config)
+            self._telethon_cache[proxy_id] = config
+        return dict(config)
+
     def get_global_proxy(self) -> Optional[Dict]:
         """
         获取全局代理配置（Telethon格式）
@@ -292,9 +365,7 @@ class ProxyManager:
         Returns:
             Telethon 格式的代理配置，如果无全局代理则返回 None
         """
-        if self.global_proxy and self.global_proxy.get("host") and self.global_proxy.get("port"):
-            return self.to_telethon_format(self.global_proxy)
-        return None
+        return self._telethon_config("global")
 
     def get_proxy(self, proxy_id: str) -> Optional[Dict]:
         """
@@ -306,44 +377,286 @@ class ProxyManager:
         Returns:
             Telethon 格式的代理配置，如果代理不存在则返回 None
         """
-        if proxy_id in self.proxies:
-            proxy_config = self.proxies[proxy_id]
-            if proxy_config.get("host") and proxy_config.get("port"):
-                return self.to_telethon_format(proxy_config)
-        return None
+        if proxy_id == "global":
+            return None
+        return self._telethon_config(proxy_id)
+
+    def get_account_proxies(self, account_id: str) -> List[str]:
+        """
+        获取分配给账号的代理ID（反向索引，O(1)）
+
+        Args:
+            account_id: 账号ID
+
+        Returns:
+            代理ID列表
+        """
+        return list(self._account_index.get(account_id, ()))
 
     def get_proxy_for_account(self, account_id: str) -> Optional[Dict]:
         """
         获取账号的代理配置（Telethon格式）
 
+        取 get_proxy_candidates 的第一个候选。
+
         Args:
             account_id: 账号ID
 
         Returns:
-            Telethon 格式的代理配置
+            Telethon 格式的代理配置，无代理返回 None
         """
-        # 1. 先检查账号是否有独立代理
-        for proxy_id, proxy_config in self.proxies.items():
-            if "assigned_to" in proxy_config:
-                if account_id in proxy_config["assigned_to"]:
-                    # 验证代理配置有效
-                    if proxy_config.get("host") and proxy_config.get("port"):
-                        return self.to_telethon_format(proxy_config)
+        # 常见情况：账号已分配健康代理且没有故障转移记录，直接查索引和缓存
+        if account_id not in self._preferred:
+            for proxy_id in self._account_index.get(account_id, ()):
+                if self.is_healthy(proxy_id):
+                    config = self._telethon_config(proxy_id)
+                    if config:
+                        return config
+        return self.get_proxy_candidates(account_id)[0][1]
+
+    def is_healthy(self, proxy_id: str) -> bool:
+        """
+        代理是否健康（没有统计数据的新代理视为健康）
+
+        连续失败的代理冷却 UNHEALTHY_RETRY_INTERVAL 秒后重新视为健康、放行一次试探：
+        试探成功清零失败计数，失败则刷新失败时间，再冷却一轮。
+        """
+        stats = self.proxy_stats.get(proxy_id)
+        if not stats or stats.get("consecutive_failures", 0) < MAX_CONSECUTIVE_FAILURES:
+            return True
+        return time.time() - stats.get("last_failure", 0) >= UNHEALTHY_RETRY_INTERVAL
+
+    def set_preferred(self, account_id: str, proxy_id: Optional[str]):
+        """
+        记住账号最近连通的代理，之后连接时优先尝试（只在进程内有效，不改动配置的代理分配）
 
-        # 2. 使用全局代理（必须有有效的host和port）
-        if self.global_proxy and self.global_proxy.get("host") and self.global_proxy.get("port"):
-            return self.to_telethon_format(self.global_proxy)
+        Args:
+            account_id: 账号ID
+            proxy_id: 代理ID，None 或 "global" 表示清除
+        """
+        if proxy_id and proxy_id != "global":
+            self._preferred[account_id] = proxy_id
+        else:
+            self._preferred.pop(account_id, None)
 
-        # 3. 无代理
-        return None
+    def _score(self, proxy_id: str) -> float:
+        """
+        代理评分（越小越好）
 
-    async def test_proxy(self, proxy_config: Dict, timeout: int = 10) -> Dict:
+        延迟 EWMA / 成功率（拉普拉斯平滑），再按在用连接数加权，
+        让负载分散到多个同样快的代理上。
+        """
+        stats = self.proxy_stats.get(proxy_id) or {}
+        latency = stats.get("avg_response_time") or UNKNOWN_LATENCY
+        success = stats.get("success_count", 0)
+        total = success + stats.get("fail_count", 0)
+        success_rate = (success + 1) / (total + 2)
+        return latency / success_rate * (1 + 0.1 * stats.get("in_flight", 0))
+
+    def _is_usable(self, proxy_id: str) -> bool:
+        proxy_config = self.proxies.get(proxy_id)
+        return bool(proxy_config and proxy_config.get("host") and proxy_config.get("port"))
+
+    def _in_pool(self, proxy_id: str) -> bool:
+        """代理池只包含没有分配给任何账号的共享代理，其它账号的独享代理不借用"""
+        return (
+            not self.proxies[proxy_id].get("assigned_to")
+            and self._is_usable(proxy_id) and self.is_healthy(proxy_id)
+        )
+
+    def get_best_proxy(self, exclude: List[str] = None) -> Optional[str]:
+        """
+        获取代理池中评分最好的健康代理
+
+        Args:
+            exclude: 排除的代理ID
+
+        Returns:
+            代理ID，没有可用代理返回 None
+        """
+        exclude = set(exclude or ())
+        candidates = [
+            proxy_id for proxy_id in self.proxies
+            if proxy_id not in exclude and self._is_usable(proxy_id) and self.is_healthy(proxy_id)
+        ]
+        return min(candidates, key=self._score) if candidates else None
+
+    def get_proxy_candidates(self, account_id: str) -> List[Tuple[Optional[str], Optional[Dict]]]:
+        """
+        获取账号连接时依次尝试的代理
+
+        已分配代理的账号：最近连通的代理（故障转移后记住的）→ 已分配的健康代理 → 代理池中评分最好的健康代理
+        → 全局代理 → 已分配但不健康的代理（全部失败时兜底）。
+        未分配代理的账号：全局代理 → 代理池（仅开启 TELEGRAM_MCP_PROXY_AUTO_ASSIGN 时）。
+        代理池只包含没有分配给任何账号的代理。没有任何代理时返回直连。
+
+        Args:
+            account_id: 账号ID
+
+        Returns:
+            [(代理ID, Telethon 格式配置), ...]，全局代理的ID为 "global"，直连为 (None, None)
+        """
+        assigned = [
+            proxy_id for proxy_id in self._account_index.get(account_id, ())
+            if self._is_usable(proxy_id)
+        ]
+        healthy = sorted(
+            (proxy_id for proxy_id in assigned if self.is_healthy(proxy_id)),
+            key=self._score
+        )
+
+        preferred = self._preferred.get(account_id)
+        if preferred in self.proxies and (
+            (preferred in assigned and self.is_healthy(preferred)) or self._in_pool(preferred)
+        ):
+            healthy = [preferred] + [proxy_id for proxy_id in healthy if proxy_id != preferred]
+
+        ordered = healthy[:MAX_FAILOVER_CANDIDATES]
+        # 需要故障转移，或者开启了自动分配时，从代理池中挑选
+        if (AUTO_ASSIGN_PROXY or assigned) and len(ordered) < MAX_FAILOVER_CANDIDATES:
+            ordered.extend(heapq.nsmallest(
+                MAX_FAILOVER_CANDIDATES - len(ordered),
+                (
+                    proxy_id for proxy_id in self.proxies
+                    if proxy_id not in ordered and self._in_pool(proxy_id)
+                ),
+                key=self._score
+            ))
+
+        candidates = [(proxy_id, self._telethon_config(proxy_id)) for proxy_id in ordered]
+        global_config = self._telethon_config("global")
+        if global_config:
+            # 未分配代理的账号优先走全局代理
+            if assigned or not self.is_healthy("global"):
+                candidates.append(("global", global_config))
+            else:
+                candidates.insert(0, ("global", global_config))
+        candidates.extend(
+            (proxy_id, self._telethon_config(proxy_id))
+            for proxy_id in assigned if proxy_id not in healthy
+        )
+
+        return candidates or [(None, None)]
+
+    def acquire(self, proxy_id: str):
+        """登记一个经由该代理的在用连接"""
+        if proxy_id:
+            stats = self.proxy_stats.setdefault(proxy_id, self._new_stats())
+            stats["in_flight"] = stats.get("in_flight", 0) + 1
+
+    def release(self, proxy_id: str):
+        """注销一个经由该代理的在用连接"""
+        stats = self.proxy_stats.get(proxy_id) if proxy_id else None
+        if stats:
+            stats["in_flight"] = max(0, stats.get("in_flight", 0) - 1)
+
+    def record_result(self, proxy_id: str, success: bool, latency: float = None, save: bool = True):
+        """
+        记录一次经由代理的连接结果（连接测试或真实连接）
+
+        Args:
+            proxy_id: 代理ID
+            success: 是否成功
+            latency: 延迟(ms)
+            save: 是否保存（距上次写盘不足 STATS_SAVE_INTERVAL 秒时只标记，由下次保存一并写出）
+        """
+        if not proxy_id:
+            return
+        result = {"success": success}
+        if latency is not None:
+            result["response_time"] = latency
+        self._update_proxy_stats(proxy_id, result)
+        self._stats_dirty = True
+        # 每次连接都写 proxies.json 代价太高，按时间间隔合并写盘
+        if save and time.monotonic() - self._last_save >= STATS_SAVE_INTERVAL:
+            self._save_proxies()
+
+    def save_stats(self):
+        """保存代理统计（配合 record_result 批量记录后调用，没有未保存的改动时跳过）"""
+        if self._stats_dirty:
+            self._save_proxies()
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """获取共用的 HTTP 会话（连接池在所有代理测试间复用，事件循环变化时重建）"""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            if self._session is not None and not self._session.closed:
+                try:
+                    await self._session.close()
+                except Exception:
+                    # 旧会话绑定的事件循环可能已经关闭，关不掉也不影响新会话
+                    pass
+            connector = aiohttp.TCPConnector(limit=PROXY_TEST_CONCURRENCY, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._session_loop = loop
+        return self._session
+
+    async def close(self):
+        """关闭共用的 HTTP 会话，并写出未保存的统计"""
+        self.save_stats()
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._session_loop = None
+
+    @staticmethod
+    def _parse_tcp_target(target: str, proxy_config: Dict) -> Tuple[str, int]:
+        """解析 TCP 测试目标，返回 (host, port)"""
+        if target == "tcp":
+            return proxy_config.get("host"), int(proxy_config.get("port"))
+        parsed = urlparse(target)
+        return parsed.hostname, parsed.port
+
+    async def _test_tcp(self, host: str, port: int, timeout: float) -> Dict:
+        """TCP 连接测试"""
+        start = time.perf_counter()
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=timeout)
+        elapsed = (time.perf_counter() - start) * 1000
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except Exception:
+            pass
+        return {"success": True, "response_time": elapsed}
+
+    async def _test_http(self, proxy_config: Dict, url: str, timeout: float) -> Dict:
+        """通过代理发起 HTTP 请求测试"""
+        protocol = proxy_config.get("protocol", "http")
+        host = proxy_config.get("host")
+        port = proxy_config.get("port")
+        username = proxy_config.get("username")
+        password = proxy_config.get("password")
+        if password:
+            password = decrypt_session(password)
+
+        if username and password:
+            proxy_url = f"{protocol}://{quote(str(username), safe='')}:{quote(str(password), safe='')}@{host}:{port}"
+        else:
+            proxy_url = f"{protocol}://{host}:{port}"
+
+        start = time.perf_counter()
+        session = await self._get_session()
+        async with session.get(
+            url,
+            proxy=proxy_url,
+            timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as response:
+            if response.status == 200:
+                return {
+                    "success": True,
+                    "response_time": (time.perf_counter() - start) * 1000,
+                    "status_code": response.status
+                }
+            return {"success": False, "error": f"HTTP {response.status}"}
+
+    async def test_proxy(self, proxy_config: Dict, timeout: int = 10, target: str = None) -> Dict:
         """
         测试代理连接
 
         Args:
             proxy_config: 代理配置
             timeout: 超时时间（秒）
+            target: 测试目标（默认 PROXY_TEST_TARGET），见模块顶部说明
 
         Returns:
             {
@@ -352,48 +665,31 @@ class ProxyManager:
                 "error": 错误信息
             }
         """
-        start_time = datetime.now()
+        target = target or PROXY_TEST_TARGET
 
         try:
-            # 构建代理URL
-            protocol = proxy_config.get("protocol", "http")
-            host = proxy_config.get("host")
-            port = proxy_config.get("port")
-            username = proxy_config.get("username")
-            password = proxy_config.get("password")
-            if password:
-                password = decrypt_session(password)
+            # aiohttp 只支持 HTTP 代理，SOCKS 代理改为测试 TCP 连通性
+            if not target.startswith("tcp") and proxy_config.get("protocol") in ("socks4", "socks5"):
+                target = "tcp"
 
-            if username and password:
-                proxy_url = f"{protocol}://{quote(str(username), safe='')}:{quote(str(password), safe='')}@{host}:{port}"
-            else:
-                proxy_url = f"{protocol}://{host}:{port}"
-
-            # 测试连接（访问Google）
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    "https://www.google.com",
-                    proxy=proxy_url,
-                    timeout=timeout
-                ) as response:
-                    if response.status == 200:
-                        elapsed = (datetime.now() - start_time).total_seconds() * 1000
-                        return {
-                            "success": True,
-                            "response_time": elapsed,
-                            "status_code": response.status
-                        }
+            if target.startswith("tcp"):
+                host, port = self._parse_tcp_target(target, proxy_config)
+                return await self._test_tcp(host, port, timeout)
 
-            return {"success": False, "error": f"HTTP {response.status}"}
+            return await self._test_http(proxy_config, target, timeout)
 
         except asyncio.TimeoutError:
             return {"success": False, "error": "连接超时"}
         except Exception as e:
             return {"success": False, "error": str(e)}
 
-    async def test_all_proxies(self) -> Dict:
+    async def test_all_proxies(self, concurrency: int = None, target: str = None) -> Dict:
         """
-        测试所有代理
+        并发测试所有代理
+
+        Args:
+            concurrency: 最大并发数（默认 PROXY_TEST_CONCURRENCY）
+            target: 测试目标（默认 PROXY_TEST_TARGET）
 
         Returns:
             {
@@ -403,43 +699,69 @@ class ProxyManager:
         """
         results = {"global": None, "proxies": {}}
 
-        # 测试全局代理
+        items = list(self.proxies.items())
         if self.global_proxy:
-            results["global"] = await self.test_proxy(self.global_proxy)
-            self._update_proxy_stats("global", results["global"])
-
-        # 测试独立代理
-        for proxy_id, proxy_config in self.proxies.items():
-            result = await self.test_proxy(proxy_config)
-            results["proxies"][proxy_id] = result
+            items.append(("global", self.global_proxy))
+
+        outcomes = await gather_bounded(
+            items,
+            lambda item: self.test_proxy(item[1], target=target),
+            concurrency=concurrency or PROXY_TEST_CONCURRENCY
+        )
+
+        for (proxy_id, _), result in zip(items, outcomes):
+            if isinstance(result, Exception):
+                result = {"success": False, "error": str(result)}
+            if proxy_id == "global":
+                results["global"] = result
+            else:
+                results["proxies"][proxy_id] = result
             self._update_proxy_stats(proxy_id, result)
 
         self._save_proxies()
         return results
 
+    @staticmethod
+    def _new_stats() -> Dict:
+        return {
+            "success_count": 0,
+            "fail_count": 0,
+            "avg_response_time": 0,  # 延迟 EWMA(ms)
+            "success_rate": None,
+            "consecutive_failures": 0,
+            "in_flight": 0,
+            "last_test": None
+        }
+
     def _update_proxy_stats(self, proxy_id: str, test_result: Dict):
         """更新代理统计信息"""
         if proxy_id not in self.proxy_stats:
-            self.proxy_stats[proxy_id] = {
-                "success_count": 0,
-                "fail_count": 0,
-                "avg_response_time": 0,
-                "last_test": None
-            }
+            self.proxy_stats[proxy_id] = self._new_stats()
 
         stats = self.proxy_stats[proxy_id]
 
         if test_result.get("success"):
             stats["success_count"] += 1
-            # 更新平均响应时间
-            response_time = test_result.get("response_time", 0)
-            if stats["avg_response_time"] == 0:
-                stats["avg_response_time"] = response_time
-            else:
-                stats["avg_response_time"] = (stats["avg_response_time"] + response_time) / 2
+            stats["consecutive_failures"] = 0
+            # 更新延迟 EWMA
+            response_time = test_result.get("response_time")
+            if response_time is not None:
+                metrics.proxy_latency.observe(response_time, proxy=proxy_id)
+                if not stats["avg_response_time"]:
+                    stats["avg_response_time"] = response_time
+                else:
+                    stats["avg_response_time"] = (
+                        LATENCY_EWMA_ALPHA * response_time
+                        + (1 - LATENCY_EWMA_ALPHA) * stats["avg_response_time"]
+                    )
         else:
             stats["fail_count"] += 1
+            stats["consecutive_failures"] = stats.get("consecutive_failures", 0) + 1
+            stats["last_failure"] = time.time()
+            metrics.proxy_failures.inc(proxy=proxy_id)
 
+        total = stats["success_count"] + stats["fail_count"]
+        stats["success_rate"] = stats["success_count"] / total
         stats["last_test"] = datetime.now().isoformat()
 
 
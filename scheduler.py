@@ -7,17 +7,27 @@ import asyncio
 import json
 import os
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Callable
+from typing import Any, Dict, List, Optional, Callable, Set, Tuple
 from croniter import croniter
 
 # 导入管理模块
 from account_manager import account_manager
 from template_manager import template_manager
 from log_manager import log_manager
+from pagination import paginate
+import metrics
 
 
 ACCOUNTS_DIR = "./accounts"
 SCHEDULE_FILE = os.path.join(ACCOUNTS_DIR, "schedules.json")
+ALL_ACCOUNTS = "*"  # 账号索引中表示“全部账号”的键
+
+# 列表排序方式: {名称: (排序键, 是否倒序)}，排序键末尾带ID保证唯一
+SCHEDULE_SORTS = {
+    "created_at": (lambda s: (s.get("created_at") or "", s.get("id", "")), True),
+    "name": (lambda s: (s.get("name") or "", s.get("id", "")), False),
+    "next_run": (lambda s: (s.get("next_run") or "", s.get("id", "")), False),
+}
 
 
 class TaskScheduler:
@@ -25,7 +35,9 @@ class TaskScheduler:
 
     def __init__(self):
         self.schedules: Dict[str, Dict] = {}
+        self._account_index: Dict[str, Set[str]] = {}  # 账号索引 {account_id: {schedule_id}}
         self.running = False
+        self._listeners: List[Callable[[Dict], Any]] = []
         self._load_schedules()
 
         # 主任务执行器 - 引用 main.py 中的发送功能
@@ -40,6 +52,30 @@ class TaskScheduler:
                     self.schedules = data.get("schedules", {})
             except:
                 self.schedules = {}
+        self._rebuild_index()
+
+    @staticmethod
+    def _schedule_accounts(schedule: Dict) -> List[str]:
+        """任务涉及的账号，未指定时为全部账号"""
+        return schedule.get("accounts") or schedule.get("account_ids") or [ALL_ACCOUNTS]
+
+    def _rebuild_index(self):
+        """重建账号索引"""
+        self._account_index = {}
+        for schedule_id, schedule in self.schedules.items():
+            self._index_add(schedule_id, schedule)
+
+    def _index_add(self, schedule_id: str, schedule: Dict):
+        for account_id in self._schedule_accounts(schedule):
+            self._account_index.setdefault(account_id, set()).add(schedule_id)
+
+    def _index_remove(self, schedule_id: str, schedule: Dict):
+        for account_id in self._schedule_accounts(schedule):
+            ids = self._account_index.get(account_id)
+            if ids:
+                ids.discard(schedule_id)
+                if not ids:
+                    del self._account_index[account_id]
 
     def _save_schedules(self):
         """保存定时任务配置"""
@@ -50,6 +86,29 @@ class TaskScheduler:
                 "updated_at": datetime.now().isoformat()
             }, f, ensure_ascii=False, indent=2)
 
+    def add_listener(self, callback: Callable[[Dict], Any]):
+        """注册调度事件监听器（如 WebSocket 推送）"""
+        self._listeners.append(callback)
+
+    def _notify(self, event_type: str, schedule_id: str, **data):
+        """
+        通知所有监听器
+
+        事件类型: schedule_added, schedule_removed, schedule_toggled,
+        schedule_started, schedule_finished, schedule_ready（AI 任务就绪）
+        """
+        event = {
+            "type": event_type,
+            "timestamp": datetime.now().isoformat(),
+            "schedule_id": schedule_id,
+            **data
+        }
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                print(f"调度事件推送失败: {e}")
+
     def set_send_message_function(self, func: Callable):
         """设置发送消息函数（从 main.py 导入）"""
         self._send_message_func = func
@@ -102,6 +161,9 @@ class TaskScheduler:
         # 统一账号列表参数（兼容 account_ids 和 accounts）
         accounts_list = account_ids or accounts
 
+        if schedule_id in self.schedules:
+            self._index_remove(schedule_id, self.schedules[schedule_id])
+
         self.schedules[schedule_id] = {
             "id": schedule_id,
             "schedule_id": schedule_id,  # 前端使用的字段名
@@ -129,8 +191,10 @@ class TaskScheduler:
             "auto_dedup": auto_dedup,
             "validate_usernames": validate_usernames
         }
+        self._index_add(schedule_id, self.schedules[schedule_id])
 
         self._save_schedules()
+        self._notify("schedule_added", schedule_id, name=name)
         return True
 
     def _get_next_run(self, cron: str) -> str:
@@ -144,8 +208,9 @@ class TaskScheduler:
     def remove_schedule(self, schedule_id: str) -> bool:
         """删除定时任务"""
         if schedule_id in self.schedules:
-            del self.schedules[schedule_id]
+            self._index_remove(schedule_id, self.schedules.pop(schedule_id))
             self._save_schedules()
+            self._notify("schedule_removed", schedule_id)
             return True
         return False
 
@@ -165,26 +230,75 @@ class TaskScheduler:
         if schedule_id in self.schedules:
             self.schedules[schedule_id]["enabled"] = not self.schedules[schedule_id]["enabled"]
             self._save_schedules()
+            self._notify("schedule_toggled", schedule_id, enabled=self.schedules[schedule_id]["enabled"])
             return True
         return False
 
     def list_schedules(self) -> List[Dict]:
         """列出所有任务"""
-        schedules = []
-        for s in self.schedules.values():
-            # 确保所有前端需要的字段都存在
-            schedule = dict(s)
-            # 确保 schedule_id 字段存在
-            if "schedule_id" not in schedule and "id" in schedule:
-                schedule["schedule_id"] = schedule["id"]
-            # 确保 lastRun 字段存在
-            if "lastRun" not in schedule and "last_run" in schedule:
-                schedule["lastRun"] = schedule["last_run"]
-            # 确保 account_ids 字段存在
-            if "account_ids" not in schedule and "accounts" in schedule:
-                schedule["account_ids"] = schedule["accounts"]
-            schedules.append(schedule)
-        return schedules
+        return [self._public(s) for s in self.schedules.values()]
+
+    @staticmethod
+    def _public(s: Dict) -> Dict:
+        """返回给调用方的副本（确保所有前端需要的字段都存在）"""
+        schedule = dict(s)
+        # 确保 schedule_id 字段存在
+        if "schedule_id" not in schedule and "id" in schedule:
+            schedule["schedule_id"] = schedule["id"]
+        # 确保 lastRun 字段存在
+        if "lastRun" not in schedule and "last_run" in schedule:
+            schedule["lastRun"] = schedule["last_run"]
+        # 确保 account_ids 字段存在
+        if "account_ids" not in schedule and "accounts" in schedule:
+            schedule["account_ids"] = schedule["accounts"]
+        return schedule
+
+    def query_schedules(
+        self,
+        limit: int,
+        cursor: str = None,
+        account_id: str = None,
+        enabled: bool = None,
+        repeat: str = None,
+        action: str = None,
+        sort: str = "created_at"
+    ) -> Tuple[List[Dict], Optional[str], int]:
+        """
+        分页查询定时任务（只复制本页的任务）
+
+        Args:
+            limit: 每页条数
+            cursor: 上一页返回的游标
+            account_id: 筛选涉及该账号的任务（包括未指定账号、对全部账号执行的任务）
+            enabled: 筛选启用状态
+            repeat: 筛选重复方式 (once, daily, weekly, workday)
+            action: 筛选执行动作
+            sort: 排序方式 (created_at, name, next_run)
+
+        Returns:
+            (本页任务, 下一页游标, 符合条件的总数)
+
+        Raises:
+            ValueError: 排序方式、游标或 limit 无效
+        """
+        if sort not in SCHEDULE_SORTS:
+            raise ValueError(f"不支持的排序方式: {sort}")
+        sort_key, descending = SCHEDULE_SORTS[sort]
+
+        if account_id:
+            ids = self._account_index.get(account_id, set()) | self._account_index.get(ALL_ACCOUNTS, set())
+            matched = [self.schedules[schedule_id] for schedule_id in ids]
+        else:
+            matched = list(self.schedules.values())
+        if enabled is not None:
+            matched = [s for s in matched if s.get("enabled", True) == enabled]
+        if repeat:
+            matched = [s for s in matched if s.get("repeat") == repeat]
+        if action:
+            matched = [s for s in matched if s.get("action") == action]
+
+        page, next_cursor = paginate(matched, sort_key, limit, cursor, descending)
+        return [self._public(s) for s in page], next_cursor, len(matched)
 
     def get_schedule(self, schedule_id: str) -> Optional[Dict]:
         """获取指定任务"""
@@ -255,6 +369,7 @@ class TaskScheduler:
                         # ai_execute 暂时和 send_message 一样（AI优化需要用户自己调用MCP）
                         await client.send_message(entity, message)
                         success_count += 1
+                        metrics.messages_sent.inc(source="scheduler")
                         
                         log_manager.add_log("定时任务", account_id, 
                             f"发送成功: {target_value}", "success")
@@ -265,6 +380,8 @@ class TaskScheduler:
                             
                     except Exception as e:
                         fail_count += 1
+                        metrics.message_failures.inc(source="scheduler")
+                        metrics.record_error("scheduler_send_message", e)
                         log_manager.add_log("定时任务", account_id, 
                             f"发送失败 {target_value}: {str(e)}", "error")
                 
@@ -295,10 +412,14 @@ class TaskScheduler:
                 schedule["fail_count"] = schedule.get("fail_count", 0) + 1
 
             self._save_schedules()
+            metrics.scheduler_runs.inc(result="success" if all(r.get("success") for r in results) else "failure")
+            self._notify("schedule_finished", schedule.get("id"), name=schedule.get("name"), results=results)
             return True
 
         except Exception as e:
             log_manager.add_log("定时任务", "system", f"执行任务 {schedule['name']} 失败: {str(e)}", "error")
+            metrics.scheduler_runs.inc(result="error")
+            self._notify("schedule_finished", schedule.get("id"), name=schedule.get("name"), error=str(e))
             return False
 
     async def start(self):
@@ -327,6 +448,7 @@ class TaskScheduler:
                     last_run = schedule.get("last_run")
                     
                     should_execute = False
+                    due_time = None  # 本次应执行的时间（用于统计调度延迟）
                     
                     if execute_time:
                         # 新格式：精确时间
@@ -341,6 +463,12 @@ class TaskScheduler:
                         
                         # 检查是否应该执行
                         time_diff = (now - target_time).total_seconds()
+                        due_time = target_time if repeat == "once" else now.replace(
+                            hour=execute_time.get("hour", 0),
+                            minute=execute_time.get("minute", 0),
+                            second=execute_time.get("second", 0),
+                            microsecond=0
+                        )
                         
                         if repeat == "once":
                             # 仅一次：到时间且未执行过
@@ -385,18 +513,23 @@ class TaskScheduler:
                         next_run = schedule.get("next_run", "")
                         if next_run:
                             next_time = datetime.fromisoformat(next_run)
+                            due_time = next_time
                             if 0 <= (now - next_time).total_seconds() < 30:
                                 should_execute = True
                     
                     if should_execute:
+                        if due_time:
+                            metrics.scheduler_lag.observe(max(0.0, (now - due_time).total_seconds()))
                         # AI执行类型的任务不自动执行，等待AI通过MCP处理
                         if schedule.get("action") == "ai_execute":
                             print(f"⏰ AI任务已就绪，等待AI润色: {schedule['name']}")
                             log_manager.add_log("定时任务", "system", f"AI任务就绪，等待润色: {schedule['name']}", "info")
+                            self._notify("schedule_ready", schedule_id, name=schedule["name"])
                             # 不执行，让AI通过get_pending_ai_tasks获取并润色后执行
                         else:
                             print(f"⏰ 执行定时任务: {schedule['name']}")
                             log_manager.add_log("定时任务", "system", f"开始执行: {schedule['name']}", "info")
+                            self._notify("schedule_started", schedule_id, name=schedule["name"])
                             await self._execute_schedule(schedule)
 
                 # 每10秒检查一次（更精确）
@@ -9,7 +9,8 @@ from pathlib import Path
 from typing import Optional
 
 from cryptography.fernet import Fernet, InvalidToken
-from fastapi import Header, HTTPException, Request, WebSocket, status
+from fastapi import Header, HTTPException, WebSocket, status
+from fastapi.requests import HTTPConnection
 
 SECRET_KEY_FILE = Path(os.getenv("TELEGRAM_MCP_SECRET_KEY_FILE", "~/.config/telegram-mcp/secret_key")).expanduser()
 ADMIN_TOKEN = os.getenv("TELEGRAM_MCP_ADMIN_TOKEN", "").strip()
@@ -92,10 +93,14 @@ def is_local_client(host: Optional[str]) -> bool:
 
 
 def require_admin_token(
-    request: Request,
+    request: HTTPConnection,
     authorization: Optional[str] = Header(default=None),
     x_admin_token: Optional[str] = Header(default=None),
 ):
+    # WebSocket 由 require_websocket_token 单独校验（支持 ?token= 参数）
+    if request.scope.get("type") == "websocket":
+        return True
+
     if not ADMIN_TOKEN:
         client_host = request.client.host if request.client else None
         if ALLOW_NO_AUTH_LOCALHOST and is_local_client(client_host):
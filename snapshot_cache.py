@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+快照缓存模块
+按数据版本缓存计算结果，版本不变时直接复用，并生成 ETag / Last-Modified
+"""
+import hashlib
+import os
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+# 每次启动生成的随机值：各管理器的版本号是进程内计数器，重启后从 0 开始，
+# ETag 带上它，重启前拿到的 ETag 就不会和重启后的不同数据误匹配
+BOOT_NONCE = os.urandom(8).hex()
+
+
+class SnapshotCache:
+    """
+    版本化快照缓存
+
+    调用方提供数据版本（由各管理器在数据变更时递增），ETag 由缓存键和版本计算，
+    不需要先生成快照；版本没变就直接返回上次的结果。
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[Hashable, Any, str, float]] = {}  # {key: (version, value, etag, built_at)}
+
+    @staticmethod
+    def make_etag(key: str, version: Hashable) -> str:
+        """根据缓存键、版本和本次启动的随机值生成 ETag"""
+        digest = hashlib.sha1(f"{BOOT_NONCE}:{key}:{version!r}".encode("utf-8")).hexdigest()[:20]
+        return f'W/"{digest}"'
+
+    def get(self, key: str, version: Hashable, builder: Callable[[], Any]) -> Tuple[Any, str, str]:
+        """
+        获取快照（版本变化时重新计算）
+
+        Args:
+            key: 缓存键
+            version: 数据版本
+            builder: 生成快照的函数
+
+        Returns:
+            (快照, ETag, Last-Modified)
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version:
+            entry = (version, builder(), self.make_etag(key, version), time.time())
+            self._entries[key] = entry
+        return entry[1], entry[2], formatdate(entry[3], usegmt=True)
+
+    def not_modified(
+        self,
+        key: str,
+        version: Hashable,
+        if_none_match: Optional[str],
+        if_modified_since: Optional[str]
+    ) -> bool:
+        """
+        判断条件请求是否可以返回 304（不生成快照）
+
+        Args:
+            key: 缓存键
+            version: 当前数据版本
+            if_none_match: 请求头 If-None-Match
+            if_modified_since: 请求头 If-Modified-Since
+
+        Returns:
+            客户端缓存是否仍然有效
+        """
+        if if_none_match:
+            etag = self.make_etag(key, version)
+            return any(tag.strip() in (etag, "*") for tag in if_none_match.split(","))
+
+        entry = self._entries.get(key)
+        if if_modified_since and entry and entry[0] == version:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            # HTTP 日期只精确到秒
+            return int(entry[3]) <= since
+
+        return False
+
+    def invalidate(self, key: str = None):
+        """清除缓存（key 为空时全部清除）"""
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
@@ -19,6 +19,7 @@ class StatsTracker:
 
     def __init__(self):
         self.stats: Dict = {}
+        self.version = 0  # 数据版本号，每次保存时递增（用于快照缓存）
         self._load_stats()
 
     def _load_stats(self):
@@ -29,6 +30,7 @@ class StatsTracker:
 
     def _save_stats(self):
         """保存统计数据"""
+        self.version += 1
         os.makedirs(ACCOUNTS_DIR, exist_ok=True)
         with open(STATS_FILE, 'w', encoding='utf-8') as f:
             json.dump(self.stats, f, ensure_ascii=False, indent=2)
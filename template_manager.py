@@ -6,19 +6,90 @@ AI 可以调用预设模板发送消息
 import json
 import os
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional, Set, Tuple
 import re
 
+from pagination import paginate
+
 
 ACCOUNTS_DIR = "./accounts"
 TEMPLATE_FILE = os.path.join(ACCOUNTS_DIR, "templates.json")
 
+# 变量语法: {name} 或带默认值的 {name|默认值}
+VAR_PATTERN = re.compile(r'\{(\w+)(?:\|([^{}]*))?\}')
+
+# 列表排序方式: {名称: (排序键, 是否倒序)}，排序键末尾带ID保证唯一
+TEMPLATE_SORTS = {
+    "use_count": (lambda t: (t.get("use_count", 0), t.get("id", "")), True),
+    "created_at": (lambda t: (t.get("created_at", ""), t.get("id", "")), True),
+    "name": (lambda t: (t.get("name", ""), t.get("id", "")), False),
+}
+
+
+class CompiledTemplate:
+    """
+    编译后的模板
+
+    模板内容只解析一次，拆成文本段和变量段；渲染时复制文本段列表、
+    填入变量值后 join，单次遍历即可完成，耗时与变量数和长度呈线性关系。
+    """
+
+    __slots__ = ("variables", "_parts", "_slots")
+
+    def __init__(self, content: str, variables: List[str] = None):
+        """
+        Args:
+            content: 模板内容
+            variables: 允许替换的变量，None 表示模板中出现的全部变量（空列表表示不替换任何变量）
+        """
+        allowed = set(variables) if variables is not None else None
+        parts: List[str] = []
+        slots: List[Tuple[int, str, str]] = []
+        found: Dict[str, None] = {}
+
+        pos = 0
+        for match in VAR_PATTERN.finditer(content):
+            name, default = match.group(1), match.group(2)
+            if allowed is not None and name not in allowed:
+                continue
+            if match.start() > pos:
+                parts.append(content[pos:match.start()])
+            slots.append((len(parts), name, default or ""))
+            parts.append("")
+            found[name] = None
+            pos = match.end()
+        if pos < len(content):
+            parts.append(content[pos:])
+
+        self.variables: List[str] = list(found)
+        self._parts = parts
+        self._slots = slots
+
+    def render(self, values: Dict[str, Any]) -> str:
+        """渲染单条（缺失的变量使用默认值）"""
+        parts = self._parts[:]
+        for index, name, default in self._slots:
+            value = values.get(name)
+            parts[index] = default if value is None else str(value)
+        return "".join(parts)
+
+    def render_many(self, values_list: List[Dict[str, Any]]) -> List[str]:
+        """批量渲染"""
+        return [self.render(values) for values in values_list]
+
+
+def extract_variables(content: str) -> List[str]:
+    """提取模板中的变量名（去重，保持出现顺序）"""
+    return CompiledTemplate(content).variables
+
 
 class TemplateManager:
     """消息模板管理器"""
 
     def __init__(self):
         self.templates: Dict[str, Dict] = {}
+        self._compiled: Dict[str, Tuple[int, CompiledTemplate]] = {}  # 编译缓存 {template_id: (version, compiled)}
+        self._category_index: Dict[str, Set[str]] = {}  # 分类索引 {category: {template_id}}
         self._load_templates()
 
     def _load_templates(self):
@@ -30,6 +101,32 @@ class TemplateManager:
                     self.templates = data.get("templates", {})
             except:
                 self.templates = {}
+        self._compiled = {}
+        self._category_index = {}
+        for template_id, template in self.templates.items():
+            self._index_add(template_id, template.get("category"))
+
+    def _index_add(self, template_id: str, category: str):
+        self._category_index.setdefault(category, set()).add(template_id)
+
+    def _index_remove(self, template_id: str, category: str):
+        ids = self._category_index.get(category)
+        if ids:
+            ids.discard(template_id)
+            if not ids:
+                del self._category_index[category]
+
+    def _compile(self, template: Dict) -> CompiledTemplate:
+        """获取模板的编译结果（按版本缓存）"""
+        template_id = template["id"]
+        version = template.get("version", 0)
+        cached = self._compiled.get(template_id)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        compiled = CompiledTemplate(template["content"], template.get("variables"))
+        self._compiled[template_id] = (version, compiled)
+        return compiled
 
     def _save_templates(self):
         """保存模板"""
@@ -61,9 +158,17 @@ class TemplateManager:
         Returns:
             是否成功
         """
-        # 自动提取变量 {name}, {time} 等
+        # 编译一次，同时自动提取变量 {name}, {time} 等
+        compiled = CompiledTemplate(content, variables)
         if variables is None:
-            variables = re.findall(r'\{(\w+)\}', content)
+            variables = compiled.variables
+
+        old = self.templates.get(template_id)
+        version = (old or {}).get("version", 0) + 1
+        self._compiled[template_id] = (version, compiled)
+        if old:
+            self._index_remove(template_id, old.get("category"))
+        self._index_add(template_id, category)
 
         self.templates[template_id] = {
             "id": template_id,
@@ -73,7 +178,8 @@ class TemplateManager:
             "category": category,
             "variables": variables,
             "created_at": datetime.now().isoformat(),
-            "use_count": 0
+            "use_count": 0,
+            "version": version
         }
 
         self._save_templates()
@@ -98,22 +204,67 @@ class TemplateManager:
         Returns:
             模板列表
         """
-        templates = []
-        for t in self.templates.values():
-            # 确保 template_id 字段存在（兼容旧数据）
-            template = dict(t)
-            if "template_id" not in template and "id" in template:
-                template["template_id"] = template["id"]
-            templates.append(template)
-
         if category:
-            templates = [t for t in templates if t.get("category") == category]
+            source = (self.templates[template_id] for template_id in self._category_index.get(category, ()))
+        else:
+            source = self.templates.values()
 
         # 按使用次数排序
+        templates = [self._public(t) for t in source]
         templates.sort(key=lambda x: x.get("use_count", 0), reverse=True)
 
         return templates
 
+    @staticmethod
+    def _public(template: Dict) -> Dict:
+        """返回给调用方的副本（确保 template_id 字段存在，兼容旧数据）"""
+        template = dict(template)
+        if "template_id" not in template and "id" in template:
+            template["template_id"] = template["id"]
+        return template
+
+    def query_templates(
+        self,
+        limit: int,
+        cursor: str = None,
+        category: str = None,
+        keyword: str = None,
+        sort: str = "use_count"
+    ) -> Tuple[List[Dict], Optional[str], int]:
+        """
+        分页查询模板（只复制本页的模板）
+
+        Args:
+            limit: 每页条数
+            cursor: 上一页返回的游标
+            category: 筛选分类
+            keyword: 名称或内容包含的关键词
+            sort: 排序方式 (use_count, created_at, name)
+
+        Returns:
+            (本页模板, 下一页游标, 符合条件的总数)
+
+        Raises:
+            ValueError: 排序方式、游标或 limit 无效
+        """
+        if sort not in TEMPLATE_SORTS:
+            raise ValueError(f"不支持的排序方式: {sort}")
+        sort_key, descending = TEMPLATE_SORTS[sort]
+
+        if category:
+            matched = [self.templates[template_id] for template_id in self._category_index.get(category, ())]
+        else:
+            matched = list(self.templates.values())
+        if keyword:
+            keyword_lower = keyword.lower()
+            matched = [
+                t for t in matched
+                if keyword_lower in t.get("name", "").lower() or keyword_lower in t.get("content", "").lower()
+            ]
+
+        page, next_cursor = paginate(matched, sort_key, limit, cursor, descending)
+        return [self._public(t) for t in page], next_cursor, len(matched)
+
     def delete_template(self, template_id: str) -> bool:
         """
         删除模板
@@ -125,7 +276,9 @@ class TemplateManager:
             是否成功
         """
         if template_id in self.templates:
+            self._index_remove(template_id, self.templates[template_id].get("category"))
             del self.templates[template_id]
+            self._compiled.pop(template_id, None)
             self._save_templates()
             return True
         return False
@@ -141,17 +294,11 @@ class TemplateManager:
         Returns:
             渲染后的内容
         """
-        template = self.get_template(template_id)
+        template = self.templates.get(template_id)
         if not template:
             return None
 
-        content = template["content"]
-
-        # 替换变量
-        for var in template.get("variables", []):
-            placeholder = "{" + var + "}"
-            value = kwargs.get(var, "")
-            content = content.replace(placeholder, str(value))
+        content = self._compile(template).render(kwargs)
 
         # 更新使用次数
         template["use_count"] = template.get("use_count", 0) + 1
@@ -160,6 +307,31 @@ class TemplateManager:
 
         return content
 
+    def render_batch(self, template_id: str, vars_list: List[Dict]) -> Optional[List[str]]:
+        """
+        批量渲染模板（使用编译缓存，使用次数只保存一次）
+
+        Args:
+            template_id: 模板ID
+            vars_list: 每条消息的变量值列表
+
+        Returns:
+            与 vars_list 顺序一致的渲染结果，模板不存在返回 None
+        """
+        template = self.templates.get(template_id)
+        if not template:
+            return None
+
+        rendered = self._compile(template).render_many(vars_list)
+
+        # 更新使用次数（只写一次文件）
+        if vars_list:
+            template["use_count"] = template.get("use_count", 0) + len(vars_list)
+            template["last_used"] = datetime.now().isoformat()
+            self._save_templates()
+
+        return rendered
+
     def update_template(
         self,
         template_id: str,
@@ -188,10 +360,15 @@ class TemplateManager:
             template["name"] = name
         if content:
             template["content"] = content
-            # 重新提取变量
-            template["variables"] = re.findall(r'\{(\w+)\}', content)
+            # 重新编译并提取变量
+            compiled = CompiledTemplate(content)
+            template["variables"] = compiled.variables
+            template["version"] = template.get("version", 0) + 1
+            self._compiled[template_id] = (template["version"], compiled)
         if category:
+            self._index_remove(template_id, template.get("category"))
             template["category"] = category
+            self._index_add(template_id, category)
 
         template["updated_at"] = datetime.now().isoformat()
         self._save_templates()
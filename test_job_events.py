@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""测试后台任务事件能通过 WebSocket 推送给订阅者（不需要 Telegram 账号）"""
+import asyncio
+import sys
+
+from dashboard import manager
+from job_manager import JOB_CANCELLED, JOB_COMPLETED, JOB_FAILED, job_manager
+
+
+async def test():
+    print("🧪 测试任务事件推送...\n")
+
+    # 模拟一个订阅了 jobs 主题的连接，只检查进入发送队列的消息
+    websocket = object()
+    queue = asyncio.Queue()
+    manager._queues[websocket] = queue
+    manager._subscriptions[websocket] = {"jobs"}
+
+    async def work(progress_callback):
+        progress_callback(1, 1, {"ok": True})
+        return {"done": 1}
+
+    try:
+        job_id = job_manager.submit("test_job", work)
+        while job_manager.jobs[job_id]["status"] not in (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED):
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0)
+    finally:
+        manager._queues.pop(websocket, None)
+        manager._subscriptions.pop(websocket, None)
+
+    events = []
+    while not queue.empty():
+        events.append(queue.get_nowait())
+    types = [event["type"] for event in events]
+
+    passed = (
+        bool(events)
+        and types[0] == "job_created"
+        and types[-1] == "job_finished"
+        and "job_progress" in types
+        and all(event["job"]["job_id"] == job_id for event in events)
+    )
+    print(f"{'✅' if passed else '❌'} 收到事件: {types}")
+    return passed
+
+
+if __name__ == "__main__":
+    result = asyncio.run(test())
+    sys.exit(0 if result else 1)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""测试后台任务的并发上限、取消和清理（不需要 Telegram 账号）"""
+import asyncio
+import sys
+
+import job_manager as job_module
+from job_manager import JOB_CANCELLED, JOB_COMPLETED, JOB_PENDING, JOB_RUNNING, JobManager
+
+
+async def wait_until(predicate, timeout: float = 2.0) -> bool:
+    """等待条件成立，超时返回 False"""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+
+async def test():
+    print("🧪 测试后台任务管理...\n")
+    tests = []
+
+    def check(name: str, ok: bool):
+        print(f"  {'✅' if ok else '❌'} {name}")
+        tests.append(ok)
+
+    release = asyncio.Event()
+
+    async def blocking(progress_callback):
+        await release.wait()
+        return {"ok": True}
+
+    async def instant(progress_callback):
+        return {"ok": True}
+
+    # 1. 并发上限：max_running=1 时第二个任务排队
+    print("【1】并发上限")
+    manager = JobManager(max_running=1)
+    first = manager.submit("blocking", blocking)
+    second = manager.submit("blocking", blocking)
+    third = manager.submit("blocking", blocking)
+    await wait_until(lambda: manager.jobs[first]["status"] == JOB_RUNNING)
+    await asyncio.sleep(0.05)
+    check("第一个任务执行中", manager.jobs[first]["status"] == JOB_RUNNING)
+    check("其余任务排队等待", manager.jobs[second]["status"] == JOB_PENDING)
+
+    # 2. 取消排队中的任务：直接结束，不影响正在执行的任务
+    print("\n【2】取消排队中的任务")
+    check("取消成功", manager.cancel_job(second))
+    await wait_until(lambda: manager.jobs[second]["status"] == JOB_CANCELLED)
+    check("状态为 cancelled", manager.jobs[second]["status"] == JOB_CANCELLED)
+    check("记录结束时间", manager.jobs[second]["finished_at"] is not None)
+    check("从未开始执行", manager.jobs[second]["started_at"] is None)
+    check("执行中的任务不受影响", manager.jobs[first]["status"] == JOB_RUNNING)
+
+    # 提交后立即取消（任务协程还没开始运行）
+    queued = manager.submit("blocking", blocking)
+    check("立即取消成功", manager.cancel_job(queued))
+    await wait_until(lambda: manager.jobs[queued]["status"] == JOB_CANCELLED)
+    check("未开始的任务也记为 cancelled", manager.jobs[queued]["status"] == JOB_CANCELLED)
+
+    # 3. 取消执行中的任务：释放名额，排队的任务接着执行
+    print("\n【3】取消执行中的任务")
+    check("取消成功", manager.cancel_job(first))
+    await wait_until(lambda: manager.jobs[first]["status"] == JOB_CANCELLED)
+    check("状态为 cancelled", manager.jobs[first]["status"] == JOB_CANCELLED)
+    await wait_until(lambda: manager.jobs[third]["status"] == JOB_RUNNING)
+    check("排队的任务获得名额", manager.jobs[third]["status"] == JOB_RUNNING)
+    release.set()
+    await wait_until(lambda: manager.jobs[third]["status"] == JOB_COMPLETED)
+    check("排队的任务正常完成", manager.jobs[third]["status"] == JOB_COMPLETED)
+    check("已结束的任务不能再取消", not manager.cancel_job(third))
+    check("不存在的任务不能取消", not manager.cancel_job("missing"))
+
+    # 4. 超过 MAX_JOBS 时只清理已结束的任务（最早的先清理）
+    print("\n【4】任务记录清理")
+    original_max_jobs = job_module.MAX_JOBS
+    job_module.MAX_JOBS = 4
+    try:
+        release.clear()
+        manager = JobManager(max_running=1)
+        running = manager.submit("blocking", blocking)
+        pending = manager.submit("blocking", blocking)
+        await wait_until(lambda: manager.jobs[running]["status"] == JOB_RUNNING)
+        # instant 任务排在 running 后面，提交时都还没结束
+        finished = [manager.submit("instant", instant) for _ in range(4)]
+        check("没有已结束的任务时超过上限也不清理", len(manager.jobs) == 6)
+        release.set()
+        await wait_until(lambda: all(job["status"] == JOB_COMPLETED for job in manager.jobs.values()))
+        release.clear()
+        manager.submit("blocking", blocking)
+        check("总数回到上限", len(manager.jobs) == job_module.MAX_JOBS)
+        check("最早结束的任务被清理", running not in manager.jobs and pending not in manager.jobs)
+        check("较新的任务保留", finished[-1] in manager.jobs)
+
+        manager = JobManager(max_running=1)
+        active = [manager.submit("blocking", blocking) for _ in range(job_module.MAX_JOBS + 2)]
+        await asyncio.sleep(0.05)
+        check("未结束的任务不会被清理", all(job_id in manager.jobs for job_id in active))
+        release.set()
+        await wait_until(lambda: all(job["status"] == JOB_COMPLETED for job in manager.jobs.values()))
+    finally:
+        job_module.MAX_JOBS = original_max_jobs
+        release.set()
+
+    passed = sum(tests)
+    print(f"\n测试结果: {passed}/{len(tests)} 通过")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    result = asyncio.run(test())
+    sys.exit(0 if result else 1)
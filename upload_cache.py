@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+上传复用缓存模块
+按 账号 + 文件内容 SHA-256 + 发送方式 缓存已上传媒体的引用（InputPhoto / InputDocument），
+同一个文件再次发送时直接引用 Telegram 上已有的媒体，不再重新上传。
+
+媒体引用里的 file_reference 会过期，过期时重新获取当初发送的那条消息拿到新的引用；
+那条消息已不存在时丢弃缓存，重新上传。
+"""
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from telethon.errors import BadRequestError
+from telethon.tl.types import (
+    Document, InputDocument, InputPhoto, MessageMediaDocument, MessageMediaPhoto, Photo,
+)
+
+
+UPLOAD_CACHE_FILE = os.path.join("./accounts", "upload_cache.json")
+
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class UploadCache:
+    """已上传媒体的引用缓存"""
+
+    def __init__(self, path: str = UPLOAD_CACHE_FILE):
+        """
+        Args:
+            path: 缓存文件路径
+        """
+        self.path = path
+        self._entries: Optional[Dict[str, Dict[str, Dict[str, Any]]]] = None  # {账号: {kind:sha256: 引用}}
+        self._hashes: Dict[str, Tuple[int, int, str]] = {}  # {路径: (大小, 修改时间, sha256)}
+
+    @property
+    def entries(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        if self._entries is None:
+            self._entries = {}
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        self._entries = json.load(f)
+                except (OSError, ValueError):
+                    self._entries = {}
+        return self._entries
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    async def file_hash(self, file_path: str) -> str:
+        """文件内容的 SHA-256（文件大小和修改时间不变时复用上次的结果）"""
+        stat = os.stat(file_path)
+        cached = self._hashes.get(file_path)
+        if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            return cached[2]
+        # 大文件哈希耗时较长，放到线程里，避免阻塞事件循环
+        sha256 = await asyncio.to_thread(_sha256_file, file_path)
+        self._hashes[file_path] = (stat.st_size, stat.st_mtime_ns, sha256)
+        return sha256
+
+    @staticmethod
+    async def _account(client) -> str:
+        return str(await client.get_peer_id("me"))
+
+    @staticmethod
+    def _to_input(entry: Dict[str, Any]):
+        cls = InputPhoto if entry["type"] == "photo" else InputDocument
+        return cls(
+            id=entry["id"],
+            access_hash=entry["access_hash"],
+            file_reference=bytes.fromhex(entry["file_reference"])
+        )
+
+    async def get(self, client, file_path: str, kind: str):
+        """
+        查找已上传的媒体
+
+        Args:
+            client: Telegram Client
+            file_path: 本地文件路径
+            kind: 发送方式（photo、video、document、sticker、gif 等，同一文件不同方式分别缓存）
+
+        Returns:
+            InputPhoto / InputDocument，未缓存时为 None
+        """
+        key = f"{kind}:{await self.file_hash(file_path)}"
+        entry = self.entries.get(await self._account(client), {}).get(key)
+        return self._to_input(entry) if entry else None
+
+    async def put(self, client, file_path: str, kind: str, message) -> bool:
+        """
+        记录刚发送的消息中的媒体
+
+        Args:
+            client: Telegram Client
+            file_path: 本地文件路径
+            kind: 发送方式
+            message: 发送后返回的消息
+
+        Returns:
+            消息是否包含可缓存的媒体
+        """
+        media = getattr(message, "media", None)
+        if isinstance(media, MessageMediaPhoto):
+            media = media.photo
+        elif isinstance(media, MessageMediaDocument):
+            media = media.document
+        if not isinstance(media, (Photo, Document)):
+            return False
+
+        key = f"{kind}:{await self.file_hash(file_path)}"
+        self.entries.setdefault(await self._account(client), {})[key] = {
+            "type": "photo" if isinstance(media, Photo) else "document",
+            "id": media.id,
+            "access_hash": media.access_hash,
+            "file_reference": media.file_reference.hex(),
+            "peer_id": message.chat_id,
+            "message_id": message.id,
+            "cached_at": datetime.now().isoformat()
+        }
+        self._save()
+        return True
+
+    async def refresh(self, client, file_path: str, kind: str):
+        """
+        文件引用过期时重新获取
+
+        Returns:
+            新的 InputPhoto / InputDocument；原消息已不存在时删除缓存并返回 None，
+            网络等临时错误时保留缓存并返回 None（本次重新上传）
+        """
+        account = await self._account(client)
+        key = f"{kind}:{await self.file_hash(file_path)}"
+        entry = self.entries.get(account, {}).get(key)
+        if not entry:
+            return None
+
+        try:
+            message = await client.get_messages(entry["peer_id"], ids=entry["message_id"])
+        except (BadRequestError, ValueError):
+            # 聊天已无法访问（被移出、已删除等），原消息视为不存在
+            message = None
+        except Exception:
+            return None
+        if not message or not await self.put(client, file_path, kind, message):
+            del self.entries[account][key]
+            self._save()
+            return None
+        return self._to_input(self.entries[account][key])
+
+
+# 全局实例
+upload_cache = UploadCache()